@@ -0,0 +1,328 @@
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+# Append-only activity log with per-day and per-week rollups.
+# Every login, Quran page read or memorized, quiz result and lesson completion becomes one
+# compact activity_events row (integer kind, unix seconds, a reference id and a value), written
+# in the transaction of the change it records: the job handlers log a whole batch with one
+# executemany. Nothing reads the raw log for a page. compact() folds the events past the
+# activity_rollup watermark into
+#   activity_daily  (user_id, day, kind)  -> events, value_sum
+#   activity_weekly (user_id, week, kind) -> events, value_sum, active_days
+# in one IMMEDIATE transaction, so every worker process can run it; the job workers do every
+# ACTIVITY_COMPACT_INTERVAL. Streaks, per-day reading counts and heatmaps read a few hundred
+# rollup rows per student plus the handful of events not compacted yet.
+# Raw events older than ACTIVITY_RETENTION_DAYS are deleted once compacted, after being
+# appended to a gzipped JSON-lines file per month under ACTIVITY_ARCHIVE_DIR when it is set.
+
+ACTIVITY_COMPACT_INTERVAL = float(os.environ.get('ACTIVITY_COMPACT_INTERVAL', '30'))
+ACTIVITY_RETENTION_DAYS = int(os.environ.get('ACTIVITY_RETENTION_DAYS', '90'))
+ACTIVITY_ARCHIVE_DIR = os.environ.get('ACTIVITY_ARCHIVE_DIR', '')
+ACTIVITY_ARCHIVE_INTERVAL = 3600.0
+ACTIVITY_HEATMAP_DAYS = 182
+ACTIVITY_MAX_DAYS = 366
+# Events folded or archived per statement
+ACTIVITY_CHUNK = 20000
+
+# Stored as integers; the names are what the API shows
+KINDS = {'login': 1, 'page_read': 2, 'page_memorized': 3, 'quiz': 4, 'lesson': 5}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+
+ACTIVITY_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS activity_events (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        kind INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        ref INTEGER,
+        value INTEGER
+    )
+    ''',
+    # Retention walks the log by age; everything else reads it by id
+    'CREATE INDEX IF NOT EXISTS idx_activity_events_ts ON activity_events (ts)',
+    '''
+    CREATE TABLE IF NOT EXISTS activity_daily (
+        user_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        kind INTEGER NOT NULL,
+        events INTEGER NOT NULL,
+        value_sum INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day, kind)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS activity_weekly (
+        user_id INTEGER NOT NULL,
+        week TEXT NOT NULL,
+        kind INTEGER NOT NULL,
+        events INTEGER NOT NULL,
+        value_sum INTEGER NOT NULL,
+        active_days INTEGER NOT NULL,
+        PRIMARY KEY (user_id, week, kind)
+    ) WITHOUT ROWID
+    ''',
+    # Last event id folded into the rollups
+    '''
+    CREATE TABLE IF NOT EXISTS activity_rollup (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_event_id INTEGER NOT NULL
+    )
+    ''',
+    'INSERT OR IGNORE INTO activity_rollup (id, last_event_id) VALUES (1, 0)',
+]
+
+
+def backfill_rollups(cursor):
+    # History from before the log, split like the live logging: the score-100 row that
+    # mark_lesson_completed inserts for a lesson not taken yet is a 'lesson', every other
+    # student_progress row a 'quiz' with its score, and a page counts once on the day it was
+    # last read. Days are local, like the log's. Before the log completed_at was only ever set
+    # by its CURRENT_TIMESTAMP default, so it is UTC; last_read is written by the app on every
+    # read, so it is taken as local (a page read just once kept the UTC default).
+    cursor.execute('''
+        INSERT OR IGNORE INTO activity_daily (user_id, day, kind, events, value_sum)
+        SELECT user_id, day, CASE WHEN completion THEN :lesson ELSE :quiz END AS kind,
+               COUNT(*), COALESCE(SUM(CASE WHEN completion THEN NULL ELSE quiz_score END), 0)
+        FROM (SELECT student_id AS user_id, date(completed_at, 'localtime') AS day, quiz_score,
+                     quiz_score = 100 AND id = (SELECT MIN(f.id) FROM student_progress f
+                                                WHERE f.student_id = p.student_id
+                                                  AND f.lesson_id = p.lesson_id) AS completion
+              FROM student_progress p WHERE student_id IS NOT NULL AND completed_at IS NOT NULL)
+        GROUP BY user_id, day, kind
+    ''', {'lesson': KINDS['lesson'], 'quiz': KINDS['quiz']})
+    cursor.execute('''
+        INSERT OR IGNORE INTO activity_daily (user_id, day, kind, events, value_sum)
+        SELECT student_id, date(last_read), :page_read, COUNT(*), 0
+        FROM quran_progress WHERE student_id IS NOT NULL AND last_read IS NOT NULL AND read_count > 0
+        GROUP BY student_id, date(last_read)
+    ''', {'page_read': KINDS['page_read']})
+    _refresh_weeks(cursor, 'SELECT DISTINCT user_id, day FROM activity_daily')
+
+
+# Writing
+
+def event(user_id, kind, ref=None, value=None, ts=None):
+    # ts is a naive local datetime (as the progress events carry) or unix seconds
+    if isinstance(ts, datetime):
+        ts = ts.timestamp()
+    return (user_id, KINDS[kind], int(time.time() if ts is None else ts), ref, value)
+
+
+def log_events(cursor, events):
+    # Part of the caller's transaction, one executemany per batch
+    cursor.executemany('INSERT INTO activity_events (user_id, kind, ts, ref, value) VALUES (?, ?, ?, ?, ?)',
+                       events)
+
+
+def log_event(cursor, user_id, kind, ref=None, value=None, ts=None):
+    log_events(cursor, [event(user_id, kind, ref, value, ts)])
+
+
+# Compaction
+
+def _refresh_weeks(cursor, touched_days):
+    # Weekly rows are recomputed from the (at most seven) daily rows of every touched week
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO activity_weekly (user_id, week, kind, events, value_sum, active_days)
+        SELECT d.user_id, strftime('%Y-%W', d.day), d.kind, SUM(d.events), SUM(d.value_sum), COUNT(*)
+        FROM activity_daily d
+        JOIN (SELECT DISTINCT user_id, strftime('%Y-%W', day) AS week FROM ({touched_days})) t
+          ON t.user_id = d.user_id AND t.week = strftime('%Y-%W', d.day)
+        GROUP BY d.user_id, strftime('%Y-%W', d.day), d.kind
+    ''')
+
+
+def compact_once(cursor, limit=ACTIVITY_CHUNK):
+    # Folds up to limit events past the watermark; returns how many
+    cursor.execute('SELECT last_event_id FROM activity_rollup WHERE id = 1')
+    last_id = cursor.fetchone()[0]
+    cursor.execute('SELECT MAX(id) FROM (SELECT id FROM activity_events WHERE id > ? ORDER BY id LIMIT ?)',
+                   (last_id, limit))
+    upto = cursor.fetchone()[0]
+    if upto is None:
+        return 0
+
+    cursor.execute('''
+        CREATE TEMP TABLE activity_batch AS
+        SELECT user_id, date(ts, 'unixepoch', 'localtime') AS day, kind,
+               COUNT(*) AS events, COALESCE(SUM(value), 0) AS value_sum
+        FROM activity_events WHERE id > ? AND id <= ?
+        GROUP BY user_id, day, kind
+    ''', (last_id, upto))
+    cursor.execute('''
+        INSERT INTO activity_daily (user_id, day, kind, events, value_sum)
+        SELECT user_id, day, kind, events, value_sum FROM activity_batch WHERE true
+        ON CONFLICT (user_id, day, kind) DO UPDATE SET
+            events = events + excluded.events,
+            value_sum = value_sum + excluded.value_sum
+    ''')
+    _refresh_weeks(cursor, 'SELECT user_id, day FROM activity_batch')
+    cursor.execute('SELECT COALESCE(SUM(events), 0) FROM activity_batch')
+    folded = cursor.fetchone()[0]
+    cursor.execute('DROP TABLE activity_batch')
+    cursor.execute('UPDATE activity_rollup SET last_event_id = ? WHERE id = 1', (upto,))
+    return folded
+
+
+def compact(conn):
+    # One IMMEDIATE transaction per chunk: two processes never fold the same events
+    total = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            folded = compact_once(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += folded
+        if folded < ACTIVITY_CHUNK:
+            return total
+
+
+def rebuild_rollups(cursor):
+    # Recompute the rollups of the days still covered by the log; older days were archived
+    # away and only survive in their rollups, which are kept
+    cursor.execute('SELECT MIN(ts) FROM activity_events')
+    oldest = cursor.fetchone()[0]
+    if oldest is not None:
+        cursor.execute("DELETE FROM activity_daily WHERE day >= date(?, 'unixepoch', 'localtime')", (oldest,))
+        cursor.execute("DELETE FROM activity_weekly WHERE week >= strftime('%Y-%W', ?, 'unixepoch', 'localtime')",
+                       (oldest,))
+    cursor.execute('UPDATE activity_rollup SET last_event_id = 0 WHERE id = 1')
+    folded = 0
+    while True:
+        count = compact_once(cursor)
+        folded += count
+        if count < ACTIVITY_CHUNK:
+            return folded
+
+
+def archive(conn, retention_days=ACTIVITY_RETENTION_DAYS, archive_dir=ACTIVITY_ARCHIVE_DIR):
+    # Only compacted events leave the log. A crash between the write and the delete
+    # archives a chunk twice, never loses it.
+    cutoff = int(time.time()) - retention_days * 86400
+    removed = 0
+    while True:
+        cursor = conn.cursor()
+        cursor.execute('''SELECT id, user_id, kind, ts, ref, value FROM activity_events
+                          WHERE ts < ? AND id <= (SELECT last_event_id FROM activity_rollup WHERE id = 1)
+                          ORDER BY ts LIMIT ?''', (cutoff, ACTIVITY_CHUNK))
+        rows = cursor.fetchall()
+        if not rows:
+            return removed
+        if archive_dir:
+            _write_archive(archive_dir, rows)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('DELETE FROM activity_events WHERE id = ?', [(row[0],) for row in rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        removed += len(rows)
+
+
+def _write_archive(archive_dir, rows):
+    os.makedirs(archive_dir, exist_ok=True)
+    months = {}
+    for event_id, user_id, kind, ts, ref, value in rows:
+        month = datetime.fromtimestamp(ts).strftime('%Y-%m')
+        months.setdefault(month, []).append(json.dumps({
+            'id': event_id, 'user_id': user_id, 'kind': KIND_NAMES.get(kind, kind), 'ts': ts,
+            'ref': ref, 'value': value,
+        }))
+    # Appending makes a multi-member gzip file, which gzip and zcat read as one
+    for month, lines in months.items():
+        with gzip.open(os.path.join(archive_dir, f'activity-{month}.jsonl.gz'), 'at', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+# Reading
+
+def _pending(cursor, user_id, first_day):
+    # Events not folded yet: a short id range past the watermark
+    cursor.execute('''SELECT date(ts, 'unixepoch', 'localtime') AS day, kind, COUNT(*), COALESCE(SUM(value), 0)
+                      FROM activity_events
+                      WHERE id > (SELECT last_event_id FROM activity_rollup WHERE id = 1) AND user_id = ?
+                      GROUP BY day, kind HAVING day >= ?''', (user_id, first_day))
+    return cursor.fetchall()
+
+
+def daily_activity(cursor, user_id, first_day):
+    # day -> {kind name: [events, value_sum]}
+    cursor.execute('SELECT day, kind, events, value_sum FROM activity_daily WHERE user_id = ? AND day >= ?',
+                   (user_id, first_day))
+    days = {}
+    for day, kind, events, value_sum in cursor.fetchall() + _pending(cursor, user_id, first_day):
+        counts = days.setdefault(day, {}).setdefault(KIND_NAMES[kind], [0, 0])
+        counts[0] += events
+        counts[1] += value_sum
+    return days
+
+
+def streaks(days, today=None):
+    # (current, longest) runs of consecutive active days; the current one may end yesterday
+    today = today or date.today()
+    active = sorted(date.fromisoformat(day) for day in days)
+    longest = run = 0
+    previous = None
+    for day in active:
+        run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous is not None and today - previous <= timedelta(days=1) else 0
+    return current, longest
+
+
+def get_activity(cursor, user_id, days=ACTIVITY_HEATMAP_DAYS, today=None):
+    today = today or date.today()
+    first_day = (today - timedelta(days=days - 1)).isoformat()
+    daily = daily_activity(cursor, user_id, first_day)
+
+    # The streak can reach further back than the heatmap
+    cursor.execute('SELECT DISTINCT day FROM activity_daily WHERE user_id = ? AND day < ?', (user_id, first_day))
+    current, longest = streaks([row[0] for row in cursor.fetchall()] + list(daily), today)
+
+    cursor.execute('''SELECT week, kind, events, active_days FROM activity_weekly
+                      WHERE user_id = ? AND week >= strftime('%Y-%W', ?) ORDER BY week''', (user_id, first_day))
+    weeks = {}
+    for week, kind, events, active_days in cursor.fetchall():
+        entry = weeks.setdefault(week, {'week': week})
+        entry[KIND_NAMES[kind]] = events
+        entry[f'{KIND_NAMES[kind]}_days'] = active_days
+
+    return {
+        'current_streak': current,
+        'longest_streak': longest,
+        'active_days': len(daily),
+        'days': [dict({'day': day}, **{kind: counts[0] for kind, counts in sorted(daily[day].items())})
+                 for day in sorted(daily)],
+        'weeks': list(weeks.values()),
+    }
+
+
+if __name__ == '__main__':
+    import db
+
+    if sys.argv[1:] not in (['compact'], ['archive'], ['rebuild']):
+        print('usage: python activity.py compact|archive|rebuild')
+        sys.exit(1)
+
+    with db.get_pool().connection() as conn:
+        if sys.argv[1] == 'compact':
+            print(f'folded {compact(conn)} event(s)')
+        elif sys.argv[1] == 'archive':
+            compact(conn)
+            print(f'archived {archive(conn)} event(s)')
+        else:
+            conn.execute('BEGIN IMMEDIATE')
+            folded = rebuild_rollups(conn.cursor())
+            conn.commit()
+            print(f'rebuilt rollups from {folded} event(s)')
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+from flask import abort, request, send_from_directory, url_for
+
+import mushaf
+
+# Static asset pipeline. "python assets.py build" (or create_app() at startup, when a source
+# is newer than the last build) minifies app.js and style.css, names each output after a hash
+# of its content and writes it with its gzip and brotli forms next to a manifest:
+#   static/dist/app.3f2a9c0d1b7e.js  .js.gz  .js.br  manifest.json
+# Templates link through asset_url('js/app.js'), which resolves the manifest name, so a URL
+# changes exactly when the content does and /assets/ responses are cached for a year as
+# immutable. The precompressed file matching Accept-Encoding is handed to send_file, which
+# the server streams with sendfile (or X-Sendfile with USE_X_SENDFILE), never through Python.
+
+ASSETS = ('js/app.js', 'css/style.css')
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+ASSET_MAX_AGE = 31536000
+# Built files of the previous manifest stay servable, for pages rendered before a deploy
+KEEP_PREVIOUS = True
+
+# Suffix of each precompressed form, best first
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def minify_js(source):
+    # Conservative: drops indentation, blank lines and whole-line // comments, but leaves
+    # the lines inside template literals as they are (they are HTML we render)
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        stripped = line.strip()
+        if in_template:
+            lines.append(line)
+        elif stripped and not stripped.startswith('//'):
+            lines.append(stripped)
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = source.replace(';}', '}')
+    return source.strip() + '\n'
+
+
+MINIFIERS = {'.js': minify_js, '.css': minify_css}
+
+
+def _write(path, data):
+    # Written aside and renamed, so a worker never serves a half-written file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read_manifest(dist_dir=DIST_DIR):
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def is_stale(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    manifest_path = os.path.join(dist_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return True
+    built = os.stat(manifest_path).st_mtime_ns
+    return any(os.stat(os.path.join(static_dir, name)).st_mtime_ns > built for name in ASSETS)
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    # Returns the new manifest: source name -> built file name
+    os.makedirs(dist_dir, exist_ok=True)
+    previous = read_manifest(dist_dir)
+    manifest = {}
+    for name in ASSETS:
+        with open(os.path.join(static_dir, name), encoding='utf-8') as f:
+            source = f.read()
+        base, ext = os.path.splitext(os.path.basename(name))
+        body = MINIFIERS[ext](source).encode('utf-8')
+        built = f'{base}.{hashlib.sha256(body).hexdigest()[:12]}{ext}'
+        path = os.path.join(dist_dir, built)
+        if not os.path.exists(path):
+            for encoding, suffix in ENCODING_SUFFIXES:
+                compressed = mushaf.compress(body, encoding)
+                if compressed is not None:
+                    _write(path + suffix, compressed)
+            _write(path, body)
+        manifest[name] = built
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+
+    keep = set(manifest.values()) | (set(previous.values()) if KEEP_PREVIOUS else set())
+    for filename in os.listdir(dist_dir):
+        if filename != MANIFEST_NAME and not filename.endswith('.tmp') \
+                and re.sub(r'\.(gz|br)$', '', filename) not in keep:
+            os.unlink(os.path.join(dist_dir, filename))
+    _reset()
+    return manifest
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def _reset():
+    global _manifest
+    _manifest = None
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = read_manifest()
+    return _manifest
+
+
+def asset_url(name):
+    # Jinja global: the fingerprinted URL, or the plain static file when nothing is built
+    built = get_manifest().get(name)
+    if built is None:
+        import httpcache
+        return url_for('static', filename=name, v=httpcache.build_version())
+    return url_for('asset', filename=built)
+
+
+def asset(filename):
+    # Only fingerprinted names are served; anything else under /assets/ is a 404
+    if filename == MANIFEST_NAME or filename.endswith(('.gz', '.br', '.tmp')):
+        abort(404)
+    encoding, suffix = 'identity', ''
+    for candidate, candidate_suffix in ENCODING_SUFFIXES:
+        if request.accept_encodings[candidate] and os.path.exists(os.path.join(DIST_DIR, filename + candidate_suffix)):
+            encoding, suffix = candidate, candidate_suffix
+            break
+
+    response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=ASSET_MAX_AGE)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    return response
+
+
+def init_app(app):
+    app.add_url_rule('/assets/<path:filename>', 'asset', asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] not in (['build'], ['info']):
+        print('usage: python assets.py build|info')
+        sys.exit(1)
+
+    if sys.argv[1] == 'build':
+        build()
+    for name, built in read_manifest().items():
+        sizes = [os.path.getsize(os.path.join(STATIC_DIR, name))]
+        sizes += [os.path.getsize(os.path.join(DIST_DIR, built + suffix))
+                  for _, suffix in (('identity', ''),) + ENCODING_SUFFIXES
+                  if os.path.exists(os.path.join(DIST_DIR, built + suffix))]
+        print(f'{name:<16} -> {built:<24} ' + ' / '.join(f'{size:,}' for size in sizes) + ' bytes')
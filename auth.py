@@ -0,0 +1,206 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing off the request thread. Hashes are CPU-bound and hold the GIL, so when a
+# class logs in at once they would stall every other request of the worker. They run in a
+# small process pool instead; at most AUTH_QUEUE_LIMIT hashes may be in flight per worker and
+# anything beyond that is refused at once (AuthBusy -> 503 + Retry-After) rather than queued.
+# Changing AUTH_HASH_METHOD is picked up on the next successful login of each user.
+
+AUTH_HASH_METHOD = os.environ.get('AUTH_HASH_METHOD', 'pbkdf2:sha256:600000')
+AUTH_SALT_LENGTH = int(os.environ.get('AUTH_SALT_LENGTH', '16'))
+AUTH_WORKERS = int(os.environ.get('AUTH_WORKERS', str(min(4, os.cpu_count() or 1))))
+AUTH_QUEUE_LIMIT = int(os.environ.get('AUTH_QUEUE_LIMIT', str(max(1, AUTH_WORKERS) * 8)))
+AUTH_TIMEOUT = float(os.environ.get('AUTH_TIMEOUT', '10'))
+AUTH_RETRY_AFTER = int(os.environ.get('AUTH_RETRY_AFTER', '2'))
+AUTH_START_METHOD = os.environ.get('AUTH_START_METHOD', 'spawn')
+
+
+class AuthBusy(Exception):
+    pass
+
+
+# Run inside the pool processes
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # 'pbkdf2' and 'pbkdf2:sha256:600000' hash to the same stored prefix
+    return generate_password_hash('', method, 1).split('$', 1)[0]
+
+
+def _hash(password, method, salt_length):
+    started = time.perf_counter()
+    pwhash = generate_password_hash(password, method, salt_length)
+    return pwhash, time.perf_counter() - started
+
+
+def _verify(pwhash, password, method, salt_length):
+    # Rehash in the same task so an outdated hash costs one round trip, not two
+    started = time.perf_counter()
+    new_hash = None
+    ok = check_password_hash(pwhash, password)
+    if ok and pwhash.split('$', 1)[0] != _method_prefix(method):
+        new_hash = generate_password_hash(password, method, salt_length)
+    return ok, new_hash, time.perf_counter() - started
+
+
+class HashPool:
+
+    def __init__(self, workers=AUTH_WORKERS, queue_limit=AUTH_QUEUE_LIMIT, timeout=AUTH_TIMEOUT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'rehashes': 0,
+            'in_flight': 0,
+            'max_in_flight': 0,
+            'hash_time_ms': 0.0,
+            'max_hash_ms': 0.0,
+            'queue_wait_ms': 0.0,
+            'max_queue_wait_ms': 0.0,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(AUTH_START_METHOD))
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._stats[key] += value
+
+    def _release(self):
+        self._slots.release()
+        self._record(in_flight=-1)
+
+    def _call(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            raise AuthBusy('password hashing queue is full')
+
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['in_flight'] += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+
+        started = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args) if executor is not None else None
+        except BrokenProcessPool:
+            self._release()
+            self._reset_executor()
+            self._record(failures=1)
+            raise AuthBusy('password hashing pool restarted')
+        except Exception:
+            self._release()
+            raise
+
+        if future is None:
+            # AUTH_WORKERS=0: hash inline (development, single-user tools)
+            try:
+                result = fn(*args)
+            finally:
+                self._release()
+        else:
+            # The slot is freed when the hash is done, not when we stop waiting for it: a timed
+            # out hash that already started keeps running and must keep counting
+            future.add_done_callback(lambda _: self._release())
+            try:
+                result = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                self._record(timeouts=1)
+                raise AuthBusy('password hashing timed out')
+            except BrokenProcessPool:
+                self._reset_executor()
+                self._record(failures=1)
+                raise AuthBusy('password hashing pool restarted')
+
+        elapsed = (time.perf_counter() - started) * 1000
+        hashed = result[-1] * 1000
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['hash_time_ms'] += hashed
+            self._stats['max_hash_ms'] = max(self._stats['max_hash_ms'], hashed)
+            self._stats['queue_wait_ms'] += max(0.0, elapsed - hashed)
+            self._stats['max_queue_wait_ms'] = max(self._stats['max_queue_wait_ms'], elapsed - hashed)
+        return result[:-1]
+
+    def hash_password(self, password):
+        return self._call(_hash, password, AUTH_HASH_METHOD, AUTH_SALT_LENGTH)[0]
+
+    def verify_password(self, pwhash, password):
+        # Returns (matches, new hash to store or None)
+        ok, new_hash = self._call(_verify, pwhash, password, AUTH_HASH_METHOD, AUTH_SALT_LENGTH)
+        if new_hash:
+            self._record(rehashes=1)
+        return ok, new_hash
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats['completed']
+        stats['avg_hash_ms'] = round(stats['hash_time_ms'] / completed, 3) if completed else 0.0
+        stats['avg_queue_wait_ms'] = round(stats['queue_wait_ms'] / completed, 3) if completed else 0.0
+        for key in ('hash_time_ms', 'max_hash_ms', 'queue_wait_ms', 'max_queue_wait_ms'):
+            stats[key] = round(stats[key], 3)
+        stats['workers'] = self.workers
+        stats['queue_limit'] = self.queue_limit
+        stats['method'] = AUTH_HASH_METHOD
+        return stats
+
+    def shutdown(self):
+        self._reset_executor()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # One pool per process: child processes inherited over fork() are not ours
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = HashPool()
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def hash_password(password):
+    return get_pool().hash_password(password)
+
+
+def verify_password(pwhash, password):
+    return get_pool().verify_password(pwhash, password)
+
+
+def auth_stats():
+    return get_pool().stats()
@@ -0,0 +1,459 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+# Reproducible load test for the main2.py endpoints, run entirely on this machine.
+#
+#   python benchmark.py seed --db bench.db --students 100000 --quran-rows 10000000
+#   python benchmark.py run --db bench.db --mode both --output bench.json
+#   python benchmark.py run --db bench.db --baseline bench.json
+#
+# 'seed' builds a synthetic islamic_app.db on top of the schema and sample data create_app() sets up.
+# 'run' drives each scenario through Flask's test client and/or a real threaded HTTP
+# server with concurrent clients, and reports latency percentiles, throughput and SQL
+# statements per request as JSON. With --baseline it exits non-zero on regressions.
+
+BENCH_PASSWORD = 'bench-password'
+SEED_CHUNK = 50000
+SEED = 1337
+
+SCENARIOS = [
+    'login',
+    'lessons',
+    'api_lessons',
+    'lesson_detail',
+    'track_quran_progress',
+    'start_quiz',
+    'dashboard_stats',
+]
+
+
+def _load_app(database):
+    # db.py reads the path at import time
+    os.environ['ISLAMIC_APP_DB'] = database
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main2
+    main2.create_app()
+    return main2
+
+
+# Seeding
+
+def _chunks(rows, size=SEED_CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(args):
+    from werkzeug.security import generate_password_hash
+
+    main2 = _load_app(args.db)
+    import db
+    import fulltext
+    import stats
+
+    rng = random.Random(SEED)
+    started = time.perf_counter()
+
+    with db.get_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA synchronous=OFF')
+
+        # Per-row stats and search triggers would dominate a bulk load; rebuild once at the end instead
+        cursor.execute('''SELECT name, sql FROM sqlite_master
+                          WHERE type = 'trigger' AND (name LIKE 'trg_%_stats' OR name LIKE 'trg_%_search_%')''')
+        triggers = cursor.fetchall()
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER {name}')
+
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM users')
+        first_user = cursor.fetchone()[0] + 1
+        teacher_hash = generate_password_hash(BENCH_PASSWORD)
+
+        teachers = max(1, args.students // 500)
+        cursor.executemany('INSERT INTO users (username, password_hash, user_type) VALUES (?, ?, ?)',
+                           ((f'bench_teacher_{first_user + i}', teacher_hash, 'teacher') for i in range(teachers)))
+        teacher_ids = list(range(first_user, first_user + teachers))
+        conn.commit()
+
+        for chunk in _chunks((f'bench_student_{first_user + teachers + i}', teacher_hash, 'student',
+                              f'B{first_user + teachers + i:08X}', rng.choice(teacher_ids))
+                             for i in range(args.students)):
+            cursor.executemany('''INSERT INTO users (username, password_hash, user_type, student_code, teacher_id)
+                                  VALUES (?, ?, ?, ?, ?)''', chunk)
+            conn.commit()
+        student_ids = range(first_user + teachers, first_user + teachers + args.students)
+
+        topics = ['عقيدة', 'فقه', 'سيرة', 'حديث', 'تفسير']
+        base = datetime(2024, 1, 1)
+        cursor.executemany('''INSERT INTO lessons (title, description, content, video_url, topic, created_by, created_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                           ((f'درس تجريبي {i}', 'وصف الدرس', 'محتوى الدرس ' * 50, '', topics[i % 5],
+                             rng.choice(teacher_ids), base + timedelta(minutes=i)) for i in range(args.lessons)))
+        conn.commit()
+        cursor.execute('SELECT id FROM lessons')
+        lesson_ids = [row[0] for row in cursor.fetchall()]
+
+        for chunk in _chunks((lesson_id, f'سؤال {lesson_id}-{i}', 'أ', 'ب', 'ج', 'د', 'abcd'[i % 4])
+                             for lesson_id in lesson_ids for i in range(args.questions_per_lesson)):
+            cursor.executemany('''INSERT INTO quiz_questions
+                                  (lesson_id, question, option_a, option_b, option_c, option_d, correct_answer)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?)''', chunk)
+            conn.commit()
+
+        pages_per_student = max(1, min(604, args.quran_rows // max(args.students, 1)))
+
+        def quran_rows():
+            for student_id in student_ids:
+                for page in rng.sample(range(1, 605), pages_per_student):
+                    yield (student_id, page, 'true' if rng.random() < 0.1 else 'false', rng.randint(1, 5),
+                           base + timedelta(days=rng.randint(0, 600)))
+
+        for chunk in _chunks(quran_rows()):
+            cursor.executemany('''INSERT INTO quran_progress (student_id, page_number, memorized, read_count, last_read)
+                                  VALUES (?, ?, ?, ?, ?)''', chunk)
+            conn.commit()
+
+        def progress_rows():
+            for student_id in student_ids:
+                for _ in range(args.progress_per_student):
+                    yield (student_id, rng.choice(lesson_ids), rng.randint(0, 100),
+                           base + timedelta(days=rng.randint(0, 600)))
+
+        for chunk in _chunks(progress_rows()):
+            cursor.executemany('''INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at)
+                                  VALUES (?, ?, ?, ?)''', chunk)
+            conn.commit()
+
+        conn.execute('BEGIN IMMEDIATE')
+        for _, sql in triggers:
+            cursor.execute(sql)
+        stats.rebuild_student_stats(cursor)
+        fulltext.rebuild_search_index(cursor)
+        conn.commit()
+        cursor.execute('ANALYZE')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+
+    import cache
+    cache.invalidate_lessons()
+    print(json.dumps({
+        'database': args.db,
+        'students': args.students,
+        'teachers': teachers,
+        'lessons': len(lesson_ids),
+        'quiz_questions': len(lesson_ids) * args.questions_per_lesson,
+        'quran_rows': args.students * pages_per_student,
+        'progress_rows': args.students * args.progress_per_student,
+        'seconds': round(time.perf_counter() - started, 2),
+    }, ensure_ascii=False))
+
+
+# Measurement
+
+class StatementCounter:
+    # Counts SQL statements on every pooled connection (trigger bodies excluded)
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def install(self, conn):
+        conn.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        if not statement.startswith('--'):
+            with self._lock:
+                self.count += 1
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(latencies, statuses, elapsed, statements):
+    requests = len(latencies)
+    return {
+        'requests': requests,
+        'errors': sum(1 for status in statuses if status >= 400),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0,
+        'statements_per_request': round(statements / requests, 2) if requests else 0.0,
+    }
+
+
+class Fixture:
+    # Ids sampled from the seeded database so every scenario hits real rows
+
+    def __init__(self, cursor, rng):
+        cursor.execute("SELECT id, username FROM users WHERE user_type = 'student' AND username LIKE 'bench_student_%' LIMIT 5000")
+        self.students = cursor.fetchall()
+        cursor.execute('SELECT id FROM lessons ORDER BY id DESC LIMIT 5000')
+        self.lessons = [row[0] for row in cursor.fetchall()]
+        if not self.students:
+            raise SystemExit('no bench students found: run "python benchmark.py seed" first')
+        self.rng = rng
+
+    def student(self):
+        return self.rng.choice(self.students)
+
+    def request(self, scenario):
+        # (method, path, form or json body)
+        rng = self.rng
+        if scenario == 'login':
+            return 'POST', '/login', {'form': {'username': self.student()[1], 'password': BENCH_PASSWORD}}
+        if scenario == 'lessons':
+            return 'GET', '/lessons', {}
+        if scenario == 'api_lessons':
+            return 'GET', '/api/lessons?' + urlencode({'topic': rng.choice(['', 'فقه', 'حديث'])}), {}
+        if scenario == 'lesson_detail':
+            return 'GET', f'/lesson/{rng.choice(self.lessons)}', {}
+        if scenario == 'track_quran_progress':
+            return 'POST', '/api/track_quran_progress', {'json': {'page_number': rng.randint(1, 604),
+                                                                  'action': rng.choice(['read', 'read', 'memorized'])}}
+        if scenario == 'start_quiz':
+            return 'POST', '/api/quiz/start', {'json': {'lesson_id': rng.choice(self.lessons)}}
+        if scenario == 'dashboard_stats':
+            return 'GET', '/api/dashboard_stats', {}
+        raise ValueError(scenario)
+
+
+def _run_clients(clients, requests, send):
+    # Clients are built (and logged in) beforehand so setup never counts as latency
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(client):
+        local_latencies = []
+        local_statuses = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            status = send(client)
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses.append(status)
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.extend(local_statuses)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        list(executor.map(worker, clients))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def _measure(clients, send, args, counter):
+    _run_clients(clients, args.warmup, send)
+    before = counter.count
+    latencies, statuses, elapsed = _run_clients(clients, args.requests, send)
+    return summarize(latencies, statuses, elapsed, counter.count - before)
+
+
+def run_test_client(app, fixture, scenario, args, counter):
+    def make_client():
+        client = app.test_client()
+        student_id, username = fixture.student()
+        with client.session_transaction() as session:
+            session['user_id'] = student_id
+            session['username'] = username
+            session['user_type'] = 'student'
+        return client
+
+    def send(client):
+        method, path, body = fixture.request(scenario)
+        if method == 'GET':
+            response = client.get(path)
+        else:
+            response = client.post(path, data=body.get('form'), json=body.get('json'))
+        status = response.status_code
+        response.close()
+        return status
+
+    return _measure([make_client() for _ in range(args.concurrency)], send, args, counter)
+
+
+def _http(port, method, path, body=None, cookie=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {}
+    payload = None
+    if cookie:
+        headers['Cookie'] = cookie
+    if body and 'json' in body:
+        payload = json.dumps(body['json'])
+        headers['Content-Type'] = 'application/json'
+    elif body and 'form' in body:
+        payload = urlencode(body['form'])
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    conn.request(method, path, body=payload, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    set_cookie = response.getheader('Set-Cookie')
+    conn.close()
+    return response.status, set_cookie
+
+
+def run_server(app, fixture, scenario, args, counter, port):
+    def make_client():
+        # Log each simulated student in once and reuse the session cookie
+        student_id, username = fixture.student()
+        status, set_cookie = _http(port, 'POST', '/login', {'form': {'username': username, 'password': BENCH_PASSWORD}})
+        return set_cookie.split(';', 1)[0] if set_cookie else None
+
+    def send(cookie):
+        method, path, body = fixture.request(scenario)
+        status, _ = _http(port, method, path, body, cookie)
+        return status
+
+    return _measure([make_client() for _ in range(args.concurrency)], send, args, counter)
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def compare(results, baseline, tolerance):
+    # A scenario regresses when p95, throughput or SQL statements per request move past tolerance
+    regressions = []
+    for mode, scenarios in results['results'].items():
+        for scenario, current in scenarios.items():
+            previous = baseline.get('results', {}).get(mode, {}).get(scenario)
+            if not previous:
+                continue
+            delta = {
+                'p95_ms': round(current['p95_ms'] - previous['p95_ms'], 3),
+                'throughput_rps': round(current['throughput_rps'] - previous['throughput_rps'], 2),
+                'statements_per_request': round(current['statements_per_request'] - previous['statements_per_request'], 2),
+            }
+            current['baseline_delta'] = delta
+            if (previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance)) or \
+               (previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance)) or \
+               current['statements_per_request'] > previous['statements_per_request'] * (1 + tolerance) + 0.5:
+                regressions.append(f'{mode}/{scenario}')
+    return regressions
+
+
+def run(args):
+    main2 = _load_app(args.db)
+    import db
+
+    counter = StatementCounter()
+    db.CONNECT_HOOKS.append(counter.install)
+    app = main2.app
+    if not args.verbose:
+        # Failing scenarios are counted in the report, not dumped as tracebacks
+        logging.getLogger(app.logger.name).setLevel(logging.CRITICAL)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    with db.get_pool().connection() as conn:
+        fixture = Fixture(conn.cursor(), random.Random(SEED))
+
+    scenarios = args.scenarios or SCENARIOS
+    modes = ['client', 'server'] if args.mode == 'both' else [args.mode]
+    results = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'database': args.db,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'results': {},
+    }
+
+    server = start_server(app) if 'server' in modes else None
+    try:
+        for mode in modes:
+            results['results'][mode] = {}
+            for scenario in scenarios:
+                if mode == 'client':
+                    summary = run_test_client(app, fixture, scenario, args, counter)
+                else:
+                    summary = run_server(app, fixture, scenario, args, counter, server.server_port)
+                results['results'][mode][scenario] = summary
+                print(f'{mode:<7} {scenario:<22} p50 {summary["p50_ms"]:>9.2f}ms  p95 {summary["p95_ms"]:>9.2f}ms  '
+                      f'p99 {summary["p99_ms"]:>9.2f}ms  {summary["throughput_rps"]:>9.1f} req/s  '
+                      f'{summary["statements_per_request"]:>5.1f} sql/req  {summary["errors"]} errors',
+                      file=sys.stderr)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = regressions
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if regressions:
+        print('regressions: ' + ', '.join(regressions), file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed and load-test the Islamic lessons app locally')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='build a synthetic database')
+    seed_parser.add_argument('--db', default='bench.db')
+    seed_parser.add_argument('--students', type=int, default=10000)
+    seed_parser.add_argument('--lessons', type=int, default=1000)
+    seed_parser.add_argument('--questions-per-lesson', type=int, default=50)
+    seed_parser.add_argument('--quran-rows', type=int, default=1000000)
+    seed_parser.add_argument('--progress-per-student', type=int, default=10)
+
+    run_parser = commands.add_parser('run', help='run the load test')
+    run_parser.add_argument('--db', default='bench.db')
+    run_parser.add_argument('--mode', choices=['client', 'server', 'both'], default='both')
+    run_parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS)
+    run_parser.add_argument('--requests', type=int, default=1000)
+    run_parser.add_argument('--warmup', type=int, default=50)
+    run_parser.add_argument('--concurrency', type=int, default=16)
+    run_parser.add_argument('--output')
+    run_parser.add_argument('--baseline')
+    run_parser.add_argument('--tolerance', type=float, default=0.2)
+    run_parser.add_argument('--verbose', action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+
+import cache
+
+# Bulk import/export of lessons and quiz questions as CSV or JSONL.
+# Imports stream the input and write it in chunks of IMPORT_CHUNK rows, one executemany per
+# table in one BEGIN IMMEDIATE transaction per chunk, so memory stays flat and other writers
+# get the lock between chunks. Invalid rows are skipped and reported with their line number.
+# Rows carrying an id update that lesson/question, so an export can be edited and re-imported.
+# Exports walk the table by id in batches and never hold a connection between batches.
+
+IMPORT_CHUNK = 5000
+EXPORT_BATCH = 1000
+MAX_REPORTED_ERRORS = 100
+FORMATS = ('csv', 'jsonl')
+
+LESSON_FIELDS = ('id', 'title', 'description', 'content', 'video_url', 'topic', 'created_by', 'created_at')
+QUESTION_FIELDS = ('id', 'lesson_id', 'question', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer')
+ANSWERS = ('a', 'b', 'c', 'd')
+
+LESSON_UPSERT = '''
+    INSERT INTO lessons (id, title, description, content, video_url, topic, created_by, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        title = excluded.title,
+        description = excluded.description,
+        content = excluded.content,
+        video_url = excluded.video_url,
+        topic = excluded.topic
+'''
+
+QUESTION_UPSERT = '''
+    INSERT INTO quiz_questions (id, lesson_id, question, option_a, option_b, option_c, option_d, correct_answer)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        lesson_id = excluded.lesson_id,
+        question = excluded.question,
+        option_a = excluded.option_a,
+        option_b = excluded.option_b,
+        option_c = excluded.option_c,
+        option_d = excluded.option_d,
+        correct_answer = excluded.correct_answer
+'''
+
+
+class BulkError(ValueError):
+    pass
+
+
+def detect_format(filename=None, mimetype=None):
+    name = (filename or '').lower()
+    if name.endswith('.csv') or mimetype == 'text/csv':
+        return 'csv'
+    return 'jsonl'
+
+
+# Reading
+
+def read_records(stream, fmt):
+    # Yields (line number, record dict or None, error or None)
+    if fmt not in FORMATS:
+        raise BulkError(f'unknown format: {fmt}')
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'invalid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, 'expected a JSON object'
+            continue
+        yield line_number, record, None
+
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    if value is None:
+        value = ''
+    value = str(value).strip()
+    if required and not value:
+        raise BulkError(f'{field} is required')
+    return value
+
+
+def _int(record, field, required=False):
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise BulkError(f'{field} is required')
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BulkError(f'{field} must be an integer')
+
+
+def clean_lesson(record, created_by=None):
+    lesson = {
+        'id': _int(record, 'id'),
+        'title': _text(record, 'title', required=True),
+        'description': _text(record, 'description'),
+        'content': _text(record, 'content'),
+        'video_url': _text(record, 'video_url'),
+        'topic': _text(record, 'topic'),
+        'created_by': _int(record, 'created_by') or created_by,
+        'created_at': _text(record, 'created_at') or datetime.now(),
+        'questions': [],
+    }
+    # JSONL lessons may carry their questions inline; they get the lesson's id once assigned
+    questions = record.get('questions') or []
+    if not isinstance(questions, list):
+        raise BulkError('questions must be a list')
+    for index, question in enumerate(questions, 1):
+        if not isinstance(question, dict):
+            raise BulkError(f'question {index}: expected an object')
+        try:
+            lesson['questions'].append(clean_question(question, embedded=True))
+        except BulkError as e:
+            raise BulkError(f'question {index}: {e}')
+    return lesson
+
+
+def clean_question(record, embedded=False):
+    question = {
+        'id': _int(record, 'id'),
+        'lesson_id': None if embedded else _int(record, 'lesson_id', required=True),
+        'question': _text(record, 'question', required=True),
+        'option_a': _text(record, 'option_a', required=True),
+        'option_b': _text(record, 'option_b', required=True),
+        'option_c': _text(record, 'option_c', required=True),
+        'option_d': _text(record, 'option_d', required=True),
+        'correct_answer': _text(record, 'correct_answer', required=True).lower(),
+    }
+    if question['correct_answer'] not in ANSWERS:
+        raise BulkError('correct_answer must be one of a, b, c, d')
+    return question
+
+
+# Writing
+
+def _question_row(question):
+    return tuple(question[field] for field in QUESTION_FIELDS)
+
+
+def _write_lessons(cursor, chunk):
+    # Ids are handed out here rather than by SQLite so inline questions can reference them
+    # without a round trip per lesson; under BEGIN IMMEDIATE nobody else can take them
+    cursor.execute('''SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'lessons'), 0),
+                                 COALESCE((SELECT MAX(id) FROM lessons), 0))''')
+    next_id = max([cursor.fetchone()[0]] + [lesson['id'] for _, lesson in chunk if lesson['id']]) + 1
+
+    lesson_rows = []
+    question_rows = []
+    for _, lesson in chunk:
+        if lesson['id'] is None:
+            lesson['id'] = next_id
+            next_id += 1
+        lesson_rows.append(tuple(lesson[field] for field in LESSON_FIELDS))
+        for question in lesson['questions']:
+            question['lesson_id'] = lesson['id']
+            question_rows.append(_question_row(question))
+
+    cursor.executemany(LESSON_UPSERT, lesson_rows)
+    if question_rows:
+        cursor.executemany(QUESTION_UPSERT, question_rows)
+    return len(lesson_rows), []
+
+
+def _write_questions(cursor, chunk):
+    lesson_ids = sorted({question['lesson_id'] for _, question in chunk})
+    known = set()
+    for start in range(0, len(lesson_ids), 900):
+        batch = lesson_ids[start:start + 900]
+        cursor.execute(f'SELECT id FROM lessons WHERE id IN ({",".join("?" * len(batch))})', batch)
+        known.update(row[0] for row in cursor.fetchall())
+
+    rows = []
+    rejected = []
+    for line_number, question in chunk:
+        if question['lesson_id'] in known:
+            rows.append(_question_row(question))
+        else:
+            rejected.append((line_number, f'lesson {question["lesson_id"]} does not exist'))
+
+    cursor.executemany(QUESTION_UPSERT, rows)
+    return len(rows), rejected
+
+
+def import_records(conn, kind, stream, fmt, created_by=None, chunk_size=IMPORT_CHUNK):
+    # Generator: yields a progress dict after every chunk, the last one has done=True
+    if kind == 'lessons':
+        clean, write = (lambda record: clean_lesson(record, created_by)), _write_lessons
+    elif kind == 'questions':
+        clean, write = clean_question, _write_questions
+    else:
+        raise BulkError(f'unknown kind: {kind}')
+
+    started = time.perf_counter()
+    summary = {'kind': kind, 'processed': 0, 'imported': 0, 'rejected': 0, 'chunks': 0, 'errors': []}
+
+    def reject(line_number, error):
+        summary['rejected'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line_number, 'error': error})
+
+    def flush(chunk):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            imported, rejected = write(conn.cursor(), chunk)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        summary['imported'] += imported
+        summary['chunks'] += 1
+        for line_number, error in rejected:
+            reject(line_number, error)
+        summary['elapsed'] = round(time.perf_counter() - started, 3)
+        return {key: value for key, value in summary.items() if key != 'errors'}
+
+    chunk = []
+    try:
+        for line_number, record, error in read_records(stream, fmt):
+            summary['processed'] += 1
+            if error is None:
+                try:
+                    chunk.append((line_number, clean(record)))
+                except BulkError as e:
+                    error = str(e)
+            if error is not None:
+                reject(line_number, error)
+            if len(chunk) >= chunk_size:
+                yield flush(chunk)
+                chunk = []
+        if chunk:
+            yield flush(chunk)
+    finally:
+        if summary['chunks']:
+            cache.invalidate_lessons()
+
+    summary['errors'].sort(key=lambda error: error['line'])
+    summary['elapsed'] = round(time.perf_counter() - started, 3)
+    summary['done'] = True
+    yield summary
+
+
+# Export
+
+def _export_query(kind, lesson_id):
+    if kind == 'lessons':
+        return f'SELECT {", ".join(LESSON_FIELDS)} FROM lessons WHERE id > ?', [], LESSON_FIELDS
+    if kind == 'questions':
+        if lesson_id is not None:
+            return (f'SELECT {", ".join(QUESTION_FIELDS)} FROM quiz_questions WHERE lesson_id = ? AND id > ?',
+                    [lesson_id], QUESTION_FIELDS)
+        return f'SELECT {", ".join(QUESTION_FIELDS)} FROM quiz_questions WHERE id > ?', [], QUESTION_FIELDS
+    raise BulkError(f'unknown kind: {kind}')
+
+
+def export_records(connection, kind, fmt, lesson_id=None, batch_size=EXPORT_BATCH):
+    # Generator of text chunks; connection is a context manager factory (db.connection)
+    if fmt not in FORMATS:
+        raise BulkError(f'unknown format: {fmt}')
+    sql, params, fields = _export_query(kind, lesson_id)
+    sql += ' ORDER BY id LIMIT ?'
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(fields)
+
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute(sql, params + [last_id, batch_size]).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            if writer:
+                writer.writerow(['' if value is None else value for value in row])
+            else:
+                buffer.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=str) + '\n')
+        last_id = rows[-1][0]
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+if __name__ == '__main__':
+    import db
+
+    parser = argparse.ArgumentParser(description='Import or export lessons and quiz questions')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import')
+    import_parser.add_argument('kind', choices=['lessons', 'questions'])
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=FORMATS)
+    import_parser.add_argument('--created-by', type=int)
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK)
+
+    export_parser = commands.add_parser('export')
+    export_parser.add_argument('kind', choices=['lessons', 'questions'])
+    export_parser.add_argument('--format', choices=FORMATS, default='jsonl')
+    export_parser.add_argument('--lesson-id', type=int)
+    export_parser.add_argument('-o', '--output')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        fmt = args.format or detect_format(args.path)
+        with open(args.path, 'rb') as f, db.get_pool().connection() as conn:
+            for update in import_records(conn, args.kind, f, fmt, args.created_by, args.chunk_size):
+                if update.get('done'):
+                    for error in update['errors']:
+                        print(f'line {error["line"]}: {error["error"]}', file=sys.stderr)
+                    print(f'imported {update["imported"]} {args.kind}, rejected {update["rejected"]} '
+                          f'of {update["processed"]} in {update["elapsed"]}s')
+                else:
+                    print(f'... {update["processed"]} processed, {update["imported"]} imported', file=sys.stderr)
+        sys.exit(0)
+
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for text in export_records(db.connection, args.kind, args.format, args.lesson_id):
+            out.write(text)
+    finally:
+        if args.output:
+            out.close()
@@ -0,0 +1,242 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Read-through cache for content that only changes when a teacher edits it
+# (lesson list pages, lesson + quiz questions). Each worker keeps a bounded LRU with TTL;
+# with CACHE_SHARED_PATH set, workers also share entries through a small SQLite file
+# and see each other's invalidations via a generation counter stored next to them.
+# Lesson keys carry the 'lessons' version from data_versions (httpcache.py), which the
+# triggers bump on every lesson or question write in any process, so no worker can load an
+# entry from before a write under a key built after it; invalidation only frees memory.
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '300'))
+CACHE_SHARED_PATH = os.environ.get('CACHE_SHARED_PATH')
+GENERATION_CHECK_INTERVAL = 1.0
+
+_MISSING = object()
+
+
+class SQLiteCacheBackend:
+    # Shared second level for several worker processes on one box. Values are JSON.
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO cache_generation (id, generation) VALUES (1, 0)')
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT value, expires_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return _MISSING, 0
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                     (key, json.dumps(value), expires_at))
+        conn.commit()
+
+    def delete(self, keys, prefixes=()):
+        conn = self._conn()
+        conn.executemany('DELETE FROM cache_entries WHERE key = ?', [(key,) for key in keys])
+        for prefix in prefixes:
+            conn.execute("DELETE FROM cache_entries WHERE key >= ? AND key < ?", (prefix, prefix + '\uffff'))
+        conn.execute('DELETE FROM cache_entries WHERE expires_at < ?', (time.time(),))
+        conn.execute('UPDATE cache_generation SET generation = generation + 1 WHERE id = 1')
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute('DELETE FROM cache_entries')
+        conn.execute('UPDATE cache_generation SET generation = generation + 1 WHERE id = 1')
+        conn.commit()
+
+    def generation(self):
+        return self._conn().execute('SELECT generation FROM cache_generation WHERE id = 1').fetchone()[0]
+
+
+class TTLCache:
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = shared.generation() if shared else 0
+        self._generation_checked = time.monotonic()
+        self._stats = {
+            'hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    def _sync_generation(self):
+        # Drop the local level when another worker invalidated the shared one
+        now = time.monotonic()
+        if self.shared is None or now - self._generation_checked < GENERATION_CHECK_INTERVAL:
+            return
+        self._generation_checked = now
+        generation = self.shared.generation()
+        if generation != self._generation:
+            with self._lock:
+                self._entries.clear()
+                self._generation = generation
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def _set_local(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get(self, key, default=None):
+        self._sync_generation()
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+
+        if self.shared is not None:
+            value, expires_at = self.shared.get(key)
+            if value is not _MISSING:
+                self._set_local(key, value, expires_at)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        self._set_local(key, value, expires_at)
+        if self.shared is not None:
+            self.shared.set(key, value, expires_at)
+
+    def get_or_load(self, key, loader, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *keys, prefixes=()):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            for prefix in prefixes:
+                for key in [k for k in self._entries if k.startswith(prefix)]:
+                    del self._entries[key]
+            self._stats['invalidations'] += 1
+        if self.shared is not None:
+            self.shared.delete(keys, prefixes)
+            self._generation = self.shared.generation()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+        if self.shared is not None:
+            self.shared.clear()
+            self._generation = self.shared.generation()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        stats['shared'] = self.shared is not None
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['shared_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                shared = SQLiteCacheBackend(CACHE_SHARED_PATH) if CACHE_SHARED_PATH else None
+                _cache = TTLCache(shared=shared)
+    return _cache
+
+
+# Lesson content keys, and the hook every lesson/question write calls once it commits
+
+LESSON_LIST_PREFIX = 'lessons:'
+
+
+def lessons_version(cursor):
+    cursor.execute("SELECT version FROM data_versions WHERE scope = 'lessons'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def lesson_key(lesson_id, version):
+    return f'lesson:{lesson_id}:v{version}'
+
+
+def lesson_questions_key(lesson_id, version):
+    return f'lesson:{lesson_id}:questions:v{version}'
+
+
+def lesson_page_key(topic, after, limit, version):
+    return f'{LESSON_LIST_PREFIX}{topic or ""}:{after or ""}:{limit}:v{version}'
+
+
+def invalidate_lessons():
+    get_cache().invalidate(prefixes=('lesson:', LESSON_LIST_PREFIX))
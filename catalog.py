@@ -0,0 +1,75 @@
+import base64
+import json
+
+# Lesson catalogue queries. List views never select lessons.content and page with a
+# (created_at, id) keyset cursor, so each page is an index range scan whatever the
+# table size (idx_lessons_created_at / idx_lessons_topic_created_at).
+
+LESSONS_PAGE_SIZE = 12
+LESSONS_PAGE_MAX = 100
+
+LESSON_LIST_COLUMNS = ('id', 'title', 'description', 'video_url', 'topic', 'created_by', 'created_at',
+                       'question_count')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, lesson_id):
+    raw = json.dumps([created_at, lesson_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, lesson_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(lesson_id, int):
+        raise InvalidCursor(cursor)
+    return created_at, lesson_id
+
+
+def lesson_page(cursor, topic=None, after=None, limit=LESSONS_PAGE_SIZE):
+    # Returns (lessons as dicts, next cursor or None)
+    limit = max(1, min(int(limit), LESSONS_PAGE_MAX))
+    where = []
+    params = []
+
+    if topic:
+        where.append('topic = ?')
+        params.append(topic)
+    if after:
+        created_at, lesson_id = decode_cursor(after)
+        where.append('(created_at, id) < (?, ?)')
+        params.extend([created_at, lesson_id])
+
+    sql = '''SELECT id, title, description, video_url, topic, created_by, created_at,
+                    (SELECT COUNT(*) FROM quiz_questions q WHERE q.lesson_id = lessons.id)
+             FROM lessons'''
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    params.append(limit + 1)
+
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][6], rows[-1][0])
+
+    return [dict(zip(LESSON_LIST_COLUMNS, row)) for row in rows], next_cursor
+
+
+def load_lesson(cursor, lesson_id):
+    # Questions are served per quiz attempt by quiz.py, the page only needs their count
+    cursor.execute('SELECT * FROM lessons WHERE id = ?', (lesson_id,))
+    lesson = cursor.fetchone()
+
+    cursor.execute('SELECT COUNT(*) FROM quiz_questions WHERE lesson_id = ?', (lesson_id,))
+    question_count = cursor.fetchone()[0]
+    return lesson, question_count
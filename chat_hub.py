@@ -0,0 +1,373 @@
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque, defaultdict
+from datetime import datetime
+
+from flask import Response
+from werkzeug.wsgi import ClosingIterator
+
+import db
+
+# Chat fan-out. Each worker process runs one ChatHub with a single background thread that
+#   * flushes posted messages into chat_messages with one executemany per batch,
+#   * tails chat_messages by id and fans new rows out to the local subscribers of each room,
+#   * heartbeats local connections into chat_presence and pushes per-room online counts.
+# Tailing the table is what makes messages posted in one worker reach subscribers of another
+# without a broker. Subscribers are plain queues: the SSE stream blocks on an Event, holding one
+# of the worker's request threads, so open streams of both hubs share a budget of
+# SSE_MAX_STREAMS per process (open_stream, sized in gunicorn.conf.py); past it a page is told
+# to reconnect later. Joins and leaves are written to chat_presence by the hub thread too, one
+# transaction per cycle, so a class opening the chat at once costs one write, not one per
+# connection.
+
+ROOM_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+MESSAGE_MAX_LENGTH = 2000
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 200
+REPLAY_LIMIT = 200
+
+FLUSH_INTERVAL = 0.1
+POLL_INTERVAL = 0.2
+PRESENCE_INTERVAL = 10.0
+PRESENCE_TTL = 30.0
+HEARTBEAT_INTERVAL = 15.0
+SUBSCRIBER_BACKLOG = 500
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '48'))
+SSE_RETRY_AFTER = int(os.environ.get('SSE_RETRY_AFTER', '10'))
+BATCH_SIZE = 200
+
+CHAT_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS chat_presence (
+        connection_id TEXT PRIMARY KEY,
+        room_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        last_seen REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_chat_presence_room ON chat_presence (room_id, last_seen, user_id)',
+]
+
+MESSAGE_COLUMNS = '''c.id, c.room_id, c.sender_id, u.username, u.user_type, c.message, c.sent_at
+                     FROM chat_messages c LEFT JOIN users u ON u.id = c.sender_id'''
+
+
+def valid_room(room_id):
+    return bool(ROOM_PATTERN.match(room_id or ''))
+
+
+def _message(row):
+    return {
+        'id': row[0],
+        'room_id': row[1],
+        'sender_id': row[2],
+        'sender': row[3],
+        'sender_type': row[4],
+        'message': row[5],
+        'sent_at': str(row[6]),
+    }
+
+
+def load_history(cursor, room_id, before=None, limit=HISTORY_PAGE_SIZE):
+    # Newest page first, walking back by id on idx_chat_messages_room; returned oldest-first
+    limit = max(1, min(int(limit), HISTORY_PAGE_MAX))
+    if before:
+        cursor.execute(f'''SELECT {MESSAGE_COLUMNS} WHERE c.room_id = ? AND c.id < ?
+                           ORDER BY c.id DESC LIMIT ?''', (room_id, before, limit))
+    else:
+        cursor.execute(f'''SELECT {MESSAGE_COLUMNS} WHERE c.room_id = ?
+                           ORDER BY c.id DESC LIMIT ?''', (room_id, limit))
+    rows = cursor.fetchall()
+    messages = [_message(row) for row in reversed(rows)]
+    next_before = messages[0]['id'] if len(rows) == limit else None
+    return messages, next_before
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscriber:
+
+    def __init__(self, room_id, user_id):
+        self.id = secrets.token_hex(8)
+        self.room_id = room_id
+        self.user_id = user_id
+        self.last_id = 0
+        self._events = deque(maxlen=SUBSCRIBER_BACKLOG)
+        self._ready = threading.Event()
+
+    def push(self, event, data):
+        self._events.append((event, data))
+        self._ready.set()
+
+    def wait(self, timeout):
+        self._ready.wait(timeout)
+        self._ready.clear()
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+
+class ChatHub:
+
+    def __init__(self):
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # Presence rows still to insert and delete, guarded by _pending_lock
+        self._joined = []
+        self._left = []
+        self._rooms = defaultdict(set)
+        self._rooms_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._presence = {}
+        self._last_id = None
+        self._last_presence = 0.0
+        self._stats = {'posted': 0, 'flushes': 0, 'delivered': 0}
+        self._thread = threading.Thread(target=self._run, name='chat-hub', daemon=True)
+        self._thread.start()
+
+    # Public API used by the routes
+
+    def post(self, room_id, sender_id, message):
+        with self._pending_lock:
+            self._pending.append((room_id, sender_id, message, datetime.now()))
+            self._stats['posted'] += 1
+            full = len(self._pending) >= BATCH_SIZE
+        if full:
+            self._wake.set()
+
+    def subscribe(self, room_id, user_id):
+        subscriber = Subscriber(room_id, user_id)
+        with self._rooms_lock:
+            self._rooms[room_id].add(subscriber)
+        with self._pending_lock:
+            self._joined.append((subscriber.id, room_id, user_id, time.time()))
+        self._last_presence = 0.0
+        self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._rooms_lock:
+            members = self._rooms.get(subscriber.room_id)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self._rooms[subscriber.room_id]
+        with self._pending_lock:
+            self._left.append((subscriber.id,))
+        self._last_presence = 0.0
+        self._wake.set()
+
+    def online_count(self, room_id):
+        return self._presence.get(room_id, 0)
+
+    def stats(self):
+        with self._rooms_lock:
+            rooms = {room_id: len(members) for room_id, members in self._rooms.items()}
+        with self._pending_lock:
+            stats = dict(self._stats, pending=len(self._pending))
+        stats['local_connections'] = sum(rooms.values())
+        stats['rooms'] = rooms
+        return stats
+
+    # Background loop
+
+    def _run(self):
+        # Only messages written after the hub started are fanned out; older ones are history
+        while self._last_id is None:
+            try:
+                with db.get_pool().connection() as conn:
+                    self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM chat_messages').fetchone()[0]
+            except Exception:
+                time.sleep(POLL_INTERVAL)
+
+        last_poll = 0.0
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self._flush()
+                self._sync_presence()
+                now = time.monotonic()
+                if now - last_poll >= POLL_INTERVAL:
+                    last_poll = now
+                    self._poll()
+                if now - self._last_presence >= PRESENCE_INTERVAL:
+                    self._last_presence = now
+                    self._refresh_presence()
+            except Exception:
+                # Keep the hub alive; the next cycle retries the same batch
+                time.sleep(POLL_INTERVAL)
+
+    def _flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with db.get_pool().connection() as conn:
+                conn.executemany('INSERT INTO chat_messages (room_id, sender_id, message, sent_at) VALUES (?, ?, ?, ?)',
+                                 batch)
+                conn.commit()
+        except Exception:
+            with self._pending_lock:
+                self._pending[:0] = batch
+            raise
+        self._stats['flushes'] += 1
+        # Deliver our own messages without waiting for the next poll tick
+        self._poll()
+
+    def _sync_presence(self):
+        with self._pending_lock:
+            joined, self._joined = self._joined, []
+            left, self._left = self._left, []
+        if not joined and not left:
+            return
+        try:
+            with db.get_pool().connection() as conn:
+                # Inserts first: a connection that came and went within one cycle leaves no row
+                conn.executemany('''INSERT OR REPLACE INTO chat_presence (connection_id, room_id, user_id, last_seen)
+                                    VALUES (?, ?, ?, ?)''', joined)
+                conn.executemany('DELETE FROM chat_presence WHERE connection_id = ?', left)
+                conn.commit()
+        except Exception:
+            with self._pending_lock:
+                self._joined[:0] = joined
+                self._left[:0] = left
+            raise
+
+    def _local_rooms(self):
+        with self._rooms_lock:
+            return {room_id: list(members) for room_id, members in self._rooms.items()}
+
+    def _poll(self):
+        with db.get_pool().connection() as conn:
+            cursor = conn.cursor()
+            rooms = self._local_rooms()
+            if not rooms:
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM chat_messages')
+                self._last_id = cursor.fetchone()[0]
+                return
+
+            while True:
+                cursor.execute(f'SELECT {MESSAGE_COLUMNS} WHERE c.id > ? ORDER BY c.id LIMIT ?',
+                               (self._last_id, BATCH_SIZE))
+                rows = cursor.fetchall()
+                for row in rows:
+                    message = _message(row)
+                    for subscriber in rooms.get(message['room_id'], ()):
+                        subscriber.push('message', message)
+                        self._stats['delivered'] += 1
+                    self._last_id = message['id']
+                if len(rows) < BATCH_SIZE:
+                    break
+
+    def _refresh_presence(self):
+        rooms = self._local_rooms()
+        now = time.time()
+        with db.get_pool().connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('UPDATE chat_presence SET last_seen = ? WHERE connection_id = ?',
+                               [(now, subscriber.id) for members in rooms.values() for subscriber in members])
+            # Rows of workers that died without unsubscribing
+            cursor.execute('DELETE FROM chat_presence WHERE last_seen < ?', (now - PRESENCE_TTL,))
+            conn.commit()
+
+            if not rooms:
+                self._presence = {}
+                return
+            placeholders = ','.join('?' * len(rooms))
+            cursor.execute(f'''SELECT room_id, COUNT(DISTINCT user_id) FROM chat_presence
+                               WHERE room_id IN ({placeholders}) AND last_seen >= ?
+                               GROUP BY room_id''', list(rooms) + [now - PRESENCE_TTL])
+            counts = dict(cursor.fetchall())
+
+        for room_id, members in rooms.items():
+            count = counts.get(room_id, 0)
+            if self._presence.get(room_id) != count:
+                for subscriber in members:
+                    subscriber.push('presence', {'room_id': room_id, 'online': count})
+        self._presence = counts
+
+
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+def open_stream(events):
+    # Takes one of the process' stream slots for an SSE response body, or returns None when
+    # all are in use. The slot is given back on close(), which the server calls however the
+    # response ends, even when the generator never started.
+    if not _stream_slots.acquire(blocking=False):
+        return None
+    return ClosingIterator(events, _stream_slots.release)
+
+
+def busy_stream():
+    # Answer for a stream past the budget. EventSource gives up for good on any status but
+    # 200, so this is an empty stream whose retry: tells the page to come back later; it
+    # reconnects by itself and keeps its Last-Event-ID.
+    return Response(f'retry: {SSE_RETRY_AFTER * 1000}\n\n', mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'Retry-After': str(SSE_RETRY_AFTER)})
+
+
+_hub = None
+_hub_pid = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    # Started lazily so the background thread is created in the worker, not before fork
+    global _hub, _hub_pid
+    if _hub is None or _hub_pid != os.getpid():
+        with _hub_lock:
+            if _hub is None or _hub_pid != os.getpid():
+                _hub = ChatHub()
+                _hub_pid = os.getpid()
+    return _hub
+
+
+def stream(room_id, user_id, last_event_id=None):
+    # Generator for a text/event-stream response; holds no DB connection while idle
+    hub = get_hub()
+    subscriber = hub.subscribe(room_id, user_id)
+    try:
+        yield 'retry: 3000\n\n'
+        if last_event_id:
+            with db.get_pool().connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''SELECT {MESSAGE_COLUMNS} WHERE c.room_id = ? AND c.id > ?
+                                   ORDER BY c.id LIMIT ?''', (room_id, last_event_id, REPLAY_LIMIT))
+                rows = cursor.fetchall()
+            for row in rows:
+                message = _message(row)
+                subscriber.last_id = message['id']
+                yield format_sse('message', message, message['id'])
+
+        yield format_sse('presence', {'room_id': room_id, 'online': hub.online_count(room_id)})
+
+        while True:
+            events = subscriber.wait(HEARTBEAT_INTERVAL)
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event, data in events:
+                if event == 'message':
+                    if data['id'] <= subscriber.last_id:
+                        continue
+                    subscriber.last_id = data['id']
+                    yield format_sse(event, data, data['id'])
+                else:
+                    yield format_sse(event, data)
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,206 @@
+import sqlite3
+import threading
+import queue
+import time
+import os
+from contextlib import contextmanager
+from functools import wraps
+from flask import g
+
+DATABASE = os.environ.get('ISLAMIC_APP_DB', 'islamic_app.db')
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', '5000'))
+MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+BUSY_RETRIES = 3
+
+# Callables run on every new pooled connection (instrumentation, benchmarks)
+CONNECT_HOOKS = []
+# sqlite3.Connection subclass used for pooled connections (see instrumentation.py)
+CONNECTION_FACTORY = sqlite3.Connection
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    # Fixed-size pool of SQLite connections shared by all request threads of a worker.
+    # Connections are opened lazily, configured once, and reused until the process exits.
+
+    def __init__(self, database=DATABASE, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'timeouts': 0,
+            'busy_retries': 0,
+            'connections_opened': 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=BUSY_TIMEOUT_MS / 1000.0, check_same_thread=False,
+                               factory=CONNECTION_FACTORY)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        for hook in CONNECT_HOOKS:
+            hook(conn)
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    self._stats['connections_opened'] += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeout('no database connection available')
+                waited = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_ms'] += waited
+                    self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited)
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+        return conn
+
+    def release(self, conn):
+        # Never hand an open transaction to the next request
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        # finally, not except/else: a streamed response closed early ends its generator with
+        # GeneratorExit, which is not an Exception, and the connection must still come back
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def record_busy_retry(self):
+        with self._lock:
+            self._stats['busy_retries'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['avg_wait_ms'] = round(stats['wait_time_ms'] / stats['waits'], 3) if stats['waits'] else 0.0
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 3)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        return stats
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # One pool per process: a pool inherited over fork() must not be reused
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool()
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def connection():
+    return get_pool().connection()
+
+
+def get_db():
+    # Connection bound to the current app context, returned to the pool on teardown
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(view):
+    # Retry a write that lost the race for the WAL write lock after busy_timeout expired
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return view(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == BUSY_RETRIES:
+                    raise
+                conn = g.get('db')
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+                get_pool().record_busy_retry()
+                time.sleep(0.05 * (2 ** attempt))
+    return wrapper
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
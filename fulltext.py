@@ -0,0 +1,296 @@
+import html
+import os
+import re
+import sys
+
+# Full-text search over lessons (title, description, content) and quiz questions with FTS5.
+# Text is normalized before it is indexed and before it is queried: tashkeel, Quranic marks and
+# tatweel are dropped, alef forms become bare alef, alef maqsura becomes ya and ta marbuta
+# becomes ha, so a query matches regardless of vocalization or spelling variant.
+# The triggers do the normalization in plain SQL (chained replace()), so rows written by any
+# connection, including the sqlite3 shell, stay indexed; normalize() is the same table in Python.
+# Each source row owns one index row: rowid 2*id for lessons, 2*id + 1 for questions.
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 50
+SEARCH_OFFSET_MAX = 1000
+QUERY_TERMS_MAX = 8
+SNIPPET_TOKENS = 16
+NORMALIZE_DEPTH = 20
+# Relevance trade-off: bm25 is computed for at most this many matches, the newest ones. Up to
+# that, ranking is exact; a broader query ranks only its newest RANK_CANDIDATES matches, so an
+# older lesson that would score best can be missing from its results. Raise it for a larger
+# catalogue at the cost of slower broad queries.
+RANK_CANDIDATES = int(os.environ.get('SEARCH_RANK_CANDIDATES', '5000'))
+# bm25 weights per column (kind, lesson_id, title, body): titles weigh ten times the body
+BM25_WEIGHTS = '0.0, 0.0, 10.0, 1.0'
+ARTICLE_PREFIXES = ('ال', 'وال', 'فال', 'بال', 'كال', 'لل')
+
+# Harakat and tanwin, superscript alef, tatweel, Quranic annotation marks
+_REMOVED_RANGES = [(0x064B, 0x065F), (0x0670, 0x0670), (0x0640, 0x0640), (0x06D6, 0x06ED)]
+_REMOVED = [chr(c) for first, last in _REMOVED_RANGES for c in range(first, last + 1)]
+_REPLACED = {
+    'آ': 'ا',  # alef with madda
+    'أ': 'ا',  # alef with hamza above
+    'إ': 'ا',  # alef with hamza below
+    'ٱ': 'ا',  # alef wasla
+    'ى': 'ي',  # alef maqsura -> ya
+    'ة': 'ه',  # ta marbuta -> ha
+}
+NORMALIZE_TABLE = {ord(c): None for c in _REMOVED}
+NORMALIZE_TABLE.update({ord(c): r for c, r in _REPLACED.items()})
+# A word of the original text, marks included (\w alone would split a vocalized word)
+WORD_PATTERN = re.compile('([\\w' + ''.join(chr(first) if first == last else f'{chr(first)}-{chr(last)}'
+                                             for first, last in _REMOVED_RANGES) + ']+)')
+
+def normalize(text):
+    return (text or '').translate(NORMALIZE_TABLE)
+
+
+def _replace_chain(expr, steps):
+    # Literal characters rather than char(n): one function call less per step and row
+    for c, r in steps:
+        expr = f"replace({expr}, '{c}', '{r}')"
+    return expr
+
+
+def normalize_select(passthrough, normalized, source=''):
+    # SELECT applying NORMALIZE_TABLE to the normalized columns in plain SQL. SQLite's parser
+    # stack only takes ~25 nested calls, so the removals are split over nested subqueries of
+    # NORMALIZE_DEPTH steps each, and skipped for text without any of those marks (one GLOB
+    # over the code point ranges, far cheaper than ~50 replace() calls). Other columns pass through.
+    marks = ''.join(chr(first) if first == last else f'{chr(first)}-{chr(last)}' for first, last in _REMOVED_RANGES)
+    removals = [(c, '') for c in _REMOVED]
+    chunks = [removals[i:i + NORMALIZE_DEPTH] for i in range(0, len(removals), NORMALIZE_DEPTH)]
+    names = [name for name, _ in passthrough]
+
+    columns = [f'{expr} AS {name}' for name, expr in passthrough]
+    for name, expr in normalized:
+        columns.append(f'{_replace_chain(expr, _REPLACED.items())} AS {name}')
+        columns.append(f"({expr}) GLOB '*[{marks}]*' AS {name}_marked")
+    sql = f'SELECT {", ".join(columns)} {source}'.rstrip()
+
+    for index, chunk in enumerate(chunks):
+        last = index == len(chunks) - 1
+        columns = list(names)
+        for name, _ in normalized:
+            columns.append(f'CASE WHEN {name}_marked THEN {_replace_chain(name, chunk)} ELSE {name} END AS {name}')
+            if not last:
+                columns.append(f'{name}_marked')
+        sql = f'SELECT {", ".join(columns)} FROM ({sql})'
+    return sql
+
+
+def _lesson_select(alias, source=''):
+    return normalize_select(
+        [('rid', f'{alias}.id * 2'), ('kind', "'lesson'"), ('lesson_id', f'{alias}.id')],
+        [('title', f"COALESCE({alias}.title, '')"),
+         ('body', f"COALESCE({alias}.description, '') || ' ' || COALESCE({alias}.content, '')")],
+        source)
+
+
+def _question_select(alias, source=''):
+    return normalize_select(
+        [('rid', f'{alias}.id * 2 + 1'), ('kind', "'question'"), ('lesson_id', f'{alias}.lesson_id'), ('title', "''")],
+        [('body', f"COALESCE({alias}.question, '')")],
+        source)
+
+
+INDEX_INSERT = 'INSERT INTO search_index (rowid, kind, lesson_id, title, body)'
+
+
+SEARCH_SCHEMA_V1 = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        kind UNINDEXED,
+        lesson_id UNINDEXED,
+        title,
+        body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_lessons_search_insert AFTER INSERT ON lessons BEGIN
+        {INDEX_INSERT} {_lesson_select('NEW')};
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_lessons_search_update AFTER UPDATE OF title, description, content ON lessons BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2;
+        {INDEX_INSERT} {_lesson_select('NEW')};
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_lessons_search_delete AFTER DELETE ON lessons BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_quiz_questions_search_insert AFTER INSERT ON quiz_questions BEGIN
+        {INDEX_INSERT} {_question_select('NEW')};
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_quiz_questions_search_update AFTER UPDATE OF question, lesson_id ON quiz_questions BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2 + 1;
+        {INDEX_INSERT} {_question_select('NEW')};
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_quiz_questions_search_delete AFTER DELETE ON quiz_questions BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2 + 1;
+    END
+    ''',
+]
+
+
+def rebuild_search_index(cursor):
+    cursor.execute('DELETE FROM search_index')
+    cursor.execute(f'{INDEX_INSERT} {_lesson_select("l", "FROM lessons l")}')
+    cursor.execute(f'{INDEX_INSERT} {_question_select("q", "FROM quiz_questions q")}')
+    cursor.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    cursor.execute('SELECT COUNT(*) FROM search_index')
+    return cursor.fetchone()[0]
+
+
+def _is_arabic(term):
+    return '\u0600' <= term[0] <= '\u06ff'
+
+
+def _variants(term):
+    # There is no stemmer, so an Arabic word is also looked up with the definite article and
+    # the particles that attach to it (كتاب finds الكتاب, والكتاب, بالكتاب ...), whichever form
+    # was typed
+    if not _is_arabic(term):
+        return [term]
+    base = term
+    for article in sorted(ARTICLE_PREFIXES, key=len, reverse=True):
+        if term.startswith(article):
+            if len(term) - len(article) < 3:
+                # الله, لله: too short to be article + word
+                return [term]
+            base = term[len(article):]
+            break
+    return [base] + [article + base for article in ARTICLE_PREFIXES]
+
+
+def query_terms(text):
+    # [(variants, is prefix)]: every term must match, the last one as a prefix so results
+    # follow typing
+    terms = re.findall(r'\w+', normalize(text).lower())[:QUERY_TERMS_MAX]
+    return [(_variants(term), index == len(terms) - 1) for index, term in enumerate(terms)]
+
+
+def build_query(terms):
+    # Terms are quoted, so FTS5 operators in user input are searched for, not executed
+    parts = []
+    for variants, prefix in terms:
+        star = '*' if prefix else ''
+        parts.append('(' + ' OR '.join(f'"{variant}"{star}' for variant in variants) + ')')
+    return ' AND '.join(parts)
+
+
+def _matches(word, terms):
+    for variants, prefix in terms:
+        for variant in variants:
+            if word == variant or (prefix and word.startswith(variant)):
+                return True
+    return False
+
+
+def make_snippet(body, terms, size=SNIPPET_TOKENS):
+    # Built here rather than with FTS5 snippet(): that re-runs the whole MATCH per row, which for
+    # prefix terms means re-merging every matching doclist. body is the original text, as the
+    # lesson shows it; words are normalized only to be matched. HTML-escaped, hits in <mark>.
+    pieces = WORD_PATTERN.split(body or '')
+    words = [index for index in range(1, len(pieces), 2)]
+    hits = [index for index in words if _matches(normalize(pieces[index]).lower(), terms)]
+
+    first = words.index(hits[0]) if hits else 0
+    start = max(0, first - size // 4)
+    window = words[start:start + size]
+    if not window:
+        return ''
+
+    out = ['…'] if start > 0 else []
+    for index in range(window[0], window[-1] + 1):
+        piece = html.escape(pieces[index])
+        out.append(f'<mark>{piece}</mark>' if index in hits else piece)
+    if start + size < len(words):
+        out.append('…')
+    return ''.join(out).strip()
+
+
+def search(cursor, text, kind=None, limit=SEARCH_PAGE_SIZE, offset=0):
+    # Returns (results, next offset or None); snippets are HTML-escaped with <mark> around hits
+    limit = max(1, min(int(limit), SEARCH_PAGE_MAX))
+    offset = max(0, min(int(offset), SEARCH_OFFSET_MAX))
+    terms = query_terms(text)
+    if not terms:
+        return [], None
+
+    # bm25 is scored for at most RANK_CANDIDATES matches, newest first, so a query matching
+    # most of the catalogue costs the same as a selective one
+    sql = f'''SELECT rid, kind, lesson_id FROM (
+                 SELECT rowid AS rid, kind, lesson_id, bm25(search_index, {BM25_WEIGHTS}) AS score
+                 FROM search_index WHERE search_index MATCH ?{' AND kind = ?' if kind else ''}
+                 ORDER BY rowid DESC LIMIT ?)
+             ORDER BY score, rid DESC LIMIT ? OFFSET ?'''
+    params = [build_query(terms)] + ([kind] if kind else []) + [RANK_CANDIDATES, limit + 1, offset]
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    next_offset = offset + limit if len(rows) > limit and offset + limit <= SEARCH_OFFSET_MAX else None
+    rows = rows[:limit]
+    if not rows:
+        return [], None
+
+    # Snippets come from the source rows: the index holds the normalized text
+    bodies = {}
+    for row_kind, sql in (('lesson', "SELECT id * 2, COALESCE(description, '') || ' ' || COALESCE(content, '') "
+                                     'FROM lessons'),
+                          ('question', 'SELECT id * 2 + 1, question FROM quiz_questions')):
+        ids = [row[0] // 2 for row in rows if row[1] == row_kind]
+        if ids:
+            cursor.execute(f'{sql} WHERE id IN ({",".join("?" * len(ids))})', ids)
+            bodies.update(cursor.fetchall())
+
+    lessons = {}
+    lesson_ids = sorted({row[2] for row in rows if row[2] is not None})
+    if lesson_ids:
+        cursor.execute(f'SELECT id, title, topic FROM lessons WHERE id IN ({",".join("?" * len(lesson_ids))})',
+                       lesson_ids)
+        lessons = {row[0]: row for row in cursor.fetchall()}
+
+    results = []
+    for rowid, row_kind, lesson_id in rows:
+        lesson = lessons.get(lesson_id)
+        if lesson is None:
+            continue
+        results.append({
+            'type': row_kind,
+            'id': rowid // 2,
+            'lesson_id': lesson_id,
+            'lesson_title': lesson[1],
+            'topic': lesson[2],
+            'snippet': make_snippet(bodies.get(rowid), terms),
+        })
+    return results, next_offset
+
+
+if __name__ == '__main__':
+    import db
+
+    if sys.argv[1:] not in (['rebuild'], ['optimize']):
+        print('usage: python fulltext.py rebuild|optimize')
+        sys.exit(1)
+
+    with db.get_pool().connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor()
+        if sys.argv[1] == 'rebuild':
+            rows = rebuild_search_index(cursor)
+            print(f'indexed {rows} row(s)')
+        else:
+            cursor.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+            print('search index optimized')
+        conn.commit()
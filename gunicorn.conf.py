@@ -0,0 +1,35 @@
+import multiprocessing
+import os
+
+# Production launcher: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app is imported once in the master (preload_app): schema init, secret loading and
+# template compilation happen before fork, so workers start serving immediately and share
+# those pages copy-on-write. Pools (db, auth, chat and live hubs) are per-process and open lazily.
+#
+# Workers are gthread: SQLite calls block the calling thread, and under gevent they would
+# block the whole worker's loop instead, job worker and hub threads included. Chat and live
+# session streams (SSE) hold a request thread for as long as a page is open, so each worker
+# runs GUNICORN_THREADS threads of which at most SSE_MAX_STREAMS serve streams
+# (chat_hub.open_stream); the rest always answer ordinary requests, and a stream past the
+# budget is told to reconnect a little later.
+worker_class = 'gthread'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', str(min(4, multiprocessing.cpu_count() * 2))))
+# SQLite allows one writer at a time, so a few processes with several threads each beat many
+# single-threaded processes. Idle stream threads only wait on an Event.
+threads = int(os.environ.get('GUNICORN_THREADS', '64'))
+# Read by chat_hub when the app is imported below (preload_app)
+os.environ.setdefault('SSE_MAX_STREAMS', str(max(1, threads * 3 // 4)))
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = 500
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import threading
+from functools import wraps
+
+from flask import Response, make_response, request, session
+from markupsafe import Markup
+
+import cache
+from db import get_db
+
+# HTTP caching for pages and JSON endpoints. A cached view declares which data it shows as
+# scopes ('lessons', 'student' for the logged-in student's progress); every scope has a
+# version counter in data_versions that triggers bump on each write to the underlying
+# tables, whichever code path or process does it. The ETag of a response is a hash of the
+# URL, the user (for per-user views), the scope versions and the build of the templates, so
+#   * a browser revalidating with If-None-Match gets a 304 after one primary-key read,
+#     without the view querying or rendering anything,
+#   * a miss is served from the response cache when any user already rendered the same
+#     shared response, or the same user the same page. That is a TTLCache of its own, local to
+#     the worker and bounded by HTTP_CACHE_MAX_ENTRIES, so whole pages never push lessons and
+#     questions out of the content cache (cache.py),
+#   * a write moves the version and with it every key built on it: nothing is deleted.
+# Responses that carry flashed messages are never cached.
+
+DEFAULT_CACHE_CONTROL = 'private, no-cache'
+RESPONSE_TTL = float(os.environ.get('HTTP_CACHE_TTL', '600'))
+FRAGMENT_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL', '3600'))
+RESPONSE_MAX_ENTRIES = int(os.environ.get('HTTP_CACHE_MAX_ENTRIES', '256'))
+
+# Global scopes have one counter; per-student scopes one per student ('student:<id>')
+GLOBAL_SCOPES = ('lessons',)
+STUDENT_SCOPES = ('student',)
+
+
+def _bump(scope_expr, guard=True):
+    insert = f'''INSERT INTO data_versions (scope, version) SELECT {scope_expr}, 0
+                 WHERE NOT EXISTS (SELECT 1 FROM data_versions WHERE scope = {scope_expr});''' if guard else ''
+    return f'''{insert}
+               UPDATE data_versions SET version = version + 1 WHERE scope = {scope_expr};'''
+
+
+def _version_triggers():
+    statements = []
+    for table in ('lessons', 'quiz_questions'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            statements.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN {_bump("'lessons'", guard=False)} END''')
+    for table in ('student_progress', 'quran_progress'):
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            statements.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table} WHEN {row}.student_id IS NOT NULL
+                BEGIN {_bump(f"'student:' || {row}.student_id")} END''')
+    return statements
+
+
+DATA_VERSIONS_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+] + [f"INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('{scope}', 0)" for scope in GLOBAL_SCOPES] \
+  + _version_triggers()
+
+DATA_VERSIONS_SCHEMA_V2 = [
+    # A new attendance day (login) moves attendance_days in student_stats
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_student_activity_days_insert_version
+    AFTER INSERT ON student_activity_days
+    BEGIN {_bump("'student:' || NEW.student_id")} END
+    ''',
+]
+
+
+def _scope_keys(scopes, student_id):
+    keys = []
+    for scope in scopes:
+        if scope in STUDENT_SCOPES:
+            keys.append(f'{scope}:{student_id}')
+        elif scope in GLOBAL_SCOPES:
+            keys.append(scope)
+        else:
+            raise ValueError(f'unknown cache scope: {scope}')
+    return keys
+
+
+def data_versions(cursor, keys):
+    if not keys:
+        return {}
+    cursor.execute(f'SELECT scope, version FROM data_versions WHERE scope IN ({",".join("?" * len(keys))})', keys)
+    versions = dict(cursor.fetchall())
+    return {key: versions.get(key, 0) for key in keys}
+
+
+_build = None
+_build_lock = threading.Lock()
+
+
+def build_version():
+    # Changes whenever a template or static file changes, so a deploy invalidates every ETag
+    global _build
+    if _build is None:
+        with _build_lock:
+            if _build is None:
+                digest = hashlib.sha1(os.environ.get('APP_VERSION', '').encode())
+                root = os.path.dirname(os.path.abspath(__file__))
+                for folder in ('templates', 'static'):
+                    for directory, _, files in sorted(os.walk(os.path.join(root, folder))):
+                        for name in sorted(files):
+                            stat = os.stat(os.path.join(directory, name))
+                            digest.update(f'{directory}/{name}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+                _build = digest.hexdigest()[:12]
+    return _build
+
+
+_responses = None
+_responses_lock = threading.Lock()
+
+
+def get_response_cache():
+    # Rendered responses and template fragments
+    global _responses
+    if _responses is None:
+        with _responses_lock:
+            if _responses is None:
+                _responses = cache.TTLCache(max_entries=RESPONSE_MAX_ENTRIES, ttl=RESPONSE_TTL)
+    return _responses
+
+
+def cached(*scopes, per_user=True, cache_control=DEFAULT_CACHE_CONTROL, store=True, vary=None, student=None):
+    # per_user=False shares one cached response between all logged-in users; only for views
+    # whose output does not depend on who asks (no navbar, no session data). vary is a
+    # callable for anything else the output depends on (today's date, a file version).
+    # student returns the id whose 'student' scope the view shows when that is not always
+    # the logged-in user (a teacher looking at one of their students).
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or 'user_id' not in session or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            versions = data_versions(get_db().cursor(),
+                                     _scope_keys(scopes, student() if student else session['user_id']))
+            identity = f'{session["user_id"]}:{session.get("user_type")}:{session.get("username")}' if per_user else '*'
+            key = (f'{request.endpoint}|{request.full_path}|{identity}|{sorted(versions.items())}|{build_version()}|'
+                   f'{vary() if vary else ""}')
+            etag = hashlib.sha1(key.encode()).hexdigest()[:24]
+
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                entry = get_response_cache().get(f'http:{etag}') if store else None
+                if entry is not None:
+                    response = Response(entry['body'], mimetype=entry['mimetype'])
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        return response
+                    if store:
+                        get_response_cache().set(f'http:{etag}', {'body': response.get_data(as_text=True),
+                                                                  'mimetype': response.mimetype})
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def fragment(name, *vary, caller):
+    # {% call fragment('navbar', session.user_type) %}...{% endcall %}: the block is rendered
+    # once per build and vary values, then reused from the cache
+    key = f'fragment:{name}:{build_version()}:{":".join(str(value) for value in vary)}'
+    html = get_response_cache().get(key)
+    if html is None:
+        html = str(caller())
+        get_response_cache().set(key, html, FRAGMENT_TTL)
+    return Markup(html)
+
+
+def init_app(app):
+    app.jinja_env.globals['fragment'] = fragment
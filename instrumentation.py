@@ -0,0 +1,303 @@
+import cProfile
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import Response, current_app, g, has_app_context, jsonify, request, session, before_render_template, template_rendered
+
+import db
+
+# Opt-in per-request instrumentation (INSTRUMENT=1). Every request is counted and timed;
+# a sampled fraction (INSTRUMENT_SAMPLE_RATE) additionally records SQL statements and their
+# time through an instrumented sqlite3 connection class installed in the pool, template render
+# time and response size, and gets a Server-Timing header. With PROFILE_DIR set, sampled
+# requests run under cProfile and the profile is kept when they exceed SLOW_REQUEST_MS.
+# Metrics are per worker process, served as Prometheus text on /metrics.
+
+INSTRUMENT = os.environ.get('INSTRUMENT', '0') == '1'
+INSTRUMENT_SAMPLE_RATE = float(os.environ.get('INSTRUMENT_SAMPLE_RATE', '0.1'))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ADMIN_TYPES = ('developer', 'main_teacher', 'teacher')
+
+
+class RequestMetrics:
+    __slots__ = ('sql_count', 'sql_time', 'template_time', 'template_started', 'profiler')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_started = None
+        self.profiler = None
+
+
+def _current():
+    # Only the sampled request being served on this thread is charged
+    if has_app_context():
+        return g.get('request_metrics')
+    return None
+
+
+def _charge(started):
+    metrics = _current()
+    if metrics is not None:
+        metrics.sql_time += time.perf_counter() - started
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Row fetching is where SQLite steps most SELECTs, so it is timed as well
+
+    def execute(self, sql, parameters=()):
+        metrics = _current()
+        if metrics is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.sql_count += 1
+            metrics.sql_time += time.perf_counter() - started
+
+    def executemany(self, sql, seq_of_parameters):
+        metrics = _current()
+        if metrics is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.sql_count += 1
+            metrics.sql_time += time.perf_counter() - started
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _charge(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _charge(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _charge(started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute() does not go through cursor(), so route it explicitly
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class MetricsRegistry:
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._durations = {}
+        self._endpoints = {}
+
+    def observe(self, endpoint, method, status, duration, metrics=None, size=None, slow=False):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            histogram = self._durations.get(endpoint)
+            if histogram is None:
+                histogram = self._durations[endpoint] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += 1
+            histogram[2] += duration
+
+            totals = self._endpoints.get(endpoint)
+            if totals is None:
+                totals = self._endpoints[endpoint] = {
+                    'sampled': 0, 'sql_statements': 0, 'sql_seconds': 0.0,
+                    'template_seconds': 0.0, 'response_bytes': 0, 'slow': 0,
+                }
+            if slow:
+                totals['slow'] += 1
+            if metrics is not None:
+                totals['sampled'] += 1
+                totals['sql_statements'] += metrics.sql_count
+                totals['sql_seconds'] += metrics.sql_time
+                totals['template_seconds'] += metrics.template_time
+                totals['response_bytes'] += size or 0
+
+    def render(self):
+        with self._lock:
+            requests = dict(self._requests)
+            durations = {endpoint: (list(h[0]), h[1], h[2]) for endpoint, h in self._durations.items()}
+            endpoints = {endpoint: dict(totals) for endpoint, totals in self._endpoints.items()}
+
+        lines = [
+            '# HELP http_requests_total Requests handled by this worker.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{{endpoint="{_label(endpoint)}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Wall time per request until the response is returned.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for endpoint, (counts, total, seconds) in sorted(durations.items()):
+            label = _label(endpoint)
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{label}",le="+Inf"}} {total}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{label}"}} {total}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{label}"}} {seconds:.6f}')
+
+        for name, key, kind, help_text in (
+            ('http_requests_sampled_total', 'sampled', 'counter', 'Requests with SQL and template instrumentation.'),
+            ('http_request_sql_statements_total', 'sql_statements', 'counter', 'SQL statements run by sampled requests.'),
+            ('http_request_sql_seconds_total', 'sql_seconds', 'counter', 'Time spent in SQLite by sampled requests.'),
+            ('http_request_template_seconds_total', 'template_seconds', 'counter', 'Template render time of sampled requests.'),
+            ('http_response_bytes_total', 'response_bytes', 'counter', 'Response body bytes of sampled requests.'),
+            ('http_slow_requests_total', 'slow', 'counter', f'Requests slower than {SLOW_REQUEST_MS:g} ms.'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for endpoint, totals in sorted(endpoints.items()):
+                value = totals[key]
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{endpoint="{_label(endpoint)}"}} {value}')
+
+        pool = db.pool_stats()
+        lines += [
+            '# TYPE db_pool_connections gauge',
+            f'db_pool_connections{{state="open"}} {pool["open"]}',
+            f'db_pool_connections{{state="in_use"}} {pool["in_use"]}',
+            '# TYPE db_pool_waits_total counter',
+            f'db_pool_waits_total {pool["waits"]}',
+            '# TYPE db_pool_busy_retries_total counter',
+            f'db_pool_busy_retries_total {pool["busy_retries"]}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return re.sub(r'["\\\n]', '_', value)
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    return _registry
+
+
+# Flask hooks
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    if random.random() >= INSTRUMENT_SAMPLE_RATE:
+        return
+    metrics = g.request_metrics = RequestMetrics()
+    if PROFILE_DIR:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return
+        metrics.profiler = profiler
+
+
+def _after_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    duration = time.perf_counter() - started
+    metrics = g.pop('request_metrics', None)
+    endpoint = request.endpoint or 'unmatched'
+    slow = duration * 1000 >= SLOW_REQUEST_MS
+
+    size = None
+    if metrics is not None:
+        if metrics.profiler is not None:
+            metrics.profiler.disable()
+            if slow:
+                _dump_profile(metrics.profiler, endpoint, duration)
+        if not response.is_streamed:
+            size = response.calculate_content_length()
+        app_ms = duration * 1000
+        response.headers['Server-Timing'] = ', '.join([
+            f'app;dur={app_ms:.2f}',
+            f'sql;dur={metrics.sql_time * 1000:.2f};desc="{metrics.sql_count} statements"',
+            f'tpl;dur={metrics.template_time * 1000:.2f}',
+        ])
+
+    _registry.observe(endpoint, request.method, response.status_code, duration, metrics, size, slow)
+    if slow:
+        detail = f' ({metrics.sql_count} statements, {metrics.sql_time * 1000:.1f} ms SQL)' if metrics else ''
+        current_app.logger.warning('slow request %s %s: %.1f ms%s', request.method, request.path, duration * 1000, detail)
+    return response
+
+
+def _dump_profile(profiler, endpoint, duration):
+    name = f'{datetime.now():%Y%m%d-%H%M%S}-{endpoint}-{duration * 1000:.0f}ms-{os.getpid()}.prof'
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    except OSError:
+        pass
+
+
+def _template_started(sender, template, context, **extra):
+    metrics = _current()
+    if metrics is not None:
+        metrics.template_started = time.perf_counter()
+
+
+def _template_finished(sender, template, context, **extra):
+    metrics = _current()
+    if metrics is not None and metrics.template_started is not None:
+        metrics.template_time += time.perf_counter() - metrics.template_started
+        metrics.template_started = None
+
+
+def metrics_view():
+    token_ok = METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    if not token_ok and session.get('user_type') not in ADMIN_TYPES:
+        return jsonify({'error': 'غير مسموح'}), 401
+    return Response(_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    if not INSTRUMENT:
+        return
+    # Must be in place before the pool opens its first connection
+    db.CONNECTION_FACTORY = InstrumentedConnection
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
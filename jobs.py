@@ -0,0 +1,474 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import activity
+import db
+import fulltext
+import progress
+import rankings
+import revision
+import stats
+
+# Durable background jobs in the application database, no broker needed.
+# Routes enqueue a row into jobs in their own transaction and answer right away; workers
+# claim ready rows with one UPDATE ... RETURNING under BEGIN IMMEDIATE, so any number of
+# worker threads and processes on the box can share the table without double-running a job.
+#
+# Two kinds of handler:
+#   * write handlers (lesson completions, Quran page events) take a whole batch.
+#     Up to GROUP_COMMIT_MAX queued jobs of one kind are claimed, applied with one executemany
+#     and marked done in the same transaction: a burst of page turns costs one commit, and a
+#     worker that dies mid-batch leaves every job queued.
+#   * tasks (stats rebuilds, the nightly revision pass, ...) run one at a time outside the
+#     claim transaction and manage their own; a crashed run is requeued once its lease expires.
+# A failing job is retried with exponential backoff and marked failed after max_attempts.
+# The maintenance pass also keeps one revision_nightly job queued for the next night and
+# prunes old weekly leaderboards.
+# Between claims the workers also fold the activity log into its rollups (activity.py).
+#
+# Every web process runs JOB_WORKERS threads (started lazily, after fork). With JOB_WORKERS=0
+# the web processes only enqueue and "python jobs.py worker" does the work.
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '1'))
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '0.1'))
+GROUP_COMMIT_MAX = 500
+MAX_ATTEMPTS = 5
+RETRY_BASE = 2.0
+RETRY_MAX = 300.0
+# A running task renews its lease every LEASE_HEARTBEAT; one not renewed for LEASE_SECONDS
+# belongs to a worker that is gone and is requeued
+LEASE_SECONDS = 600.0
+LEASE_HEARTBEAT = 60.0
+# Finished jobs are kept this long for the status endpoint
+RETENTION_SECONDS = 24 * 3600
+MAINTENANCE_INTERVAL = 60.0
+# Local hour the nightly revision pass (revision.nightly) is scheduled for
+REVISION_NIGHTLY_HOUR = int(os.environ.get('REVISION_NIGHTLY_HOUR', '2'))
+
+JOBS_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 5,
+        run_after REAL NOT NULL,
+        locked_by TEXT,
+        locked_at REAL,
+        created_by INTEGER,
+        created_at REAL NOT NULL,
+        finished_at REAL,
+        last_error TEXT,
+        result TEXT
+    )
+    ''',
+    # Only queued rows are ever claimed, and they are a small part of the table
+    '''CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (kind, run_after, id) WHERE status = 'queued' ''',
+    '''CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL''',
+]
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+# Handlers
+
+def _ts(value):
+    # Payload timestamps went through JSON as str(datetime)
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _quran_progress(cursor, payloads):
+    # Each job is one request's list of page events
+    events = [event for events in payloads for event in events]
+    progress.track_quran_pages(cursor, events)
+    activity.log_events(cursor, [activity.event(event['student_id'], f'page_{event["action"]}', event['page_number'],
+                                                 ts=_ts(event['ts'])) for event in events])
+
+
+def _lesson_completed(cursor, payloads):
+    # Completing a lesson twice is a no-op, also within one batch
+    cursor.executemany('''INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at)
+                          SELECT :student_id, :lesson_id, 100, :ts
+                          WHERE NOT EXISTS (SELECT 1 FROM student_progress
+                                            WHERE student_id = :student_id AND lesson_id = :lesson_id)''', payloads)
+    # A repeated completion is still activity on its day
+    activity.log_events(cursor, [activity.event(p['student_id'], 'lesson', p['lesson_id'], ts=_ts(p['ts']))
+                                 for p in payloads])
+
+
+def _in_transaction(conn, work):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = work(conn.cursor())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def _rebuild_stats(conn, payload):
+    return {'students': _in_transaction(conn, stats.rebuild_student_stats)}
+
+
+def _rebuild_search(conn, payload):
+    return {'rows': _in_transaction(conn, fulltext.rebuild_search_index)}
+
+
+def _revision_nightly(conn, payload):
+    return revision.nightly(conn)
+
+
+def _rebuild_leaderboards(conn, payload):
+    return {'rows': _in_transaction(conn, rankings.rebuild_leaderboards)}
+
+
+def _prune_leaderboards(conn, payload):
+    return {'rows': _in_transaction(conn, rankings.prune_weeks)}
+
+
+def _compact_activity(conn, payload):
+    return {'events': activity.compact(conn)}
+
+
+def _archive_activity(conn, payload):
+    activity.compact(conn)
+    return {'events': activity.archive(conn)}
+
+
+# kind -> handler(cursor, payloads), run inside the claim transaction
+WRITE_HANDLERS = {
+    'quran_progress': _quran_progress,
+    'lesson_completed': _lesson_completed,
+}
+
+# kind -> handler(conn, payload) returning a JSON-able result
+TASK_HANDLERS = {
+    'rebuild_stats': _rebuild_stats,
+    'rebuild_search': _rebuild_search,
+    'revision_nightly': _revision_nightly,
+    'rebuild_leaderboards': _rebuild_leaderboards,
+    'prune_leaderboards': _prune_leaderboards,
+    'compact_activity': _compact_activity,
+    'archive_activity': _archive_activity,
+}
+
+
+# Enqueue and status
+
+def _next_nightly(now):
+    # Unix time of the next REVISION_NIGHTLY_HOUR o'clock, local time
+    at = datetime.fromtimestamp(now).replace(hour=REVISION_NIGHTLY_HOUR, minute=0, second=0, microsecond=0)
+    if at.timestamp() <= now:
+        at += timedelta(days=1)
+    return at.timestamp()
+
+
+def enqueue(cursor, kind, payload, created_by=None, delay=0, max_attempts=MAX_ATTEMPTS):
+    # Part of the caller's transaction: the job exists once the caller commits
+    if kind not in WRITE_HANDLERS and kind not in TASK_HANDLERS:
+        raise ValueError(f'unknown job kind: {kind}')
+    now = time.time()
+    cursor.execute('''INSERT INTO jobs (kind, payload, max_attempts, run_after, created_by, created_at)
+                      VALUES (?, ?, ?, ?, ?, ?)''',
+                   (kind, json.dumps(payload, ensure_ascii=False, default=str), max_attempts, now + delay,
+                    created_by, now))
+    return cursor.lastrowid
+
+
+JOB_COLUMNS = ('id', 'kind', 'status', 'attempts', 'max_attempts', 'created_by', 'created_at', 'finished_at',
+               'last_error', 'result')
+
+
+def get_job(cursor, job_id):
+    cursor.execute(f'SELECT {", ".join(JOB_COLUMNS)} FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def queue_stats(cursor):
+    cursor.execute('''SELECT kind, status, COUNT(*), MIN(CASE WHEN status = 'queued' THEN created_at END)
+                      FROM jobs GROUP BY kind, status''')
+    now = time.time()
+    kinds = {}
+    for kind, status, count, oldest in cursor.fetchall():
+        entry = kinds.setdefault(kind, dict.fromkeys(STATUSES, 0))
+        entry[status] = count
+        if oldest is not None:
+            entry['oldest_queued_seconds'] = round(now - oldest, 3)
+    return kinds
+
+
+# Workers
+
+def _backoff(attempts):
+    return min(RETRY_BASE ** attempts, RETRY_MAX)
+
+
+class JobWorker:
+
+    def __init__(self, threads=JOB_WORKERS):
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._stop = threading.Event()
+        self._stats = {'batches': 0, 'jobs_done': 0, 'jobs_retried': 0, 'jobs_failed': 0, 'tasks_done': 0}
+        self._stats_lock = threading.Lock()
+        self._last_maintenance = 0.0
+        self._last_compaction = 0.0
+        self._last_archive = 0.0
+        self._threads = [threading.Thread(target=self._run, name=f'jobs-{i}', daemon=True) for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, threads=len(self._threads))
+
+    def stop(self):
+        self._stop.set()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                worked = self.run_once()
+            except Exception:
+                # Keep the worker alive; the jobs are still in the table
+                traceback.print_exc()
+                worked = False
+            if not worked:
+                self._stop.wait(POLL_INTERVAL)
+
+    def run_once(self):
+        # One claim per kind with ready work; returns whether anything ran
+        with db.get_pool().connection() as conn:
+            now = time.time()
+            if now - self._last_maintenance >= MAINTENANCE_INTERVAL:
+                self._last_maintenance = now
+                self._maintain(conn)
+            if now - self._last_compaction >= activity.ACTIVITY_COMPACT_INTERVAL:
+                self._last_compaction = now
+                activity.compact(conn)
+            if now - self._last_archive >= activity.ACTIVITY_ARCHIVE_INTERVAL:
+                self._last_archive = now
+                activity.archive(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT kind FROM jobs WHERE status = 'queued' AND run_after <= ?", (now,))
+            kinds = [row[0] for row in cursor.fetchall()]
+            worked = False
+            for kind in kinds:
+                if kind in WRITE_HANDLERS:
+                    worked = self._run_writes(conn, kind) or worked
+                elif kind in TASK_HANDLERS:
+                    worked = self._run_task(conn, kind) or worked
+            return worked
+
+    def _owner(self):
+        # Threads of one worker share a process, not their claims
+        return f'{self.name}/{threading.current_thread().name}'
+
+    def _claim(self, cursor, kind, limit):
+        now = time.time()
+        cursor.execute('''UPDATE jobs SET status = 'running', locked_by = ?, locked_at = ?, attempts = attempts + 1
+                          WHERE id IN (SELECT id FROM jobs
+                                       WHERE kind = ? AND status = 'queued' AND run_after <= ?
+                                       ORDER BY run_after, id LIMIT ?)
+                          RETURNING id, payload, attempts, max_attempts''',
+                       (self._owner(), now, kind, now, limit))
+        return sorted(cursor.fetchall())
+
+    def _claim_job(self, cursor, job_id):
+        # None when another worker claimed, finished or backed off the job in the meantime
+        now = time.time()
+        cursor.execute('''UPDATE jobs SET status = 'running', locked_by = ?, locked_at = ?, attempts = attempts + 1
+                          WHERE id = ? AND status = 'queued' AND run_after <= ?
+                          RETURNING id, payload, attempts, max_attempts''',
+                       (self._owner(), now, job_id, now))
+        return cursor.fetchone()
+
+    def _finish(self, cursor, job_ids, result=None):
+        cursor.executemany('''UPDATE jobs SET status = 'done', finished_at = ?, result = ?, locked_by = NULL
+                              WHERE id = ? AND status = 'running' AND locked_by = ?''',
+                           [(time.time(), result, job_id, self._owner()) for job_id in job_ids])
+
+    def _fail(self, conn, job_id, attempts, max_attempts, error):
+        # Own transaction: the work it failed in has been rolled back, and with it our claim
+        # if it was made in the same transaction. A job another worker holds is left alone.
+        retry = attempts < max_attempts
+        conn.execute('''UPDATE jobs SET status = ?, attempts = ?, run_after = ?, finished_at = ?, last_error = ?,
+                                        locked_by = NULL
+                        WHERE id = ? AND (status = 'queued' OR (status = 'running' AND locked_by = ?))''',
+                     ('queued' if retry else 'failed', attempts, time.time() + _backoff(attempts),
+                      None if retry else time.time(), error[-2000:], job_id, self._owner()))
+        conn.commit()
+        self._count('jobs_retried' if retry else 'jobs_failed')
+
+    def _run_writes(self, conn, kind):
+        handler = WRITE_HANDLERS[kind]
+        jobs = None
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.cursor()
+            jobs = self._claim(cursor, kind, GROUP_COMMIT_MAX)
+            if jobs:
+                handler(cursor, [json.loads(job[1]) for job in jobs])
+                self._finish(cursor, [job[0] for job in jobs])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if not jobs:
+                raise
+            # The rollback put the whole batch back in the queue. Apply it one job at a time,
+            # each re-claimed first, so a single bad job is retried alone and a job another
+            # worker picked up meanwhile is not applied twice.
+            self._run_writes_singly(conn, handler, [job[0] for job in jobs])
+            return True
+        if not jobs:
+            return False
+        self._count('batches')
+        self._count('jobs_done', len(jobs))
+        return True
+
+    def _run_writes_singly(self, conn, handler, job_ids):
+        for job_id in job_ids:
+            conn.execute('BEGIN IMMEDIATE')
+            job = None
+            try:
+                cursor = conn.cursor()
+                job = self._claim_job(cursor, job_id)
+                if job is None:
+                    conn.commit()
+                    continue
+                handler(cursor, [json.loads(job[1])])
+                self._finish(cursor, [job_id])
+                conn.commit()
+                self._count('jobs_done')
+            except Exception:
+                conn.rollback()
+                if job is None:
+                    raise
+                self._fail(conn, job_id, job[2], job[3], traceback.format_exc())
+
+    def _heartbeat(self, job_id, owner, done):
+        # Own connection: the task holds the worker's for as long as it runs
+        while not done.wait(LEASE_HEARTBEAT):
+            try:
+                with db.get_pool().connection() as conn:
+                    conn.execute('''UPDATE jobs SET locked_at = ?
+                                    WHERE id = ? AND status = 'running' AND locked_by = ?''',
+                                 (time.time(), job_id, owner))
+                    conn.commit()
+            except Exception:
+                traceback.print_exc()
+
+    def _run_task(self, conn, kind):
+        jobs = _in_transaction(conn, lambda cursor: self._claim(cursor, kind, 1))
+        if not jobs:
+            return False
+        job_id, payload, attempts, max_attempts = jobs[0]
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, self._owner(), done),
+                         name=f'jobs-lease-{job_id}', daemon=True).start()
+        try:
+            result = TASK_HANDLERS[kind](conn, json.loads(payload))
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            self._fail(conn, job_id, attempts, max_attempts, traceback.format_exc())
+            return True
+        finally:
+            done.set()
+        self._finish(conn.cursor(), [job_id], json.dumps(result, default=str))
+        conn.commit()
+        self._count('tasks_done')
+        return True
+
+    def _maintain(self, conn):
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Tasks whose worker died (no heartbeat for a whole lease): back in the queue, their
+            # attempt still counts
+            conn.execute('''UPDATE jobs SET status = 'queued', locked_by = NULL
+                            WHERE status = 'running' AND locked_at < ?''', (now - LEASE_SECONDS,))
+            conn.execute('DELETE FROM jobs WHERE finished_at < ?', (now - RETENTION_SECONDS,))
+            # Weekly leaderboards past LEADERBOARD_WEEKS_KEPT: a range delete on the primary key
+            # that finds nothing on all but one maintenance pass a week
+            rankings.prune_weeks(conn.cursor())
+            # Keep the next nightly revision pass scheduled; under the write lock two workers
+            # never schedule the same night. Once a run is done (or failed for good) the next
+            # maintenance schedules the following night.
+            scheduled = conn.execute('''SELECT 1 FROM jobs WHERE kind = 'revision_nightly'
+                                        AND status IN ('queued', 'running') LIMIT 1''').fetchone()
+            if not scheduled:
+                enqueue(conn.cursor(), 'revision_nightly', {}, delay=_next_nightly(now) - now)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    # Started lazily so the threads are created in the worker process, not before fork;
+    # None when this process only enqueues (JOB_WORKERS=0)
+    global _worker, _worker_pid
+    if JOB_WORKERS <= 0:
+        return None
+    if _worker is None or _worker_pid != os.getpid():
+        with _worker_lock:
+            if _worker is None or _worker_pid != os.getpid():
+                _worker = JobWorker()
+                _worker_pid = os.getpid()
+    return _worker
+
+
+def init_app(app):
+    @app.before_request
+    def start_worker():
+        get_worker()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('worker', 'enqueue', 'stats'):
+        print('usage: python jobs.py worker [threads] | enqueue <kind> | stats', file=sys.stderr)
+        sys.exit(1)
+
+    if sys.argv[1] == 'worker':
+        worker = JobWorker(int(sys.argv[2]) if len(sys.argv) > 2 else max(JOB_WORKERS, 1))
+        print(f'{worker.name}: processing jobs, Ctrl-C to stop', file=sys.stderr)
+        try:
+            while True:
+                time.sleep(60)
+                print(worker.stats(), file=sys.stderr)
+        except KeyboardInterrupt:
+            worker.stop()
+    elif sys.argv[1] == 'enqueue':
+        with db.get_pool().connection() as conn:
+            job_id = enqueue(conn.cursor(), sys.argv[2], {})
+            conn.commit()
+        print(f'queued job {job_id}')
+    else:
+        with db.get_pool().connection() as conn:
+            print(json.dumps(queue_stats(conn.cursor()), indent=2))
@@ -0,0 +1,657 @@
+import base64
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import chat_hub
+import db
+
+# Live session whiteboard relay. The teacher's page batches pen movement into frames (about
+# every FRAME_INTERVAL_MS) and posts them as binary; each worker runs one LiveHub whose thread
+#   * appends posted frames to live_frames with one executemany per flush,
+#   * tails live_frames by id and sends each session's new frames to its local viewers as one
+#     pre-rendered SSE event, encoded once however many students watch,
+#   * folds the frames of sessions it wrote into live_snapshots every SNAPSHOT_INTERVAL, so a
+#     late joiner gets one compacted board plus the few frames after it,
+#   * writes viewers' joins and leaves into live_presence (one transaction per cycle, however
+#     many students open the page at once), heartbeats them and pushes the participant list
+#     when it changes.
+# Viewers wait on an Event like chat subscribers and count against the same per-process
+# stream budget (chat_hub.open_stream).
+# Like the chat hub, tailing the table is what carries frames from the worker that received
+# them to viewers connected to the others.
+#
+# Frame format: a sequence of ops, each starting with one op byte.
+#   OP_STROKE  color (palette index, u8), width (u8), point count (varint), then the first
+#              point as two varints and every next point as zigzag varint deltas, so a pen
+#              stroke costs about two bytes per point
+#   OP_CLEAR   the board is wiped
+#   OP_END     the session was ended (written by the server only)
+# Frames are concatenable: joining two frames gives a valid frame with both sets of ops.
+
+OP_STROKE = 1
+OP_CLEAR = 2
+OP_END = 3
+END_FRAME = bytes([OP_END])
+
+PALETTE = ('#000000', '#ff0000', '#0000ff', '#00ff00', '#2563eb')
+MAX_WIDTH = 32
+MAX_COORD = 4095
+MAX_STROKE_POINTS = 4096
+MAX_FRAME_BYTES = 64 * 1024
+TITLE_MAX_LENGTH = 200
+DESCRIPTION_MAX_LENGTH = 2000
+
+FRAME_INTERVAL_MS = 40
+FLUSH_INTERVAL = 0.03
+POLL_INTERVAL = 0.05
+SNAPSHOT_INTERVAL = 2.0
+# Frames already folded into a snapshot are kept this long for viewers resuming with Last-Event-ID
+FRAME_RETENTION = 60.0
+# Snapshot strokes are simplified to this tolerance in canvas pixels
+SNAPSHOT_TOLERANCE = 1.0
+PRESENCE_INTERVAL = 5.0
+PRESENCE_MIN_INTERVAL = 1.0
+PRESENCE_TTL = 20.0
+PRESENCE_LIST_MAX = 100
+HEARTBEAT_INTERVAL = 15.0
+BATCH_SIZE = 500
+
+LIVE_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS live_frames (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL,
+        frame BLOB NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_live_frames_session ON live_frames (session_id, id)',
+    '''
+    CREATE TABLE IF NOT EXISTS live_snapshots (
+        session_id INTEGER PRIMARY KEY,
+        last_frame_id INTEGER NOT NULL,
+        board BLOB NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS live_presence (
+        connection_id TEXT PRIMARY KEY,
+        session_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        last_seen REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_live_presence_session ON live_presence (session_id, last_seen, user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_live_sessions_active ON live_sessions (teacher_id) WHERE is_active',
+]
+
+SESSION_COLUMNS = '''s.id, s.teacher_id, u.username, s.title, s.description, s.start_time, s.end_time, s.is_active
+                     FROM live_sessions s LEFT JOIN users u ON u.id = s.teacher_id'''
+
+
+class FrameError(ValueError):
+    pass
+
+
+# Frame codec
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, pos):
+    value = shift = 0
+    while True:
+        if pos >= len(data) or shift > 28:
+            raise FrameError('truncated varint')
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    return -((value + 1) >> 1) if value & 1 else value >> 1
+
+
+def encode_ops(ops):
+    out = bytearray()
+    for op in ops:
+        out.append(op[0])
+        if op[0] != OP_STROKE:
+            continue
+        _, color, width, points = op
+        out.append(color)
+        out.append(width)
+        _put_varint(out, len(points))
+        previous = None
+        for x, y in points:
+            if previous is None:
+                _put_varint(out, x)
+                _put_varint(out, y)
+            else:
+                _put_varint(out, _zigzag(x - previous[0]))
+                _put_varint(out, _zigzag(y - previous[1]))
+            previous = (x, y)
+    return bytes(out)
+
+
+def decode_ops(data):
+    # Raises FrameError on anything malformed, so a posted frame is checked before it is relayed
+    ops = []
+    pos = 0
+    while pos < len(data):
+        op = data[pos]
+        pos += 1
+        if op in (OP_CLEAR, OP_END):
+            ops.append((op,))
+            continue
+        if op != OP_STROKE:
+            raise FrameError(f'unknown op {op}')
+        if pos + 2 > len(data):
+            raise FrameError('truncated stroke')
+        color, width = data[pos], data[pos + 1]
+        pos += 2
+        count, pos = _get_varint(data, pos)
+        if color >= len(PALETTE) or not 1 <= width <= MAX_WIDTH or not 1 <= count <= MAX_STROKE_POINTS:
+            raise FrameError('invalid stroke header')
+        x, pos = _get_varint(data, pos)
+        y, pos = _get_varint(data, pos)
+        points = [(x, y)]
+        for _ in range(count - 1):
+            dx, pos = _get_varint(data, pos)
+            dy, pos = _get_varint(data, pos)
+            x += _unzigzag(dx)
+            y += _unzigzag(dy)
+            points.append((x, y))
+        if any(not (0 <= px <= MAX_COORD and 0 <= py <= MAX_COORD) for px, py in points):
+            raise FrameError('point out of range')
+        ops.append((OP_STROKE, color, width, points))
+    return ops
+
+
+def parse_client_frame(data):
+    # Teachers may draw and clear; OP_END only comes from ending the session
+    if not data or len(data) > MAX_FRAME_BYTES:
+        raise FrameError('empty or oversized frame')
+    ops = decode_ops(data)
+    if any(op[0] == OP_END for op in ops):
+        raise FrameError('end op from client')
+    return ops
+
+
+def _simplify(points, tolerance):
+    # Ramer-Douglas-Peucker, iterative so long strokes cannot hit the recursion limit
+    if len(points) < 3:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    limit = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        farthest, index = -1.0, None
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if length == 0:
+                distance = (px - x1) ** 2 + (py - y1) ** 2
+            else:
+                cross = dx * (py - y1) - dy * (px - x1)
+                distance = cross * cross / length
+            if distance > farthest:
+                farthest, index = distance, i
+        if index is not None and farthest > limit:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def compact(ops, tolerance=SNAPSHOT_TOLERANCE):
+    # Board state after ops: nothing before the last clear, continued segments of one pen
+    # stroke joined back together, and every stroke simplified
+    strokes = []
+    for op in ops:
+        if op[0] == OP_CLEAR:
+            strokes = []
+        elif op[0] == OP_STROKE:
+            _, color, width, points = op
+            if strokes:
+                previous = strokes[-1]
+                if previous[1] == color and previous[2] == width and previous[3][-1] == points[0]:
+                    previous[3].extend(points[1:])
+                    continue
+            strokes.append([OP_STROKE, color, width, list(points)])
+    return [(OP_STROKE, color, width, _simplify(points, tolerance)) for _, color, width, points in strokes]
+
+
+def _frame_event(frame, event_id, previous_id=None):
+    # Pre-rendered once per batch and pushed as-is to every viewer; prev lets the stream
+    # notice a viewer that missed frames and resynchronise it from the snapshot
+    return previous_id, f'id: {event_id}\nevent: frame\ndata: {base64.b64encode(frame).decode()}\n\n'
+
+
+def _snapshot_event(board, event_id):
+    return f'id: {event_id}\nevent: snapshot\ndata: {base64.b64encode(board).decode()}\n\n'
+
+
+# Sessions
+
+def _session(row):
+    return {
+        'id': row[0],
+        'teacher_id': row[1],
+        'teacher': row[2],
+        'title': row[3],
+        'description': row[4],
+        'start_time': str(row[5]) if row[5] else None,
+        'end_time': str(row[6]) if row[6] else None,
+        'is_active': bool(row[7]),
+    }
+
+
+def get_session(cursor, session_id):
+    cursor.execute(f'SELECT {SESSION_COLUMNS} WHERE s.id = ?', (session_id,))
+    row = cursor.fetchone()
+    return _session(row) if row else None
+
+
+def active_sessions(cursor, user_id, user_type):
+    # Teachers see their own session; a student sees their teacher's, or every active
+    # session when they are not linked to a teacher yet
+    if user_type in ('developer', 'main_teacher', 'teacher'):
+        cursor.execute(f'SELECT {SESSION_COLUMNS} WHERE s.is_active AND s.teacher_id = ? ORDER BY s.id DESC',
+                       (user_id,))
+    else:
+        cursor.execute(f'''SELECT {SESSION_COLUMNS}
+                           WHERE s.is_active AND (s.teacher_id = (SELECT teacher_id FROM users WHERE id = ?)
+                                                  OR (SELECT teacher_id FROM users WHERE id = ?) IS NULL)
+                           ORDER BY s.id DESC''', (user_id, user_id))
+    return [_session(row) for row in cursor.fetchall()]
+
+
+def can_view(cursor, live, user_id, user_type):
+    # The rule of active_sessions for one session: a teacher watches their own, a student
+    # their teacher's (any, while not linked to a teacher yet)
+    if user_type in ('developer', 'main_teacher', 'teacher'):
+        return live['teacher_id'] == user_id
+    cursor.execute('SELECT teacher_id FROM users WHERE id = ?', (user_id,))
+    row = cursor.fetchone()
+    return row is not None and row[0] in (None, live['teacher_id'])
+
+
+def start_session(cursor, teacher_id, title, description):
+    # A teacher runs one session at a time: starting a new one ends the previous
+    ended = end_sessions(cursor, teacher_id)
+    cursor.execute('''INSERT INTO live_sessions (teacher_id, title, description, start_time, is_active)
+                      VALUES (?, ?, ?, ?, TRUE)''', (teacher_id, title, description, datetime.now()))
+    return cursor.lastrowid, ended
+
+
+def end_sessions(cursor, teacher_id, session_id=None):
+    # Returns the ids of the sessions that were ended
+    where, params = ('AND id = ?', [session_id]) if session_id is not None else ('', [])
+    cursor.execute(f'''UPDATE live_sessions SET is_active = FALSE, end_time = ?
+                       WHERE teacher_id = ? AND is_active {where} RETURNING id''',
+                   [datetime.now(), teacher_id] + params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def update_session(cursor, teacher_id, session_id, title, description):
+    cursor.execute('UPDATE live_sessions SET title = ?, description = ? WHERE id = ? AND teacher_id = ? AND is_active',
+                   (title, description, session_id, teacher_id))
+    return cursor.rowcount > 0
+
+
+def owns_active_session(cursor, teacher_id, session_id):
+    cursor.execute('SELECT 1 FROM live_sessions WHERE id = ? AND teacher_id = ? AND is_active',
+                   (session_id, teacher_id))
+    return cursor.fetchone() is not None
+
+
+def load_board(cursor, session_id, after=None):
+    # Catch-up for a viewer: the snapshot when it is behind it (or has nothing), then the
+    # frames written since, joined into one. Returns (events, id of the last frame included).
+    # Frames newer than the snapshot are never deleted, so the two always meet.
+    cursor.execute('SELECT last_frame_id, board FROM live_snapshots WHERE session_id = ?', (session_id,))
+    snapshot_id, board = cursor.fetchone() or (0, b'')
+    events = []
+    if after is None or after < snapshot_id:
+        events.append(_snapshot_event(board, snapshot_id))
+        after = snapshot_id
+
+    cursor.execute('SELECT id, frame FROM live_frames WHERE session_id = ? AND id > ? ORDER BY id',
+                   (session_id, after))
+    rows = cursor.fetchall()
+    if rows:
+        after = rows[-1][0]
+        events.append(_frame_event(b''.join(frame for _, frame in rows), after)[1])
+    return events, after
+
+
+class LiveHub:
+
+    def __init__(self):
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # Presence rows still to insert and delete, guarded by _pending_lock
+        self._joined = []
+        self._left = []
+        self._sessions = defaultdict(set)
+        self._sessions_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._last_id = None
+        # Last frame id seen per session since the hub started (for gap detection)
+        self._tail = {}
+        # Sessions this worker wrote frames for since their last snapshot
+        self._dirty = set()
+        self._last_snapshot = 0.0
+        self._presence = {}
+        self._last_presence = 0.0
+        self._presence_due = False
+        self._stats = {'posted': 0, 'flushes': 0, 'batches_delivered': 0, 'snapshots': 0}
+        self._thread = threading.Thread(target=self._run, name='live-hub', daemon=True)
+        self._thread.start()
+
+    # Public API used by the routes
+
+    def post(self, session_id, frame):
+        with self._pending_lock:
+            self._pending.append((session_id, frame, time.time()))
+            self._stats['posted'] += 1
+        self._wake.set()
+
+    def end(self, session_id):
+        self.post(session_id, END_FRAME)
+
+    def subscribe(self, session_id, user_id):
+        subscriber = chat_hub.Subscriber(session_id, user_id)
+        with self._sessions_lock:
+            self._sessions[session_id].add(subscriber)
+        with self._pending_lock:
+            self._joined.append((subscriber.id, session_id, user_id, time.time()))
+        self._presence_due = True
+        self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._sessions_lock:
+            members = self._sessions.get(subscriber.room_id)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self._sessions[subscriber.room_id]
+        with self._pending_lock:
+            self._left.append((subscriber.id,))
+        self._presence_due = True
+        self._wake.set()
+
+    def presence(self, session_id):
+        return self._presence.get(session_id, {'session_id': session_id, 'online': 0, 'participants': []})
+
+    def stats(self):
+        with self._sessions_lock:
+            sessions = {session_id: len(members) for session_id, members in self._sessions.items()}
+        with self._pending_lock:
+            stats = dict(self._stats, pending=len(self._pending))
+        stats['local_viewers'] = sum(sessions.values())
+        stats['sessions'] = sessions
+        return stats
+
+    # Background loop
+
+    def _run(self):
+        while self._last_id is None:
+            try:
+                with db.get_pool().connection() as conn:
+                    self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM live_frames').fetchone()[0]
+            except Exception:
+                time.sleep(POLL_INTERVAL)
+
+        last_poll = last_purge = 0.0
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self._flush()
+                self._sync_presence()
+                now = time.monotonic()
+                if now - last_poll >= POLL_INTERVAL:
+                    last_poll = now
+                    self._poll()
+                if self._dirty and now - self._last_snapshot >= SNAPSHOT_INTERVAL:
+                    self._last_snapshot = now
+                    self._snapshot()
+                if now - last_purge >= FRAME_RETENTION:
+                    last_purge = now
+                    self._purge()
+                since = now - self._last_presence
+                if since >= PRESENCE_INTERVAL or (self._presence_due and since >= PRESENCE_MIN_INTERVAL):
+                    self._last_presence = now
+                    self._presence_due = False
+                    self._refresh_presence()
+            except Exception:
+                # Keep the hub alive; the next cycle retries the same batch
+                time.sleep(POLL_INTERVAL)
+
+    def _flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with db.get_pool().connection() as conn:
+                conn.executemany('INSERT INTO live_frames (session_id, frame, created_at) VALUES (?, ?, ?)', batch)
+                conn.commit()
+        except Exception:
+            with self._pending_lock:
+                self._pending[:0] = batch
+            raise
+        self._stats['flushes'] += 1
+        self._dirty.update(session_id for session_id, _, _ in batch)
+        # Deliver to our own viewers without waiting for the next poll tick
+        self._poll()
+
+    def _sync_presence(self):
+        with self._pending_lock:
+            joined, self._joined = self._joined, []
+            left, self._left = self._left, []
+        if not joined and not left:
+            return
+        try:
+            with db.get_pool().connection() as conn:
+                # Inserts first: a viewer that came and went within one cycle leaves no row
+                conn.executemany('''INSERT OR REPLACE INTO live_presence (connection_id, session_id, user_id, last_seen)
+                                    VALUES (?, ?, ?, ?)''', joined)
+                conn.executemany('DELETE FROM live_presence WHERE connection_id = ?', left)
+                conn.commit()
+        except Exception:
+            with self._pending_lock:
+                self._joined[:0] = joined
+                self._left[:0] = left
+            raise
+
+    def _local_sessions(self):
+        with self._sessions_lock:
+            return {session_id: list(members) for session_id, members in self._sessions.items()}
+
+    def _poll(self):
+        with db.get_pool().connection() as conn:
+            cursor = conn.cursor()
+            sessions = self._local_sessions()
+            if not sessions:
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM live_frames')
+                self._last_id = cursor.fetchone()[0]
+                # Skipped frames are unknown, so earlier tails cannot be trusted for gaps
+                self._tail = {}
+                return
+
+            while True:
+                cursor.execute('SELECT id, session_id, frame FROM live_frames WHERE id > ? ORDER BY id LIMIT ?',
+                               (self._last_id, BATCH_SIZE))
+                rows = cursor.fetchall()
+                batches = defaultdict(list)
+                for frame_id, session_id, frame in rows:
+                    batches[session_id].append((frame_id, frame))
+                    self._last_id = frame_id
+
+                for session_id, frames in batches.items():
+                    previous_id = self._tail.get(session_id)
+                    self._tail[session_id] = frames[-1][0]
+                    members = sessions.get(session_id)
+                    if not members:
+                        continue
+                    event = _frame_event(b''.join(frame for _, frame in frames), frames[-1][0], previous_id)
+                    ended = any(frame == END_FRAME for _, frame in frames)
+                    for subscriber in members:
+                        subscriber.push('frame', (frames[-1][0],) + event)
+                        if ended:
+                            subscriber.push('ended', None)
+                    self._stats['batches_delivered'] += 1
+                    if ended:
+                        self._tail.pop(session_id, None)
+                if len(rows) < BATCH_SIZE:
+                    break
+
+    def _snapshot(self):
+        sessions, self._dirty = self._dirty, set()
+        now = time.time()
+        for session_id in sessions:
+            with db.get_pool().connection() as conn:
+                # Serialised on the write lock, so two workers folding the same session
+                # never overwrite each other's snapshot
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT last_frame_id, board FROM live_snapshots WHERE session_id = ?', (session_id,))
+                    snapshot_id, board = cursor.fetchone() or (0, b'')
+                    cursor.execute('SELECT id, frame FROM live_frames WHERE session_id = ? AND id > ? ORDER BY id',
+                                   (session_id, snapshot_id))
+                    rows = cursor.fetchall()
+                    if rows:
+                        ops = decode_ops(board + b''.join(frame for _, frame in rows))
+                        cursor.execute('''INSERT OR REPLACE INTO live_snapshots (session_id, last_frame_id, board, updated_at)
+                                          VALUES (?, ?, ?, ?)''', (session_id, rows[-1][0], encode_ops(compact(ops)), now))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    self._dirty.add(session_id)
+                    raise
+            self._stats['snapshots'] += 1
+
+    def _purge(self):
+        # Only frames already folded into their session's snapshot go, and only once nobody
+        # can still resume from them
+        with db.get_pool().connection() as conn:
+            conn.execute('''DELETE FROM live_frames WHERE created_at < ? AND id <= (
+                                SELECT last_frame_id FROM live_snapshots WHERE session_id = live_frames.session_id)''',
+                         (time.time() - FRAME_RETENTION,))
+            conn.commit()
+
+    def _refresh_presence(self):
+        sessions = self._local_sessions()
+        now = time.time()
+        with db.get_pool().connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('UPDATE live_presence SET last_seen = ? WHERE connection_id = ?',
+                               [(now, subscriber.id) for members in sessions.values() for subscriber in members])
+            # Rows of workers that died without unsubscribing
+            cursor.execute('DELETE FROM live_presence WHERE last_seen < ?', (now - PRESENCE_TTL,))
+            conn.commit()
+
+            if not sessions:
+                self._presence = {}
+                return
+            placeholders = ','.join('?' * len(sessions))
+            cursor.execute(f'''SELECT p.session_id, p.user_id, u.username, u.user_type
+                               FROM live_presence p LEFT JOIN users u ON u.id = p.user_id
+                               WHERE p.session_id IN ({placeholders}) AND p.last_seen >= ?
+                               GROUP BY p.session_id, p.user_id
+                               ORDER BY p.session_id, u.username''', list(sessions) + [now - PRESENCE_TTL])
+            participants = defaultdict(list)
+            for session_id, user_id, username, user_type in cursor.fetchall():
+                participants[session_id].append({'user_id': user_id, 'username': username, 'user_type': user_type})
+
+        presence = {}
+        for session_id, members in sessions.items():
+            people = participants.get(session_id, [])
+            presence[session_id] = {'session_id': session_id, 'online': len(people),
+                                    'participants': people[:PRESENCE_LIST_MAX]}
+            if self._presence.get(session_id) != presence[session_id]:
+                event = chat_hub.format_sse('presence', presence[session_id])
+                for subscriber in members:
+                    subscriber.push('presence', event)
+        self._presence = presence
+
+
+_hub = None
+_hub_pid = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    # Started lazily so the background thread is created in the worker, not before fork
+    global _hub, _hub_pid
+    if _hub is None or _hub_pid != os.getpid():
+        with _hub_lock:
+            if _hub is None or _hub_pid != os.getpid():
+                _hub = LiveHub()
+                _hub_pid = os.getpid()
+    return _hub
+
+
+def stream(session_id, user_id, last_event_id=None):
+    # Generator for a text/event-stream response; holds no DB connection while idle.
+    # Subscribing before reading the board means no frame falls between the two.
+    hub = get_hub()
+    subscriber = hub.subscribe(session_id, user_id)
+    try:
+        yield 'retry: 2000\n\n'
+        with db.get_pool().connection() as conn:
+            events, subscriber.last_id = load_board(conn.cursor(), session_id, last_event_id)
+        for event in events:
+            yield event
+        yield chat_hub.format_sse('presence', hub.presence(session_id))
+
+        while True:
+            events = subscriber.wait(HEARTBEAT_INTERVAL)
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event, data in events:
+                if event == 'ended':
+                    yield chat_hub.format_sse('ended', {'session_id': session_id})
+                    return
+                if event != 'frame':
+                    yield data
+                    continue
+                frame_id, previous_id, text = data
+                if frame_id <= subscriber.last_id:
+                    continue
+                if previous_id is not None and previous_id > subscriber.last_id:
+                    # Frames were dropped from a full backlog: start over from the snapshot
+                    with db.get_pool().connection() as conn:
+                        events, subscriber.last_id = load_board(conn.cursor(), session_id)
+                    for event in events:
+                        yield event
+                    continue
+                subscriber.last_id = frame_id
+                yield text
+    finally:
+        hub.unsubscribe(subscriber)
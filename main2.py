@@ -1,18 +1,47 @@
 
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, stream_with_context
 import sqlite3
 import secrets
 import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import os
+import activity
+import assets
+import auth
+import bulk
+import db
+import cache
+import catalog
+import chat_hub
+import fulltext
+import httpcache
+import instrumentation
+import jobs
+import live_hub
+import migrations
+import mushaf
+import progress
+import quiz
+import rankings
+import revision
+import roster
+import session_store
+import settings
+import stats
+from db import get_db, retry_on_busy
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+app.config.from_object(settings)
+db.init_app(app)
+instrumentation.init_app(app)
+jobs.init_app(app)
+httpcache.init_app(app)
+session_store.init_app(app)
+assets.init_app(app)
 
 # Database initialization
 def init_db():
-    conn = sqlite3.connect('islamic_app.db')
+    conn = db.get_pool().acquire()
     cursor = conn.cursor()
     
     # Users table
@@ -112,7 +141,10 @@ def init_db():
     ''')
     
     conn.commit()
-    conn.close()
+    
+    # Indexes and later schema changes
+    migrations.migrate(conn)
+    db.get_pool().release(conn)
 
 # User type codes
 USER_CODES = {
@@ -143,13 +175,26 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = sqlite3.connect('islamic_app.db')
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT id, username, password_hash, user_type FROM users WHERE username = ?', (username,))
         user = cursor.fetchone()
-        conn.close()
         
-        if user and check_password_hash(user[2], password):
+        try:
+            valid, new_hash = auth.verify_password(user[2], password) if user else (False, None)
+        except auth.AuthBusy:
+            flash('الخادم مشغول حالياً، حاول مرة أخرى بعد لحظات')
+            return render_template('login.html'), 503, {'Retry-After': str(auth.AUTH_RETRY_AFTER)}
+        
+        if valid:
+            # Stored with older hash parameters: upgrade while we have the plain password
+            if new_hash:
+                cursor.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                               (new_hash, user[0], user[2]))
+            stats.record_attendance(cursor, user[0])
+            activity.log_event(cursor, user[0], 'login')
+            conn.commit()
+            
             session['user_id'] = user[0]
             session['username'] = user[1]
             session['user_type'] = user[3]
@@ -169,9 +214,13 @@ def register():
         user_type = get_user_type_from_code(special_code)
         student_code = generate_student_code() if user_type == 'student' else None
         
-        password_hash = generate_password_hash(password)
+        try:
+            password_hash = auth.hash_password(password)
+        except auth.AuthBusy:
+            flash('الخادم مشغول حالياً، حاول مرة أخرى بعد لحظات')
+            return render_template('register.html'), 503, {'Retry-After': str(auth.AUTH_RETRY_AFTER)}
         
-        conn = sqlite3.connect('islamic_app.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         try:
@@ -189,16 +238,15 @@ def register():
             if student_code:
                 flash(f'تم إنشاء حسابك بنجاح. رمز الطالب الخاص بك هو: {student_code}')
             
-            conn.close()
             return redirect(url_for('dashboard'))
             
         except sqlite3.IntegrityError:
             flash('اسم المستخدم موجود بالفعل')
-            conn.close()
     
     return render_template('register.html')
 
 @app.route('/dashboard')
+@httpcache.cached()
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -207,42 +255,46 @@ def dashboard():
     return render_template('dashboard.html', user_type=user_type)
 
 @app.route('/lessons')
+@httpcache.cached('lessons')
 def lessons():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('islamic_app.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM lessons ORDER BY created_at DESC')
-    lessons = cursor.fetchall()
-    conn.close()
+    # Only the first page is rendered, the rest is fetched from /api/lessons on scroll
+    cursor = get_db().cursor()
+    lessons, next_cursor = cache.get_cache().get_or_load(
+        cache.lesson_page_key(None, None, catalog.LESSONS_PAGE_SIZE, cache.lessons_version(cursor)),
+        lambda: catalog.lesson_page(cursor))
     
-    return render_template('lessons.html', lessons=lessons)
+    return render_template('lessons.html', lessons=lessons, next_cursor=next_cursor)
 
 @app.route('/lesson/<int:lesson_id>')
+@httpcache.cached('lessons')
 def lesson_detail(lesson_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('islamic_app.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM lessons WHERE id = ?', (lesson_id,))
-    lesson = cursor.fetchone()
-    
-    cursor.execute('SELECT * FROM quiz_questions WHERE lesson_id = ?', (lesson_id,))
-    questions = cursor.fetchall()
-    conn.close()
+    cursor = get_db().cursor()
+    lesson, question_count = cache.get_cache().get_or_load(
+        cache.lesson_key(lesson_id, cache.lessons_version(cursor)), lambda: catalog.load_lesson(cursor, lesson_id))
     
-    return render_template('lesson_detail.html', lesson=lesson, questions=questions)
+    return render_template('lesson_detail.html', lesson=lesson, question_count=question_count,
+                           quiz_size=min(question_count, quiz.QUIZ_SIZE))
 
 @app.route('/quran')
+@httpcache.cached(vary=lambda: mushaf.get_store() and mushaf.get_store().version)
 def quran():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    return render_template('quran.html')
+    store = mushaf.get_store()
+    return render_template('quran.html',
+                           quran_version=store.version if store else None,
+                           quran_pages=store.page_count if store else 604,
+                           quran_suras=store.meta['suras'] if store else [])
 
 @app.route('/chat')
+@httpcache.cached()
 def chat():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -250,6 +302,7 @@ def chat():
     return render_template('chat.html')
 
 @app.route('/admin')
+@httpcache.cached()
 def admin():
     if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
         return redirect(url_for('dashboard'))
@@ -257,6 +310,7 @@ def admin():
     return render_template('admin.html')
 
 @app.route('/live_session')
+@httpcache.cached()
 def live_session():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -264,7 +318,42 @@ def live_session():
     return render_template('live_session.html')
 
 # API endpoints
+@app.route('/api/lessons')
+@httpcache.cached('lessons', per_user=False)
+def api_lessons():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    topic = request.args.get('topic') or None
+    after = request.args.get('cursor') or None
+    limit = max(1, min(request.args.get('limit', catalog.LESSONS_PAGE_SIZE, type=int), catalog.LESSONS_PAGE_MAX))
+    
+    cursor = get_db().cursor()
+    try:
+        lessons, next_cursor = cache.get_cache().get_or_load(
+            cache.lesson_page_key(topic, after, limit, cache.lessons_version(cursor)),
+            lambda: catalog.lesson_page(cursor, topic, after, limit))
+    except catalog.InvalidCursor:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    return jsonify({'lessons': lessons, 'next_cursor': next_cursor})
+
+@app.route('/api/search')
+def search():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    kind = request.args.get('type') or None
+    if kind not in (None, 'lesson', 'question'):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    limit = request.args.get('limit', fulltext.SEARCH_PAGE_SIZE, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    
+    results, next_offset = fulltext.search(get_db().cursor(), request.args.get('q', ''), kind, limit, offset)
+    return jsonify({'results': results, 'next_offset': next_offset})
+
 @app.route('/api/track_quran_progress', methods=['POST'])
+@retry_on_busy
 def track_quran_progress():
     if 'user_id' not in session:
         return jsonify({'error': 'غير مسموح'}), 401
@@ -273,51 +362,175 @@ def track_quran_progress():
     page_number = data.get('page_number')
     action = data.get('action')
     
-    conn = sqlite3.connect('islamic_app.db')
-    cursor = conn.cursor()
+    if not progress.valid_quran_event(page_number, action):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
     
-    # Check if record exists
-    cursor.execute('SELECT id, read_count FROM quran_progress WHERE student_id = ? AND page_number = ?', 
-                   (session['user_id'], page_number))
-    existing = cursor.fetchone()
-    
-    if existing:
-        if action == 'read':
-            cursor.execute('UPDATE quran_progress SET read_count = read_count + 1, last_read = ? WHERE id = ?',
-                          (datetime.now(), existing[0]))
-        elif action == 'memorized':
-            cursor.execute('UPDATE quran_progress SET memorized = "true" WHERE id = ?', (existing[0],))
-    else:
-        memorized = 'true' if action == 'memorized' else 'false'
-        read_count = 1 if action == 'read' else 0
-        cursor.execute('''INSERT INTO quran_progress (student_id, page_number, memorized, read_count) 
-                         VALUES (?, ?, ?, ?)''', (session['user_id'], page_number, memorized, read_count))
+    conn = get_db()
+    
+    # Applied by the job workers, many requests per transaction
+    job_id = jobs.enqueue(conn.cursor(), 'quran_progress',
+                          [progress.quran_event(session['user_id'], page_number, action)], session['user_id'])
     
     conn.commit()
-    conn.close()
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+@app.route('/api/track_quran_progress/batch', methods=['POST'])
+@retry_on_busy
+def track_quran_progress_batch():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    # sendBeacon cannot set headers, so accept the body whatever its content type
+    data = request.get_json(force=True, silent=True)
+    events = data.get('events') if isinstance(data, dict) else data
+    if not isinstance(events, list):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    events, rejected = progress.parse_quran_events(session['user_id'], events)
+    
+    conn = get_db()
+    
+    # Whole reading session in one job, applied in one transaction
+    job_id = None
+    if events:
+        job_id = jobs.enqueue(conn.cursor(), 'quran_progress', events, session['user_id'])
+        conn.commit()
+    return jsonify({'success': True, 'applied': len(events), 'rejected': rejected, 'job_id': job_id}), 202
+
+@app.route('/api/quran/reviews/due')
+@httpcache.cached('student', vary=date.today,
+                  student=lambda: request.args.get('student_id', type=int) or session['user_id'])
+def due_reviews():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    cursor = get_db().cursor()
+    student_id = session['user_id']
+    # Teachers can look at the queue of one of their own students
+    requested = request.args.get('student_id', type=int)
+    if requested and requested != student_id:
+        if session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+            return jsonify({'error': 'غير مسموح'}), 401
+        cursor.execute('SELECT 1 FROM users WHERE id = ? AND teacher_id = ?', (requested, student_id))
+        if not cursor.fetchone():
+            return jsonify({'error': 'غير مسموح'}), 401
+        student_id = requested
+    
+    pages, total = revision.due_reviews(cursor, student_id,
+                                        limit=request.args.get('limit', revision.REVIEW_QUEUE_SIZE, type=int))
+    return jsonify({'due': pages, 'total': total})
+
+@app.route('/api/quran/reviews', methods=['POST'])
+@retry_on_busy
+def record_reviews():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    data = request.get_json(silent=True)
+    reviews = data.get('reviews') if isinstance(data, dict) else data
+    if not isinstance(reviews, list):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    reviews, rejected = revision.parse_reviews(session['user_id'], reviews)
+    
+    conn = get_db()
+    applied = revision.record_reviews(conn.cursor(), reviews)
+    conn.commit()
+    # Pages that are not memorized are counted as rejected too
+    return jsonify({'success': True, 'applied': applied, 'rejected': rejected + len(reviews) - applied})
 
-@app.route('/api/save_quiz_results', methods=['POST'])
-def save_quiz_results():
+def _quran_response(store, body, first, last=None):
+    # Served straight from the mapped store: no session, no database
+    encoding = mushaf.choose_encoding(request.accept_encodings)
+    if mushaf.not_modified(request.if_none_match, store, first, last):
+        response = Response(status=304)
+    else:
+        data = body(encoding)
+        if data is None:
+            encoding = 'identity'
+            data = body(encoding)
+        response = Response(data, mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    
+    response.set_etag(store.etag(first, last, encoding))
+    response.headers['Vary'] = 'Accept-Encoding'
+    if request.args.get('v') == store.version:
+        response.headers['Cache-Control'] = f'public, max-age={mushaf.QURAN_IMMUTABLE_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = f'public, max-age={mushaf.QURAN_MAX_AGE}'
+    return response
+
+@app.route('/api/quran/page/<int:page>')
+def quran_page(page):
+    store = mushaf.get_store()
+    if store is None:
+        return jsonify({'error': 'نص المصحف غير متوفر'}), 503
+    if not 1 <= page <= store.page_count:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 404
+    
+    response = _quran_response(store, lambda encoding: store.page_body(page, encoding), page)
+    following = range(page + 1, min(page + mushaf.QURAN_PREFETCH, store.page_count) + 1)
+    if following:
+        response.headers['Link'] = ', '.join(
+            f'</api/quran/page/{n}?v={store.version}>; rel=prefetch' for n in following)
+    return response
+
+@app.route('/api/quran/pages/<int:first>-<int:last>')
+def quran_pages(first, last):
+    store = mushaf.get_store()
+    if store is None:
+        return jsonify({'error': 'نص المصحف غير متوفر'}), 503
+    if not 1 <= first <= last <= store.page_count or last - first >= mushaf.QURAN_RANGE_MAX:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    return _quran_response(store, lambda encoding: store.range_body(first, last, encoding), first, last)
+
+@app.route('/api/quiz/start', methods=['POST'])
+@retry_on_busy
+def start_quiz():
     if 'user_id' not in session:
         return jsonify({'error': 'غير مسموح'}), 401
     
     data = request.get_json()
     lesson_id = data.get('lesson_id')
-    score = data.get('score')
+    count = data.get('count', quiz.QUIZ_SIZE)
+    if not isinstance(lesson_id, int) or not isinstance(count, int):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
     
-    conn = sqlite3.connect('islamic_app.db')
+    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute('''INSERT INTO student_progress (student_id, lesson_id, quiz_score) 
-                     VALUES (?, ?, ?)''', (session['user_id'], lesson_id, score))
+    try:
+        attempt_id, questions = quiz.start_attempt(cursor, session['user_id'], lesson_id, count)
+    except quiz.QuizError:
+        return jsonify({'error': 'لا توجد أسئلة متاحة'}), 404
     
     conn.commit()
-    conn.close()
+    return jsonify({'attempt_id': attempt_id, 'questions': questions})
+
+@app.route('/api/quiz/<int:attempt_id>/submit', methods=['POST'])
+@retry_on_busy
+def submit_quiz(attempt_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
     
-    return jsonify({'success': True, 'message': 'تم حفظ النتيجة'})
+    data = request.get_json()
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    try:
+        result = quiz.submit_attempt(cursor, session['user_id'], attempt_id, data.get('answers'))
+    except quiz.QuizError:
+        conn.rollback()
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    conn.commit()
+    return jsonify(dict(result, success=True, message='تم حفظ النتيجة'))
 
 @app.route('/api/mark_lesson_completed', methods=['POST'])
+@retry_on_busy
 def mark_lesson_completed():
     if 'user_id' not in session:
         return jsonify({'error': 'غير مسموح'}), 401
@@ -325,54 +538,83 @@ def mark_lesson_completed():
     data = request.get_json()
     lesson_id = data.get('lesson_id')
     
-    conn = sqlite3.connect('islamic_app.db')
-    cursor = conn.cursor()
-    
-    # Check if already completed
-    cursor.execute('SELECT id FROM student_progress WHERE student_id = ? AND lesson_id = ?', 
-                   (session['user_id'], lesson_id))
-    existing = cursor.fetchone()
+    conn = get_db()
     
-    if not existing:
-        cursor.execute('''INSERT INTO student_progress (student_id, lesson_id, quiz_score) 
-                         VALUES (?, ?, ?)''', (session['user_id'], lesson_id, 100))
+    # The worker skips lessons that are already completed
+    job_id = jobs.enqueue(conn.cursor(), 'lesson_completed',
+                          {'student_id': session['user_id'], 'lesson_id': lesson_id, 'ts': datetime.now()},
+                          session['user_id'])
     
     conn.commit()
-    conn.close()
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'job_id': job_id}), 202
 
 @app.route('/api/dashboard_stats')
+@httpcache.cached('student')
 def dashboard_stats():
     if 'user_id' not in session:
         return jsonify({'error': 'غير مسموح'}), 401
     
-    conn = sqlite3.connect('islamic_app.db')
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get completed lessons count
-    cursor.execute('SELECT COUNT(*) FROM student_progress WHERE student_id = ?', (session['user_id'],))
-    lessons_completed = cursor.fetchone()[0]
-    
-    # Get Quran pages read
-    cursor.execute('SELECT COUNT(*) FROM quran_progress WHERE student_id = ? AND read_count > 0', (session['user_id'],))
-    quran_pages_read = cursor.fetchone()[0]
-    
-    # Get quiz average
-    cursor.execute('SELECT AVG(quiz_score) FROM student_progress WHERE student_id = ? AND quiz_score IS NOT NULL', 
-                   (session['user_id'],))
-    quiz_avg = cursor.fetchone()[0] or 0
+    # Single primary-key read of the counters maintained by the student_stats triggers
+    return jsonify(stats.get_student_stats(cursor, session['user_id']))
+
+@app.route('/api/activity')
+def activity_history():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
     
-    conn.close()
+    days = request.args.get('days', activity.ACTIVITY_HEATMAP_DAYS, type=int)
+    student_id = request.args.get('student_id', session['user_id'], type=int)
+    if not 1 <= days <= activity.ACTIVITY_MAX_DAYS:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    cursor = get_db().cursor()
+    if student_id != session['user_id']:
+        # Teachers see their own students, developers and main teachers everyone
+        if session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+            return jsonify({'error': 'غير مسموح'}), 401
+        cursor.execute('SELECT teacher_id FROM users WHERE id = ?', (student_id,))
+        student = cursor.fetchone()
+        if student is None or (session['user_type'] == 'teacher' and student[0] != session['user_id']):
+            return jsonify({'error': 'غير موجود'}), 404
+    
+    # Rollup rows plus the few events the workers have not folded yet
+    return jsonify(activity.get_activity(cursor, student_id, days))
+
+@app.route('/api/leaderboard')
+def leaderboard():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
     
-    return jsonify({
-        'lessons_completed': lessons_completed,
-        'quran_pages_read': quran_pages_read,
-        'quiz_average': round(quiz_avg, 1),
-        'attendance_days': 22  # This would be calculated based on login history
-    })
+    week = request.args.get('week')
+    if week and not (len(week) == 7 and week[:4].isdigit() and week[4] == '-' and week[5:].isdigit()):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    name = rankings.board_name(request.args.get('board', 'all'), request.args.get('topic'), week)
+    scope = request.args.get('scope', 'all')
+    if name is None or scope not in ('all', 'class'):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    cursor = get_db().cursor()
+    teacher_id = None
+    if scope == 'class':
+        # A teacher's own class, or the class of the student's teacher
+        if session.get('user_type') in ['developer', 'main_teacher', 'teacher']:
+            teacher_id = session['user_id']
+        else:
+            cursor.execute('SELECT teacher_id FROM users WHERE id = ?', (session['user_id'],))
+            teacher_id = (cursor.fetchone() or (None,))[0]
+            if teacher_id is None:
+                return jsonify({'error': 'غير موجود'}), 404
+    
+    return jsonify(rankings.leaderboard(cursor, name, session['user_id'], teacher_id,
+                                        request.args.get('limit', rankings.LEADERBOARD_PAGE_SIZE, type=int),
+                                        request.args.get('offset', 0, type=int)))
 
 @app.route('/api/connect_to_teacher', methods=['POST'])
+@retry_on_busy
 def connect_to_teacher():
     if 'user_id' not in session:
         return jsonify({'error': 'غير مسموح'}), 401
@@ -380,7 +622,7 @@ def connect_to_teacher():
     data = request.get_json()
     student_code = data.get('student_code')
     
-    conn = sqlite3.connect('islamic_app.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # Find student by code
@@ -393,10 +635,302 @@ def connect_to_teacher():
     # Connect student to teacher
     cursor.execute('UPDATE users SET teacher_id = ? WHERE id = ?', (session['user_id'], student[0]))
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True, 'message': 'تم ربط الطالب بنجاح'})
 
+@app.route('/api/teacher/overview')
+def teacher_overview():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    if sort not in roster.SORTS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    if request.args.get('format') == 'csv':
+        return Response(roster.export_csv(db.connection, session['user_id'], sort, order == 'desc'),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=class_overview.csv'})
+    
+    cursor = get_db().cursor()
+    students, next_offset = roster.students(cursor, session['user_id'], sort, order == 'desc',
+                                            request.args.get('limit', roster.ROSTER_PAGE_SIZE, type=int),
+                                            request.args.get('offset', 0, type=int))
+    return jsonify({'summary': roster.summary(cursor, session['user_id']),
+                    'students': students, 'next_offset': next_offset})
+
+@app.route('/api/chat/<room_id>/messages', methods=['GET'])
+def chat_history(room_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    if not chat_hub.valid_room(room_id):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', chat_hub.HISTORY_PAGE_SIZE, type=int)
+    
+    messages, next_before = chat_hub.load_history(get_db().cursor(), room_id, before, limit)
+    return jsonify({'messages': messages, 'next_before': next_before})
+
+@app.route('/api/chat/<room_id>/messages', methods=['POST'])
+def post_chat_message(room_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    data = request.get_json()
+    message = (data.get('message') or '').strip()
+    if not chat_hub.valid_room(room_id) or not message or len(message) > chat_hub.MESSAGE_MAX_LENGTH:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    # Persisted by the hub in the next batch and delivered through the stream
+    chat_hub.get_hub().post(room_id, session['user_id'], message)
+    return jsonify({'success': True}), 202
+
+@app.route('/api/chat/<room_id>/stream')
+def chat_stream(room_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    if not chat_hub.valid_room(room_id):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    # EventSource sends Last-Event-ID on reconnect; the first connect passes ?after=
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', type=int)
+    events = chat_hub.open_stream(stream_with_context(chat_hub.stream(room_id, session['user_id'], last_event_id)))
+    if events is None:
+        return chat_hub.busy_stream()
+    return Response(events,
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/live/sessions')
+def live_sessions():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    return jsonify({'sessions': live_hub.active_sessions(get_db().cursor(), session['user_id'], session.get('user_type'))})
+
+@app.route('/api/live/sessions', methods=['POST'])
+@retry_on_busy
+def start_live_session():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    title = (data.get('title') or '').strip()
+    description = (data.get('description') or '').strip()
+    if not title or len(title) > live_hub.TITLE_MAX_LENGTH or len(description) > live_hub.DESCRIPTION_MAX_LENGTH:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    session_id, ended = live_hub.start_session(cursor, session['user_id'], title, description)
+    conn.commit()
+    
+    hub = live_hub.get_hub()
+    for ended_id in ended:
+        hub.end(ended_id)
+    return jsonify({'success': True, 'session': live_hub.get_session(cursor, session_id)}), 201
+
+@app.route('/api/live/sessions/<int:session_id>', methods=['POST'])
+@retry_on_busy
+def update_live_session(session_id):
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    title = (data.get('title') or '').strip()
+    description = (data.get('description') or '').strip()
+    if not title or len(title) > live_hub.TITLE_MAX_LENGTH or len(description) > live_hub.DESCRIPTION_MAX_LENGTH:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    conn = get_db()
+    if not live_hub.update_session(conn.cursor(), session['user_id'], session_id, title, description):
+        return jsonify({'error': 'غير موجود'}), 404
+    conn.commit()
+    return jsonify({'success': True})
+
+@app.route('/api/live/sessions/<int:session_id>/end', methods=['POST'])
+@retry_on_busy
+def end_live_session(session_id):
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    conn = get_db()
+    if not live_hub.end_sessions(conn.cursor(), session['user_id'], session_id):
+        return jsonify({'error': 'غير موجود'}), 404
+    conn.commit()
+    
+    # Viewers are told through the stream and their connections closed
+    live_hub.get_hub().end(session_id)
+    return jsonify({'success': True})
+
+@app.route('/api/live/sessions/<int:session_id>/frames', methods=['POST'])
+def post_live_frame(session_id):
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    # One binary frame (see live_hub.py) per batch of pen movement. An oversized one is
+    # refused on its Content-Length, and a body without one is read no further than the limit.
+    if (request.content_length or 0) > live_hub.MAX_FRAME_BYTES:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 413
+    frame = request.stream.read(live_hub.MAX_FRAME_BYTES + 1)
+    try:
+        live_hub.parse_client_frame(frame)
+    except live_hub.FrameError:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    if not live_hub.owns_active_session(get_db().cursor(), session['user_id'], session_id):
+        return jsonify({'error': 'غير موجود'}), 404
+    
+    live_hub.get_hub().post(session_id, frame)
+    return '', 202
+
+@app.route('/api/live/sessions/<int:session_id>/stream')
+def live_session_stream(session_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    # Not get_db(): the request context, and with it that connection, lives as long as the stream
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        live = live_hub.get_session(cursor, session_id)
+        if live is not None and not live_hub.can_view(cursor, live, session['user_id'], session.get('user_type')):
+            live = None
+    if live is None:
+        return jsonify({'error': 'غير موجود'}), 404
+    if not live['is_active']:
+        # 204 stops EventSource from reconnecting
+        return '', 204
+    
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    events = chat_hub.open_stream(stream_with_context(live_hub.stream(session_id, session['user_id'], last_event_id)))
+    if events is None:
+        return chat_hub.busy_stream()
+    return Response(events,
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/admin/import/<kind>', methods=['POST'])
+def import_content(kind):
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    if kind not in ('lessons', 'questions'):
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    # Multipart upload (spooled to disk by werkzeug) or the raw request body
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get('format') or bulk.detect_format(upload.filename if upload else None, request.mimetype)
+    if fmt not in bulk.FORMATS:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    created_by = session['user_id']
+    
+    # One NDJSON progress line per committed chunk, then the summary
+    def generate():
+        with db.connection() as conn:
+            updates = bulk.import_records(conn, kind, stream, fmt, created_by=created_by)
+            try:
+                for update in updates:
+                    yield json.dumps(update, ensure_ascii=False) + '\n'
+            finally:
+                # A client that goes away stops the import between chunks: the committed chunks
+                # stay, and the importer is closed and anything open rolled back now, before the
+                # connection goes back to the pool, not whenever the generators are collected
+                updates.close()
+                if conn.in_transaction:
+                    conn.rollback()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/admin/export/<kind>')
+def export_content(kind):
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    fmt = request.args.get('format', 'jsonl')
+    lesson_id = request.args.get('lesson_id', type=int)
+    if kind not in ('lessons', 'questions') or fmt not in bulk.FORMATS:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(bulk.export_records(db.connection, kind, fmt, lesson_id), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+
+@app.route('/api/jobs/<int:job_id>')
+def job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    job = jobs.get_job(get_db().cursor(), job_id)
+    if job is None:
+        return jsonify({'error': 'غير موجود'}), 404
+    if job['created_by'] != session['user_id'] and \
+            session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    return jsonify(job)
+
+@app.route('/api/jobs')
+def job_queue_stats():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    worker = jobs.get_worker()
+    return jsonify({'queue': jobs.queue_stats(get_db().cursor()), 'worker': worker.stats() if worker else None})
+
+@app.route('/api/admin/jobs', methods=['POST'])
+@retry_on_busy
+def enqueue_task():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    if data.get('kind') not in jobs.TASK_HANDLERS:
+        return jsonify({'error': 'بيانات غير صحيحة'}), 400
+    
+    conn = get_db()
+    job_id = jobs.enqueue(conn.cursor(), data['kind'], {}, session['user_id'])
+    conn.commit()
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+@app.route('/api/pool_stats')
+def pool_stats():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    return jsonify(db.pool_stats())
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    return jsonify(dict(cache.get_cache().stats(), responses=httpcache.get_response_cache().stats()))
+
+@app.route('/api/auth_stats')
+def auth_stats():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    return jsonify(auth.auth_stats())
+
+@app.route('/api/session_stats')
+def session_stats():
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher', 'teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    return jsonify(session_store.get_store().stats())
+
+@app.route('/api/admin/users/<int:user_id>/revoke_sessions', methods=['POST'])
+@retry_on_busy
+def revoke_sessions(user_id):
+    if 'user_id' not in session or session.get('user_type') not in ['developer', 'main_teacher']:
+        return jsonify({'error': 'غير مسموح'}), 401
+    
+    conn = get_db()
+    removed = session_store.revoke_user_sessions(conn.cursor(), user_id)
+    conn.commit()
+    return jsonify({'success': True, 'revoked': removed})
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -404,7 +938,7 @@ def logout():
 
 # Initialize sample data
 def init_sample_data():
-    conn = sqlite3.connect('islamic_app.db')
+    conn = db.get_pool().acquire()
     cursor = conn.cursor()
     
     # Check if lessons already exist
@@ -419,22 +953,55 @@ def init_sample_data():
             ('التفسير', 'فهم معاني القرآن الكريم', 'دراسة تفسير القرآن...', '', 'تفسير', 1)
         ]
         
-        for lesson in sample_lessons:
-            cursor.execute('''INSERT INTO lessons (title, description, content, video_url, topic, created_by) 
-                             VALUES (?, ?, ?, ?, ?, ?)''', lesson)
+        cursor.executemany('''INSERT INTO lessons (title, description, content, video_url, topic, created_by) 
+                              VALUES (?, ?, ?, ?, ?, ?)''', sample_lessons)
         
         # Add sample quiz questions
-        for lesson_id in range(1, 6):
-            for i in range(50):
-                cursor.execute('''INSERT INTO quiz_questions 
-                                 (lesson_id, question, option_a, option_b, option_c, option_d, correct_answer) 
-                                 VALUES (?, ?, ?, ?, ?, ?, ?)''', 
-                              (lesson_id, f'ما هو السؤال رقم {i+1}؟', 'الخيار الأول', 'الخيار الثاني', 'الخيار الثالث', 'الخيار الرابع', 'a'))
+        cursor.executemany('''INSERT INTO quiz_questions 
+                              (lesson_id, question, option_a, option_b, option_c, option_d, correct_answer) 
+                              VALUES (?, ?, ?, ?, ?, ?, ?)''', 
+                           [(lesson_id, f'ما هو السؤال رقم {i+1}؟', 'الخيار الأول', 'الخيار الثاني', 'الخيار الثالث', 'الخيار الرابع', 'a')
+                            for lesson_id in range(1, 6) for i in range(50)])
     
     conn.commit()
-    conn.close()
+    cache.invalidate_lessons()
+    db.get_pool().release(conn)
+
+_initialized_pid = None
+
+def create_app(config=None):
+    # Configures the app for this process and initializes the schema once per database.
+    # gunicorn.conf.py calls this in the master (preload_app), so workers fork ready to serve.
+    global _initialized_pid
+    if config:
+        app.config.update(config)
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = settings.load_secret_key()
+
+    if _initialized_pid is None:
+        if app.config['INIT_DB']:
+            bootstrap()
+        if app.config['BUILD_ASSETS'] and assets.is_stale():
+            assets.build()
+        # Mapped before fork so every worker shares it
+        mushaf.get_store()
+        if app.config['PRELOAD_TEMPLATES']:
+            for name in app.jinja_env.list_templates(extensions=['html']):
+                app.jinja_env.get_template(name)
+        _initialized_pid = os.getpid()
+    return app
+
+def bootstrap():
+    # Other workers wait on the lock, then find the schema current and skip straight past
+    with settings.init_lock(db.DATABASE):
+        with db.connection() as conn:
+            up_to_date = migrations.current_version(conn) >= migrations.MIGRATIONS[-1][0]
+        if not up_to_date:
+            init_db()
+            init_sample_data()
+    # Nothing opened here may be used across fork()
+    db.get_pool().close_all()
 
 if __name__ == '__main__':
-    init_db()
-    init_sample_data()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app()
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG', '1') == '1')
@@ -0,0 +1,210 @@
+import sqlite3
+import sys
+from datetime import datetime
+
+import activity
+import chat_hub
+import fulltext
+import httpcache
+import jobs
+import live_hub
+import progress
+import quiz
+import rankings
+import revision
+import session_store
+import stats
+
+# Ordered schema migrations applied on top of the tables created by init_db().
+# Each step runs in its own IMMEDIATE transaction and is recorded in schema_version,
+# so every worker can call migrate() at startup and only the first one does the work.
+# Never edit or reorder a released step: append a new one instead.
+# Steps take their DDL from the versioned lists of the feature modules (STUDENT_STATS_SCHEMA_V1,
+# ...), never from whatever those modules create today. A released list is frozen like its
+# step: a schema change is a new list (DATA_VERSIONS_SCHEMA_V2) holding only the change, and a
+# new step that applies it. tests/test_migrations.py pins what every step creates.
+
+
+def _execute(cursor, statements):
+    for statement in statements:
+        cursor.execute(statement)
+
+
+def _quran_progress_unique(cursor):
+    progress.merge_duplicate_quran_progress(cursor)
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_quran_progress_student_page
+                      ON quran_progress (student_id, page_number)''')
+
+
+def _student_progress_covering(cursor):
+    # Covers the per-student COUNT/AVG in dashboard_stats and the
+    # (student_id, lesson_id) lookup in mark_lesson_completed without touching the table
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_student_progress_student_lesson
+                      ON student_progress (student_id, lesson_id, quiz_score)''')
+
+
+def _quiz_questions_lesson(cursor):
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_questions_lesson
+                      ON quiz_questions (lesson_id)''')
+
+
+def _lessons_created_at(cursor):
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_lessons_created_at
+                      ON lessons (created_at DESC, id DESC)''')
+
+
+def _chat_messages_room(cursor):
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_chat_messages_room
+                      ON chat_messages (room_id, id)''')
+
+
+def _users_teacher(cursor):
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_users_teacher
+                      ON users (teacher_id)''')
+
+
+def _student_stats(cursor):
+    _execute(cursor, stats.STUDENT_STATS_SCHEMA_V1)
+    stats.rebuild_student_stats(cursor)
+
+
+def _lessons_topic_created_at(cursor):
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_lessons_topic_created_at
+                      ON lessons (topic, created_at DESC, id DESC)''')
+
+
+def _quiz_attempts(cursor):
+    _execute(cursor, quiz.QUIZ_SCHEMA_V1)
+
+
+def _chat_presence(cursor):
+    _execute(cursor, chat_hub.CHAT_SCHEMA_V1)
+
+
+def _search_index(cursor):
+    _execute(cursor, fulltext.SEARCH_SCHEMA_V1)
+    fulltext.rebuild_search_index(cursor)
+
+
+def _review_schedule(cursor):
+    _execute(cursor, revision.REVIEW_SCHEMA_V1)
+    revision.enroll_memorized(cursor)
+
+
+def _jobs(cursor):
+    _execute(cursor, jobs.JOBS_SCHEMA_V1)
+
+
+def _data_versions(cursor):
+    _execute(cursor, httpcache.DATA_VERSIONS_SCHEMA_V1)
+
+
+def _live_sessions(cursor):
+    _execute(cursor, live_hub.LIVE_SCHEMA_V1)
+
+
+def _leaderboards(cursor):
+    _execute(cursor, rankings.LEADERBOARD_SCHEMA_V1)
+    rankings.rebuild_leaderboards(cursor)
+
+
+def _user_sessions(cursor):
+    _execute(cursor, session_store.SESSION_SCHEMA_V1)
+
+
+def _activity_log(cursor):
+    _execute(cursor, activity.ACTIVITY_SCHEMA_V1)
+    activity.backfill_rollups(cursor)
+
+
+def _attendance_versions(cursor):
+    _execute(cursor, httpcache.DATA_VERSIONS_SCHEMA_V2)
+
+
+MIGRATIONS = [
+    (1, 'unique quran_progress (student_id, page_number)', _quran_progress_unique),
+    (2, 'covering index on student_progress', _student_progress_covering),
+    (3, 'index quiz_questions by lesson', _quiz_questions_lesson),
+    (4, 'index lessons by creation date', _lessons_created_at),
+    (5, 'index chat_messages by room', _chat_messages_room),
+    (6, 'index users by teacher', _users_teacher),
+    (7, 'student_stats summary table and triggers', _student_stats),
+    (8, 'index lessons by topic and creation date', _lessons_topic_created_at),
+    (9, 'quiz attempts and per-question results', _quiz_attempts),
+    (10, 'chat presence heartbeats', _chat_presence),
+    (11, 'FTS5 search index over lessons and quiz questions', _search_index),
+    (12, 'spaced-repetition schedule on quran_progress', _review_schedule),
+    (13, 'durable background job queue', _jobs),
+    (14, 'data version counters for HTTP caching', _data_versions),
+    (15, 'live session frames, board snapshots and presence', _live_sessions),
+    (16, 'leaderboard scores maintained by triggers', _leaderboards),
+    (17, 'server-side sessions', _user_sessions),
+    (18, 'activity event log with daily and weekly rollups', _activity_log),
+    (19, 'bump student data versions on new attendance days', _attendance_versions),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn):
+    _ensure_version_table(conn)
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn, target=None):
+    # Apply every pending step up to target (default: latest); returns the versions applied
+    _ensure_version_table(conn)
+    if conn.in_transaction:
+        conn.commit()
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if target is not None and version > target:
+            break
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-check under the write lock: another worker may have just applied it
+            done = conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone()
+            if done:
+                conn.rollback()
+                continue
+
+            cursor = conn.cursor()
+            step(cursor)
+            cursor.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                           (version, description, datetime.now()))
+            conn.commit()
+            applied.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+
+    return applied
+
+
+def status(conn):
+    _ensure_version_table(conn)
+    rows = dict(conn.execute('SELECT version, applied_at FROM schema_version').fetchall())
+    return [(version, description, rows.get(version)) for version, description, _ in MIGRATIONS]
+
+
+if __name__ == '__main__':
+    import db
+
+    with db.get_pool().connection() as conn:
+        if len(sys.argv) > 1 and sys.argv[1] == 'status':
+            for version, description, applied_at in status(conn):
+                print(f'{version:>3}  {"applied " + str(applied_at) if applied_at else "pending":<36}  {description}')
+        else:
+            applied = migrate(conn)
+            print(f'applied {len(applied)} migration(s), schema version {current_version(conn)}')
@@ -0,0 +1,207 @@
+import functools
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import xml.etree.ElementTree as ElementTree
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Quran text served by page for QuranReader. The mushaf is built once into a single file
+# (python mushaf.py build) holding every page as a ready JSON body, plus its gzip and brotli
+# forms, behind a fixed-size index. Each process memory-maps the file, so a page request is
+# an index lookup and a slice: no database, no JSON encoding, no compression per request,
+# and forked workers share the mapped pages through the OS page cache.
+#
+# File layout (little endian):
+#   header  MAGIC, page count (H), metadata length (I), version (16 bytes)
+#   index   per page: identity offset/length, gzip offset/length, brotli offset/length (6I)
+#   blobs   metadata JSON, then the page bodies; a brotli length of 0 means none was built
+
+QURAN_DATA_PATH = os.environ.get('QURAN_DATA_PATH', os.path.join('data', 'mushaf.bin'))
+# Unversioned URLs are revalidated after this; ?v=<version> URLs are cached for a year
+QURAN_MAX_AGE = int(os.environ.get('QURAN_MAX_AGE', '86400'))
+QURAN_IMMUTABLE_AGE = 31536000
+QURAN_RANGE_MAX = 20
+QURAN_PREFETCH = 2
+RANGE_CACHE_SIZE = 256
+
+MAGIC = b'MSHF1\x00'
+HEADER = struct.Struct('<6sHI16s')
+INDEX_ENTRY = struct.Struct('<6I')
+ENCODINGS = ('identity', 'gzip', 'br')
+
+
+class MushafStore:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.page_count, meta_length, version = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a mushaf store')
+        self.version = version.hex()
+
+        index_start = HEADER.size
+        self._index = [INDEX_ENTRY.unpack_from(self._map, index_start + i * INDEX_ENTRY.size)
+                       for i in range(self.page_count)]
+        meta_start = index_start + self.page_count * INDEX_ENTRY.size
+        self.meta = json.loads(self._map[meta_start:meta_start + meta_length])
+        self.range_body = functools.lru_cache(maxsize=RANGE_CACHE_SIZE)(self._range_body)
+
+    def etag(self, first, last=None, encoding='identity'):
+        # Strong validators, so each encoding of a page gets its own
+        tag = f'{self.version[:16]}-{first}' if last is None else f'{self.version[:16]}-{first}-{last}'
+        return tag if encoding == 'identity' else f'{tag}-{encoding}'
+
+    def page_body(self, page, encoding='identity'):
+        entry = self._index[page - 1]
+        offset, length = entry[ENCODINGS.index(encoding) * 2:ENCODINGS.index(encoding) * 2 + 2]
+        if not length:
+            return None
+        return self._map[offset:offset + length]
+
+    def _range_body(self, first, last, encoding):
+        # Ranges are joined from the page bodies and compressed once, then kept in the LRU
+        body = b'{"pages":[' + b','.join(self.page_body(page) for page in range(first, last + 1)) + b']}'
+        return compress(body, encoding, level=6)
+
+    def close(self):
+        self._map.close()
+
+
+def compress(body, encoding, level=9):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if level == 9 else 5) if brotli else None
+    return body
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # None when the mushaf has not been built on this machine
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None and os.path.exists(QURAN_DATA_PATH):
+                _store = MushafStore(QURAN_DATA_PATH)
+    return _store
+
+
+def choose_encoding(accept_encodings):
+    # werkzeug Accept: quality of each coding, 0 when the client did not offer it
+    for encoding in ('br', 'gzip'):
+        if (encoding != 'br' or brotli is not None) and accept_encodings[encoding]:
+            return encoding
+    return 'identity'
+
+
+def not_modified(if_none_match, store, first, last=None):
+    # If-None-Match uses weak comparison, so any encoding of the same pages matches
+    return any(if_none_match.contains_weak(store.etag(first, last, encoding)) for encoding in ENCODINGS)
+
+
+# Build
+
+def _read_text(path):
+    # Tanzil text export: sura|aya|text, lines starting with # are comments
+    verses = {}
+    with open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            sura, aya, text = line.split('|', 2)
+            verses[(int(sura), int(aya))] = text
+    return verses
+
+
+def _read_metadata(path):
+    # Tanzil quran-data.xml: sura names and the first verse of each mushaf page
+    root = ElementTree.parse(path).getroot()
+    suras = {int(sura.get('index')): {'name': sura.get('name'), 'ayas': int(sura.get('ayas'))}
+             for sura in root.iter('sura') if sura.get('ayas')}
+    page_starts = [(int(page.get('sura')), int(page.get('aya'))) for page in root.iter('page')]
+    return suras, page_starts
+
+
+def build(text_path, metadata_path, output=QURAN_DATA_PATH):
+    verses = _read_text(text_path)
+    suras, page_starts = _read_metadata(metadata_path)
+    order = [(sura, aya) for sura in sorted(suras) for aya in range(1, suras[sura]['ayas'] + 1)]
+    missing = [key for key in order if key not in verses]
+    if missing:
+        raise ValueError(f'text is missing {len(missing)} verses, first {missing[0]}')
+
+    positions = {key: index for index, key in enumerate(order)}
+    bounds = [positions[start] for start in page_starts] + [len(order)]
+    sura_pages = {}
+    bodies = []
+    for page in range(1, len(page_starts) + 1):
+        page_verses = order[bounds[page - 1]:bounds[page]]
+        for sura, aya in page_verses:
+            sura_pages.setdefault(sura, page)
+        page_suras = sorted({sura for sura, _ in page_verses})
+        bodies.append(json.dumps({
+            'page': page,
+            'total': len(page_starts),
+            'suras': {str(sura): suras[sura]['name'] for sura in page_suras},
+            'verses': [[sura, aya, verses[(sura, aya)]] for sura, aya in page_verses],
+        }, ensure_ascii=False, separators=(',', ':')).encode())
+
+    meta = json.dumps({
+        'pages': len(page_starts),
+        'suras': [[sura, suras[sura]['name'], sura_pages[sura]] for sura in sorted(suras)],
+    }, ensure_ascii=False, separators=(',', ':')).encode()
+    version = hashlib.sha256(meta + b''.join(bodies)).digest()[:16]
+
+    blobs = [meta]
+    offset = HEADER.size + len(bodies) * INDEX_ENTRY.size + len(meta)
+    index = []
+    for body in bodies:
+        entry = []
+        for encoding in ENCODINGS:
+            blob = compress(body, encoding) or b''
+            entry += [offset if blob else 0, len(blob)]
+            blobs.append(blob)
+            offset += len(blob)
+        index.append(entry)
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    tmp = f'{output}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(bodies), len(meta), version))
+        for entry in index:
+            f.write(INDEX_ENTRY.pack(*entry))
+        for blob in blobs:
+            f.write(blob)
+    # Running workers keep their mapping of the old file until they restart
+    os.replace(tmp, output)
+    return len(bodies), offset
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'info'):
+        print('usage: python mushaf.py build <quran-uthmani.txt> <quran-data.xml> [output]\n'
+              '       python mushaf.py info [path]', file=sys.stderr)
+        sys.exit(2)
+
+    if sys.argv[1] == 'build':
+        pages, size = build(*sys.argv[2:5])
+        print(f'{pages} pages, {size} bytes')
+        if brotli is None:
+            print('brotli is not installed: only gzip bodies were built', file=sys.stderr)
+    else:
+        store = MushafStore(sys.argv[2] if len(sys.argv) > 2 else QURAN_DATA_PATH)
+        print(f'{store.page_count} pages, {len(store.meta["suras"])} suras, version {store.version}')
@@ -0,0 +1,132 @@
+import sys
+from datetime import datetime
+
+QURAN_ACTIONS = ('read', 'memorized')
+QURAN_PAGES = 604
+QURAN_BATCH_LIMIT = 1000
+
+# One statement for both actions, backed by idx_quran_progress_student_page.
+# A 'read' bumps read_count and last_read, 'memorized' flips the flag and puts the page
+# in the revision schedule (revision.py) from the next day, unless it is already there.
+QURAN_UPSERT = '''
+    INSERT INTO quran_progress (student_id, page_number, memorized, read_count, last_read, next_review)
+    VALUES (:student_id, :page_number,
+            CASE WHEN :action = 'memorized' THEN 'true' ELSE 'false' END,
+            CASE WHEN :action = 'read' THEN 1 ELSE 0 END,
+            :ts,
+            CASE WHEN :action = 'memorized' THEN date(:ts, '+1 day') END)
+    ON CONFLICT (student_id, page_number) DO UPDATE SET
+        read_count = read_count + excluded.read_count,
+        memorized = CASE WHEN excluded.memorized = 'true' THEN 'true' ELSE memorized END,
+        last_read = CASE WHEN excluded.read_count > 0 THEN MAX(last_read, excluded.last_read) ELSE last_read END,
+        next_review = COALESCE(next_review, excluded.next_review)
+'''
+
+
+def valid_quran_event(page_number, action):
+    return (isinstance(page_number, int) and not isinstance(page_number, bool)
+            and 1 <= page_number <= QURAN_PAGES and action in QURAN_ACTIONS)
+
+
+def quran_event(student_id, page_number, action, ts=None):
+    return {
+        'student_id': student_id,
+        'page_number': page_number,
+        'action': action,
+        'ts': ts or datetime.now(),
+    }
+
+
+def track_quran_page(cursor, student_id, page_number, action, ts=None):
+    cursor.execute(QURAN_UPSERT, quran_event(student_id, page_number, action, ts))
+
+
+def parse_quran_events(student_id, events, now=None):
+    # Client events are {page_number, action, ts} with ts in epoch milliseconds.
+    # Returns (valid events ready for executemany, number rejected).
+    now = now or datetime.now()
+    parsed = []
+    rejected = 0
+    for event in events[:QURAN_BATCH_LIMIT]:
+        if not isinstance(event, dict) or not valid_quran_event(event.get('page_number'), event.get('action')):
+            rejected += 1
+            continue
+
+        ts = now
+        try:
+            ts = min(datetime.fromtimestamp(float(event['ts']) / 1000), now)
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            pass
+        parsed.append(quran_event(student_id, event['page_number'], event['action'], ts))
+
+    rejected += max(len(events) - QURAN_BATCH_LIMIT, 0)
+    return parsed, rejected
+
+
+def track_quran_pages(cursor, events):
+    cursor.executemany(QURAN_UPSERT, events)
+
+
+def merge_duplicate_quran_progress(cursor):
+    # Fold duplicate (student_id, page_number) rows into the oldest one:
+    # read counts are summed, memorized wins, the latest last_read is kept.
+    cursor.execute('''
+        CREATE TEMP TABLE quran_progress_merged AS
+        SELECT MIN(id) AS id,
+               student_id,
+               page_number,
+               MAX(CASE WHEN memorized = 'true' THEN 'true' ELSE 'false' END) AS memorized,
+               SUM(COALESCE(read_count, 0)) AS read_count,
+               MAX(last_read) AS last_read,
+               COUNT(*) AS copies
+        FROM quran_progress
+        GROUP BY student_id, page_number
+        HAVING COUNT(*) > 1
+    ''')
+    cursor.execute('SELECT COUNT(*), COALESCE(SUM(copies - 1), 0) FROM quran_progress_merged')
+    groups, removed = cursor.fetchone()
+
+    if groups:
+        cursor.execute('''
+            DELETE FROM quran_progress
+            WHERE id IN (
+                SELECT q.id FROM quran_progress q
+                JOIN quran_progress_merged m
+                  ON q.student_id IS m.student_id AND q.page_number IS m.page_number
+                WHERE q.id != m.id
+            )
+        ''')
+        cursor.execute('''
+            UPDATE quran_progress
+            SET memorized = (SELECT memorized FROM quran_progress_merged m WHERE m.id = quran_progress.id),
+                read_count = (SELECT read_count FROM quran_progress_merged m WHERE m.id = quran_progress.id),
+                last_read = (SELECT last_read FROM quran_progress_merged m WHERE m.id = quran_progress.id)
+            WHERE id IN (SELECT id FROM quran_progress_merged)
+        ''')
+
+    cursor.execute('DROP TABLE quran_progress_merged')
+    return groups, removed
+
+
+def dedup_quran_progress(conn):
+    # One-off repair for databases that collected duplicate rows before the unique index
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        groups, removed = merge_duplicate_quran_progress(conn.cursor())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return groups, removed
+
+
+if __name__ == '__main__':
+    import db
+
+    if sys.argv[1:] != ['dedup']:
+        print('usage: python progress.py dedup')
+        sys.exit(1)
+
+    with db.get_pool().connection() as conn:
+        groups, removed = dedup_quran_progress(conn)
+        print(f'merged {groups} duplicated page(s), removed {removed} row(s)')
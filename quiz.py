@@ -0,0 +1,162 @@
+import json
+import random
+from datetime import datetime
+
+import activity
+import cache
+
+# Server-side quiz sessions: questions are sampled per attempt, sent without
+# correct_answer, and graded on submit with one query over the attempt's questions.
+
+QUIZ_SIZE = 10
+QUIZ_SIZE_MAX = 50
+QUIZ_OPTIONS = ('a', 'b', 'c', 'd')
+
+QUIZ_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS quiz_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        lesson_id INTEGER NOT NULL,
+        question_ids TEXT NOT NULL,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        submitted_at TIMESTAMP,
+        correct_count INTEGER,
+        score INTEGER,
+        FOREIGN KEY (student_id) REFERENCES users (id),
+        FOREIGN KEY (lesson_id) REFERENCES lessons (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS quiz_attempt_answers (
+        attempt_id INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        answer TEXT,
+        is_correct INTEGER NOT NULL,
+        PRIMARY KEY (attempt_id, question_id),
+        FOREIGN KEY (attempt_id) REFERENCES quiz_attempts (id),
+        FOREIGN KEY (question_id) REFERENCES quiz_questions (id)
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_quiz_attempts_student ON quiz_attempts (student_id, lesson_id)',
+    'CREATE INDEX IF NOT EXISTS idx_quiz_attempt_answers_question ON quiz_attempt_answers (question_id, is_correct)',
+]
+
+
+class QuizError(Exception):
+    pass
+
+
+def question_ids(cursor, lesson_id):
+    # Id list per lesson comes from the covering idx_quiz_questions_lesson and is cached,
+    # so sampling never scans or sorts the question rows themselves
+    def load():
+        cursor.execute('SELECT id FROM quiz_questions WHERE lesson_id = ?', (lesson_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    return cache.get_cache().get_or_load(cache.lesson_questions_key(lesson_id, cache.lessons_version(cursor)), load)
+
+
+def start_attempt(cursor, student_id, lesson_id, count=QUIZ_SIZE):
+    count = max(1, min(int(count), QUIZ_SIZE_MAX))
+    ids = question_ids(cursor, lesson_id)
+    if not ids:
+        raise QuizError('no questions')
+
+    sampled = random.sample(ids, min(count, len(ids)))
+    placeholders = ','.join('?' * len(sampled))
+    cursor.execute(f'''SELECT id, question, option_a, option_b, option_c, option_d
+                       FROM quiz_questions WHERE id IN ({placeholders})''', sampled)
+    rows = {row[0]: row for row in cursor.fetchall()}
+
+    # Keep the sampled order; drop ids deleted since the id list was cached
+    sampled = [question_id for question_id in sampled if question_id in rows]
+    if not sampled:
+        raise QuizError('no questions')
+    cursor.execute('INSERT INTO quiz_attempts (student_id, lesson_id, question_ids, started_at) VALUES (?, ?, ?, ?)',
+                   (student_id, lesson_id, json.dumps(sampled), datetime.now()))
+
+    questions = [{
+        'id': row[0],
+        'question': row[1],
+        'option_a': row[2],
+        'option_b': row[3],
+        'option_c': row[4],
+        'option_d': row[5],
+    } for row in (rows[question_id] for question_id in sampled)]
+
+    return cursor.lastrowid, questions
+
+
+def _normalize_answers(answers):
+    # Accept {question_id: answer} or [{question_id, answer}, ...]
+    if isinstance(answers, dict):
+        items = answers.items()
+    elif isinstance(answers, list):
+        items = [(item.get('question_id'), item.get('answer')) for item in answers if isinstance(item, dict)]
+    else:
+        raise QuizError('invalid answers')
+
+    normalized = {}
+    for question_id, answer in items:
+        try:
+            question_id = int(question_id)
+        except (TypeError, ValueError):
+            continue
+        normalized[question_id] = answer if answer in QUIZ_OPTIONS else None
+    return normalized
+
+
+def submit_attempt(cursor, student_id, attempt_id, answers):
+    # Claim the attempt first so a double submit cannot grade it twice
+    submitted_at = datetime.now()
+    cursor.execute('''UPDATE quiz_attempts SET submitted_at = ?
+                      WHERE id = ? AND student_id = ? AND submitted_at IS NULL''',
+                   (submitted_at, attempt_id, student_id))
+    if cursor.rowcount != 1:
+        raise QuizError('unknown or already submitted attempt')
+
+    cursor.execute('SELECT lesson_id, question_ids FROM quiz_attempts WHERE id = ?', (attempt_id,))
+    attempt = cursor.fetchone()
+
+    lesson_id = attempt[0]
+    asked = json.loads(attempt[1])
+    answers = _normalize_answers(answers)
+
+    # All answers graded in one query
+    placeholders = ','.join('?' * len(asked))
+    cursor.execute(f'SELECT id, correct_answer FROM quiz_questions WHERE id IN ({placeholders})', asked)
+    correct_answers = dict(cursor.fetchall())
+
+    results = []
+    for question_id in asked:
+        answer = answers.get(question_id)
+        results.append((attempt_id, question_id, answer, int(answer is not None and answer == correct_answers.get(question_id))))
+
+    cursor.executemany('''INSERT INTO quiz_attempt_answers (attempt_id, question_id, answer, is_correct)
+                          VALUES (?, ?, ?, ?)''', results)
+
+    correct = sum(result[3] for result in results)
+    score = round(correct * 100 / len(asked)) if asked else 0
+    cursor.execute('UPDATE quiz_attempts SET correct_count = ?, score = ? WHERE id = ?',
+                   (correct, score, attempt_id))
+
+    # Same row the old client-graded path wrote, so stats and history keep working; local time
+    # like every other completed_at the app writes
+    cursor.execute('''INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at)
+                      VALUES (?, ?, ?, ?)''', (student_id, lesson_id, score, submitted_at))
+    activity.log_event(cursor, student_id, 'quiz', lesson_id, score)
+
+    return {
+        'attempt_id': attempt_id,
+        'lesson_id': lesson_id,
+        'correct': correct,
+        'total': len(asked),
+        'score': score,
+        'results': [{
+            'question_id': question_id,
+            'answer': answer,
+            'correct': bool(is_correct),
+            'correct_answer': correct_answers.get(question_id),
+        } for _, question_id, answer, is_correct in results],
+    }
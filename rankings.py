@@ -0,0 +1,375 @@
+import os
+import sys
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import date, timedelta
+
+# Leaderboards. Points are kept per board in leaderboard_scores by triggers on
+# student_progress and quran_progress, so every write path (quiz results, lesson
+# completions, batched page events, the job queue) moves them in the same transaction:
+#   'all'            every point a student has earned
+#   'topic:<topic>'  quiz and lesson points of the lessons in one topic
+#   'week:<YYYY-WW>' points of the rows dated in one week, by completed_at / last_read
+#                    (weeks start on Monday, as strftime %W); LEADERBOARD_WEEKS_KEPT are kept
+# Any board can be narrowed to the students of one teacher (users.teacher_id, copied onto
+# each row and kept in step by a trigger on users).
+#
+# Every change also stamps the row with the next 'leaderboard' version from data_versions.
+# Each worker holds the boards it serves in memory as sorted lists of (-score, student_id),
+# catches up by reading only the rows stamped after the version it last saw, and answers
+# "my position" with one bisect and the top N with a slice. A rebuild or prune also moves
+# the 'leaderboard:epoch' version, which makes every worker reload its boards.
+
+POINTS_PAGE_READ = 5
+POINTS_PAGE_MEMORIZED = 20
+# Quiz and lesson points are the quiz score itself (a completed lesson records 100), clamped
+# to 0-100 here so a bad row can never outweigh a whole class
+QUIZ_SCORE_MAX = 100
+
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_PAGE_MAX = 100
+LEADERBOARD_WEEKS_KEPT = int(os.environ.get('LEADERBOARD_WEEKS_KEPT', '8'))
+# Boards held in memory per worker, least recently used dropped first
+LEADERBOARD_MAX_BOARDS = int(os.environ.get('LEADERBOARD_MAX_BOARDS', '64'))
+
+VERSION_SCOPE = 'leaderboard'
+EPOCH_SCOPE = 'leaderboard:epoch'
+
+_SEQ = f"(SELECT version FROM data_versions WHERE scope = '{VERSION_SCOPE}')"
+_BUMP = f"UPDATE data_versions SET version = version + 1 WHERE scope = '{VERSION_SCOPE}';"
+
+
+def _add(board, student, points):
+    # Trigger body fragment: create the row if needed, then add the points and stamp it
+    return f'''
+        INSERT INTO leaderboard_scores (board, student_id, teacher_id, score, seq)
+        SELECT {board}, {student}, (SELECT teacher_id FROM users WHERE id = {student}), 0, 0
+        WHERE {board} IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM leaderboard_scores WHERE board = {board} AND student_id = {student});
+        UPDATE leaderboard_scores SET score = score + ({points}), seq = {_SEQ}
+        WHERE board = {board} AND student_id = {student};'''
+
+
+def _week(timestamp):
+    # Triggers and the rebuild bucket a row the same way: by its own timestamp, this week without one
+    return f"'week:' || strftime('%Y-%W', COALESCE({timestamp}, datetime('now', 'localtime')))"
+
+
+def _topic(lesson):
+    return f"(SELECT 'topic:' || topic FROM lessons WHERE id = {lesson} AND topic IS NOT NULL AND topic != '')"
+
+
+_QUIZ_POINTS = f"MAX(0, MIN({QUIZ_SCORE_MAX}, COALESCE({{row}}.quiz_score, 0)))"
+_QURAN_POINTS = f"(({{row}}.read_count > 0) * {POINTS_PAGE_READ} + ({{row}}.memorized = 'true') * {POINTS_PAGE_MEMORIZED})"
+
+LEADERBOARD_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS leaderboard_scores (
+        board TEXT NOT NULL,
+        student_id INTEGER NOT NULL,
+        teacher_id INTEGER,
+        score INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        PRIMARY KEY (board, student_id)
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_leaderboard_scores_seq ON leaderboard_scores (board, seq)',
+    'CREATE INDEX IF NOT EXISTS idx_leaderboard_scores_student ON leaderboard_scores (student_id)',
+    f"INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('{VERSION_SCOPE}', 0)",
+    f"INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('{EPOCH_SCOPE}', 0)",
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_student_progress_insert_leaderboard
+    AFTER INSERT ON student_progress WHEN NEW.student_id IS NOT NULL AND {_QUIZ_POINTS.format(row='NEW')} != 0
+    BEGIN
+        {_BUMP}
+        {_add("'all'", 'NEW.student_id', _QUIZ_POINTS.format(row='NEW'))}
+        {_add(_week('NEW.completed_at'), 'NEW.student_id', _QUIZ_POINTS.format(row='NEW'))}
+        {_add(_topic('NEW.lesson_id'), 'NEW.student_id', _QUIZ_POINTS.format(row='NEW'))}
+    END
+    ''',
+    # A row's points sit on the weekly board of its own timestamp, as in a rebuild: an update
+    # that moves the timestamp (a page read again later) moves the points along with it
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_student_progress_score_leaderboard
+    AFTER UPDATE OF quiz_score, completed_at ON student_progress
+    WHEN NEW.student_id IS NOT NULL
+     AND ({_QUIZ_POINTS.format(row='NEW')} != {_QUIZ_POINTS.format(row='OLD')}
+          OR {_week('NEW.completed_at')} != {_week('OLD.completed_at')})
+    BEGIN
+        {_BUMP}
+        {_add("'all'", 'NEW.student_id', f"{_QUIZ_POINTS.format(row='NEW')} - {_QUIZ_POINTS.format(row='OLD')}")}
+        {_add(_week('OLD.completed_at'), 'NEW.student_id', f"-{_QUIZ_POINTS.format(row='OLD')}")}
+        {_add(_week('NEW.completed_at'), 'NEW.student_id', _QUIZ_POINTS.format(row='NEW'))}
+        {_add(_topic('NEW.lesson_id'), 'NEW.student_id',
+              f"{_QUIZ_POINTS.format(row='NEW')} - {_QUIZ_POINTS.format(row='OLD')}")}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_student_progress_delete_leaderboard
+    AFTER DELETE ON student_progress WHEN OLD.student_id IS NOT NULL AND {_QUIZ_POINTS.format(row='OLD')} != 0
+    BEGIN
+        {_BUMP}
+        {_add("'all'", 'OLD.student_id', f"-{_QUIZ_POINTS.format(row='OLD')}")}
+        {_add(_week('OLD.completed_at'), 'OLD.student_id', f"-{_QUIZ_POINTS.format(row='OLD')}")}
+        {_add(_topic('OLD.lesson_id'), 'OLD.student_id', f"-{_QUIZ_POINTS.format(row='OLD')}")}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_quran_progress_insert_leaderboard
+    AFTER INSERT ON quran_progress WHEN NEW.student_id IS NOT NULL AND {_QURAN_POINTS.format(row='NEW')} > 0
+    BEGIN
+        {_BUMP}
+        {_add("'all'", 'NEW.student_id', _QURAN_POINTS.format(row='NEW'))}
+        {_add(_week('NEW.last_read'), 'NEW.student_id', _QURAN_POINTS.format(row='NEW'))}
+    END
+    ''',
+    # Re-reading a page earns nothing on the 'all' board: only a page read or memorized for
+    # the first time changes its points there
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_quran_progress_update_leaderboard
+    AFTER UPDATE OF read_count, memorized, last_read ON quran_progress
+    WHEN NEW.student_id IS NOT NULL
+     AND ({_QURAN_POINTS.format(row='NEW')} != {_QURAN_POINTS.format(row='OLD')}
+          OR {_week('NEW.last_read')} != {_week('OLD.last_read')})
+    BEGIN
+        {_BUMP}
+        {_add("'all'", 'NEW.student_id', f"{_QURAN_POINTS.format(row='NEW')} - {_QURAN_POINTS.format(row='OLD')}")}
+        {_add(_week('OLD.last_read'), 'NEW.student_id', f"-{_QURAN_POINTS.format(row='OLD')}")}
+        {_add(_week('NEW.last_read'), 'NEW.student_id', _QURAN_POINTS.format(row='NEW'))}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_quran_progress_delete_leaderboard
+    AFTER DELETE ON quran_progress WHEN OLD.student_id IS NOT NULL AND {_QURAN_POINTS.format(row='OLD')} > 0
+    BEGIN
+        {_BUMP}
+        {_add("'all'", 'OLD.student_id', f"-{_QURAN_POINTS.format(row='OLD')}")}
+        {_add(_week('OLD.last_read'), 'OLD.student_id', f"-{_QURAN_POINTS.format(row='OLD')}")}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_users_teacher_leaderboard
+    AFTER UPDATE OF teacher_id ON users WHEN NEW.teacher_id IS NOT OLD.teacher_id
+    BEGIN
+        {_BUMP}
+        UPDATE leaderboard_scores SET teacher_id = NEW.teacher_id, seq = {_SEQ} WHERE student_id = NEW.id;
+    END
+    ''',
+]
+
+
+def week_key(day=None):
+    return (day or date.today()).strftime('%Y-%W')
+
+
+def board_name(board, topic=None, week=None):
+    # Returns None for an unknown board or a missing topic
+    if board == 'all':
+        return 'all'
+    if board == 'week':
+        return f'week:{week or week_key()}'
+    if board == 'topic' and topic:
+        return f'topic:{topic}'
+    return None
+
+
+def _bump_epoch(cursor):
+    cursor.execute('UPDATE data_versions SET version = version + 1 WHERE scope IN (?, ?)', (VERSION_SCOPE, EPOCH_SCOPE))
+
+
+def rebuild_leaderboards(cursor, weeks=LEADERBOARD_WEEKS_KEPT):
+    # Recompute every board from the raw tables (weekly boards for the kept weeks only)
+    first_week = week_key(date.today() - timedelta(weeks=weeks - 1))
+    cursor.execute('DELETE FROM leaderboard_scores')
+    _bump_epoch(cursor)
+    cursor.execute(f'''
+        WITH points (student_id, board, score) AS (
+            SELECT student_id, 'all', {_QUIZ_POINTS.format(row='sp')} FROM student_progress sp
+            WHERE student_id IS NOT NULL
+            UNION ALL
+            SELECT sp.student_id, 'topic:' || l.topic, {_QUIZ_POINTS.format(row='sp')}
+            FROM student_progress sp JOIN lessons l ON l.id = sp.lesson_id
+            WHERE sp.student_id IS NOT NULL AND l.topic IS NOT NULL AND l.topic != ''
+            UNION ALL
+            SELECT student_id, {_week('sp.completed_at')}, {_QUIZ_POINTS.format(row='sp')} FROM student_progress sp
+            WHERE student_id IS NOT NULL
+            UNION ALL
+            SELECT student_id, 'all', {_QURAN_POINTS.format(row='qp')} FROM quran_progress qp
+            WHERE student_id IS NOT NULL
+            UNION ALL
+            SELECT student_id, {_week('qp.last_read')}, {_QURAN_POINTS.format(row='qp')} FROM quran_progress qp
+            WHERE student_id IS NOT NULL
+        )
+        INSERT INTO leaderboard_scores (board, student_id, teacher_id, score, seq)
+        SELECT p.board, p.student_id, u.teacher_id, SUM(p.score), {_SEQ}
+        FROM points p LEFT JOIN users u ON u.id = p.student_id
+        WHERE NOT (p.board >= 'week:' AND p.board < :first_week)
+        GROUP BY p.board, p.student_id
+        HAVING SUM(p.score) != 0
+    ''', {'first_week': f'week:{first_week}'})
+    return cursor.rowcount
+
+
+def prune_weeks(cursor, weeks=LEADERBOARD_WEEKS_KEPT):
+    first_week = week_key(date.today() - timedelta(weeks=weeks - 1))
+    cursor.execute("DELETE FROM leaderboard_scores WHERE board >= 'week:' AND board < ?", (f'week:{first_week}',))
+    removed = cursor.rowcount
+    if removed:
+        _bump_epoch(cursor)
+    return removed
+
+
+class _Ranking:
+    # One sorted list per board and per teacher within it; ranks are competition
+    # ranks (equal scores share a rank), found by bisecting on the score alone
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, score, student_id):
+        insort(self.keys, (-score, student_id))
+
+    def remove(self, score, student_id):
+        index = bisect_left(self.keys, (-score, student_id))
+        if index < len(self.keys) and self.keys[index] == (-score, student_id):
+            del self.keys[index]
+
+    def rank(self, score):
+        return bisect_left(self.keys, (-score,)) + 1
+
+    def page(self, limit, offset):
+        return [(self.rank(-key), student_id, -key) for key, student_id in self.keys[offset:offset + limit]]
+
+
+class _Board:
+
+    def __init__(self, version, epoch):
+        self.version = version
+        self.epoch = epoch
+        self.entries = {}
+        self.everyone = _Ranking()
+        self.teachers = {}
+        self.lock = threading.Lock()
+
+    def apply(self, student_id, teacher_id, score):
+        current = self.entries.pop(student_id, None)
+        if current is not None:
+            self.everyone.remove(current[1], student_id)
+            ranking = self.teachers.get(current[0])
+            if ranking is not None:
+                ranking.remove(current[1], student_id)
+        # Students who have no points (or lost them) are not ranked
+        if score > 0:
+            self.entries[student_id] = (teacher_id, score)
+            self.everyone.add(score, student_id)
+            self.teachers.setdefault(teacher_id, _Ranking()).add(score, student_id)
+
+    def ranking(self, teacher_id=None):
+        if teacher_id is None:
+            return self.everyone
+        return self.teachers.get(teacher_id) or _Ranking()
+
+
+class Leaderboards:
+
+    def __init__(self, max_boards=LEADERBOARD_MAX_BOARDS):
+        self.max_boards = max_boards
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'loads': 0, 'refreshes': 0, 'rows_applied': 0}
+
+    def _versions(self, cursor):
+        cursor.execute('SELECT scope, version FROM data_versions WHERE scope IN (?, ?)', (VERSION_SCOPE, EPOCH_SCOPE))
+        versions = dict(cursor.fetchall())
+        return versions.get(VERSION_SCOPE, 0), versions.get(EPOCH_SCOPE, 0)
+
+    def board(self, cursor, name):
+        # The versions are read before the rows, so a change committed in between is
+        # applied again on the next refresh rather than missed
+        version, epoch = self._versions(cursor)
+        with self._lock:
+            board = self._boards.get(name)
+            if board is not None and board.epoch != epoch:
+                board = None
+            if board is None:
+                board = _Board(-1, epoch)
+                self._boards[name] = board
+                while len(self._boards) > self.max_boards:
+                    self._boards.popitem(last=False)
+            else:
+                self._boards.move_to_end(name)
+
+        with board.lock:
+            if board.version < version:
+                if board.version < 0:
+                    cursor.execute('SELECT student_id, teacher_id, score FROM leaderboard_scores WHERE board = ?',
+                                   (name,))
+                    self._stats['loads'] += 1
+                else:
+                    cursor.execute('''SELECT student_id, teacher_id, score FROM leaderboard_scores
+                                      WHERE board = ? AND seq > ?''', (name, board.version))
+                    self._stats['refreshes'] += 1
+                rows = cursor.fetchall()
+                for student_id, teacher_id, score in rows:
+                    board.apply(student_id, teacher_id, score)
+                self._stats['rows_applied'] += len(rows)
+                board.version = version
+        return board
+
+    def stats(self):
+        with self._lock:
+            boards = {name: len(board.entries) for name, board in self._boards.items()}
+        return dict(self._stats, boards=boards)
+
+
+_leaderboards = Leaderboards()
+
+
+def get_leaderboards():
+    return _leaderboards
+
+
+def leaderboard(cursor, name, student_id, teacher_id=None, limit=LEADERBOARD_PAGE_SIZE, offset=0):
+    # Top entries of a board (optionally one teacher's class) and the asking student's position
+    limit = max(1, min(int(limit), LEADERBOARD_PAGE_MAX))
+    offset = max(0, int(offset))
+    board = _leaderboards.board(cursor, name)
+    with board.lock:
+        ranking = board.ranking(teacher_id)
+        top = ranking.page(limit, offset)
+        total = len(ranking.keys)
+        mine = board.entries.get(student_id)
+        me = None
+        if mine is not None and (teacher_id is None or mine[0] == teacher_id):
+            me = {'rank': ranking.rank(mine[1]), 'score': mine[1]}
+
+    names = {}
+    if top:
+        ids = [entry[1] for entry in top]
+        cursor.execute(f'SELECT id, username FROM users WHERE id IN ({",".join("?" * len(ids))})', ids)
+        names = dict(cursor.fetchall())
+    entries = [{'rank': rank, 'student_id': entry_id, 'username': names.get(entry_id), 'score': score}
+               for rank, entry_id, score in top]
+    next_offset = offset + limit if offset + limit < total else None
+    return {'board': name, 'entries': entries, 'me': me, 'total': total, 'next_offset': next_offset}
+
+
+if __name__ == '__main__':
+    import db
+
+    if sys.argv[1:] not in (['rebuild'], ['prune']):
+        print('usage: python rankings.py rebuild|prune')
+        sys.exit(1)
+
+    with db.get_pool().connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if sys.argv[1] == 'rebuild':
+                print(f'rebuilt {rebuild_leaderboards(conn.cursor())} leaderboard row(s)')
+            else:
+                print(f'pruned {prune_weeks(conn.cursor())} weekly leaderboard row(s)')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
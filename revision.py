@@ -0,0 +1,166 @@
+import sys
+from datetime import date, datetime
+
+import progress
+
+# Spaced-repetition revision of memorized Quran pages (SM-2). The schedule lives on the
+# quran_progress row itself: ease, interval_days, repetitions, lapses and next_review, the
+# day the page is next due. A page enters the schedule the day after it is memorized.
+# A student's queue is a range scan of idx_quran_progress_review (student_id, next_review),
+# and a review outcome is one UPDATE that applies the SM-2 step in SQL, so a batch of
+# outcomes is a single executemany with no read beforehand.
+
+REVIEW_QUEUE_SIZE = 20
+REVIEW_QUEUE_MAX = 200
+REVIEW_BATCH_LIMIT = 500
+# Nightly rebalancing: at most this many reviews due on one day, the overdue rest is
+# spread over the following days, oldest first
+REVIEW_DAILY_MAX = 40
+NIGHTLY_BATCH_STUDENTS = 500
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+REVIEW_SCHEMA_V1 = [
+    f'ALTER TABLE quran_progress ADD COLUMN ease REAL NOT NULL DEFAULT {DEFAULT_EASE}',
+    'ALTER TABLE quran_progress ADD COLUMN interval_days INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE quran_progress ADD COLUMN repetitions INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE quran_progress ADD COLUMN lapses INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE quran_progress ADD COLUMN next_review DATE',
+    'ALTER TABLE quran_progress ADD COLUMN last_review TIMESTAMP',
+    '''CREATE INDEX IF NOT EXISTS idx_quran_progress_review
+       ON quran_progress (student_id, next_review) WHERE next_review IS NOT NULL''',
+]
+
+# New interval in days; quality is 0-5 and 3 or more counts as recalled. Every SET
+# expression of an UPDATE sees the old row, so this is spelled out once and used twice.
+_NEXT_INTERVAL = '''CASE WHEN :quality < 3 THEN 1
+                         WHEN repetitions = 0 THEN 1
+                         WHEN repetitions = 1 THEN 6
+                         ELSE MAX(1, CAST(ROUND(interval_days * ease) AS INTEGER)) END'''
+
+REVIEW_UPDATE = f'''
+    UPDATE quran_progress SET
+        interval_days = {_NEXT_INTERVAL},
+        next_review = date(:ts, '+' || ({_NEXT_INTERVAL}) || ' days'),
+        repetitions = CASE WHEN :quality >= 3 THEN repetitions + 1 ELSE 0 END,
+        lapses = lapses + (:quality < 3),
+        ease = MAX({MIN_EASE}, ease + 0.1 - (5 - :quality) * (0.08 + (5 - :quality) * 0.02)),
+        last_review = :ts
+    WHERE student_id = :student_id AND page_number = :page_number AND memorized = 'true'
+'''
+
+
+def enroll_memorized(cursor, first_student=None, last_student=None):
+    # Memorized pages that have no schedule yet (written before it existed, or by a path
+    # that bypasses QURAN_UPSERT) become due the day after they were last read
+    where = ''
+    params = []
+    if first_student is not None:
+        where = 'AND student_id BETWEEN ? AND ?'
+        params = [first_student, last_student]
+    cursor.execute(f'''UPDATE quran_progress SET next_review = date(COALESCE(last_read, 'now'), '+1 day')
+                       WHERE memorized = 'true' AND next_review IS NULL {where}''', params)
+    return cursor.rowcount
+
+
+def due_reviews(cursor, student_id, on=None, limit=REVIEW_QUEUE_SIZE):
+    # Returns (pages due on or before the day, most overdue first; total due)
+    on = (on or date.today()).isoformat()
+    limit = max(1, min(int(limit), REVIEW_QUEUE_MAX))
+    cursor.execute('''SELECT page_number, next_review, interval_days, ease, repetitions, lapses,
+                             CAST(julianday(?) - julianday(next_review) AS INTEGER) AS overdue_days
+                      FROM quran_progress
+                      WHERE student_id = ? AND next_review <= ?
+                      ORDER BY next_review, page_number LIMIT ?''', (on, student_id, on, limit))
+    columns = ('page_number', 'next_review', 'interval_days', 'ease', 'repetitions', 'lapses', 'overdue_days')
+    pages = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    cursor.execute('SELECT COUNT(*) FROM quran_progress WHERE student_id = ? AND next_review <= ?',
+                   (student_id, on))
+    return pages, cursor.fetchone()[0]
+
+
+def parse_reviews(student_id, reviews, now=None):
+    # Client outcomes are {page_number, quality 0-5, ts in epoch milliseconds}.
+    # Returns (valid outcomes ready for executemany, number rejected).
+    now = now or datetime.now()
+    parsed = []
+    rejected = 0
+    for review in reviews[:REVIEW_BATCH_LIMIT]:
+        page_number = review.get('page_number') if isinstance(review, dict) else None
+        quality = review.get('quality') if isinstance(review, dict) else None
+        if (not progress.valid_quran_event(page_number, 'memorized')
+                or not isinstance(quality, int) or isinstance(quality, bool) or not 0 <= quality <= 5):
+            rejected += 1
+            continue
+
+        ts = now
+        try:
+            ts = min(datetime.fromtimestamp(float(review['ts']) / 1000), now)
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            pass
+        parsed.append({'student_id': student_id, 'page_number': page_number, 'quality': quality, 'ts': ts})
+
+    rejected += max(len(reviews) - REVIEW_BATCH_LIMIT, 0)
+    return parsed, rejected
+
+
+def record_reviews(cursor, reviews):
+    # Outcomes for pages that are not memorized match no row; returns how many applied
+    reviews = sorted(reviews, key=lambda review: review['ts'])
+    cursor.executemany(REVIEW_UPDATE, reviews)
+    return cursor.rowcount
+
+
+def rebalance(cursor, first_student, last_student, today=None, daily_max=REVIEW_DAILY_MAX):
+    # Past REVIEW_DAILY_MAX, due pages move to the following days in due order, so a student
+    # back after a break gets a steady queue instead of hundreds of pages at once
+    cursor.execute('''
+        UPDATE quran_progress SET next_review = date(:today, '+' || ((ranked.position - 1) / :daily_max) || ' days')
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY next_review, page_number) AS position
+            FROM quran_progress
+            WHERE student_id BETWEEN :first AND :last AND next_review <= :today
+        ) ranked
+        WHERE quran_progress.id = ranked.id AND ranked.position > :daily_max
+    ''', {'today': (today or date.today()).isoformat(), 'daily_max': daily_max,
+          'first': first_student, 'last': last_student})
+    return cursor.rowcount
+
+
+def nightly(conn, today=None, batch_students=NIGHTLY_BATCH_STUDENTS):
+    # One pass over every student in id ranges, each range in its own short write
+    # transaction, so request writers are never locked out for the whole run
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(student_id), MAX(student_id) FROM quran_progress WHERE memorized = 'true'")
+    first, last = cursor.fetchone()
+    totals = {'enrolled': 0, 'rescheduled': 0, 'batches': 0}
+    if first is None:
+        return totals
+
+    for start in range(first, last + 1, batch_students):
+        end = start + batch_students - 1
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            totals['enrolled'] += enroll_memorized(cursor, start, end)
+            totals['rescheduled'] += rebalance(cursor, start, end, today)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        totals['batches'] += 1
+    return totals
+
+
+if __name__ == '__main__':
+    import db
+
+    if sys.argv[1:] != ['nightly']:
+        print('usage: python revision.py nightly')
+        sys.exit(1)
+
+    with db.get_pool().connection() as conn:
+        totals = nightly(conn)
+        print(f'enrolled {totals["enrolled"]} page(s), rescheduled {totals["rescheduled"]} '
+              f'in {totals["batches"]} batch(es)')
@@ -0,0 +1,107 @@
+import csv
+import io
+
+# A teacher's class at a glance: every student linked through users.teacher_id with the
+# counters from student_stats. Whatever the class size, a page is two statements: one for
+# the students (idx_users_teacher, then primary-key lookups into student_stats and one
+# index seek for the latest student_activity_days row each) and one for the class totals.
+
+ROSTER_PAGE_SIZE = 50
+ROSTER_PAGE_MAX = 500
+EXPORT_BATCH = ROSTER_PAGE_MAX
+
+COLUMNS = ('id', 'username', 'student_code', 'lessons_completed', 'quiz_average', 'quran_pages_read',
+           'quran_pages_memorized', 'attendance_days', 'last_active')
+
+# Sort key -> SQL expression over the roster query below
+SORTS = {
+    'name': 'u.username',
+    'lessons_completed': 'lessons_completed',
+    'quiz_average': 'quiz_average',
+    'quran_pages_read': 'quran_pages_read',
+    'quran_pages_memorized': 'quran_pages_memorized',
+    'attendance_days': 'attendance_days',
+    'last_active': 'last_active',
+}
+
+ROSTER_SELECT = '''
+    SELECT u.id, u.username, u.student_code,
+           COALESCE(s.lessons_completed, 0) AS lessons_completed,
+           CASE WHEN s.quiz_score_count > 0
+                THEN ROUND(s.quiz_score_sum * 1.0 / s.quiz_score_count, 1) END AS quiz_average,
+           COALESCE(s.quran_pages_read, 0) AS quran_pages_read,
+           COALESCE(s.quran_pages_memorized, 0) AS quran_pages_memorized,
+           COALESCE(s.attendance_days, 0) AS attendance_days,
+           (SELECT MAX(day) FROM student_activity_days a WHERE a.student_id = u.id) AS last_active
+    FROM users u
+    LEFT JOIN student_stats s ON s.student_id = u.id
+    WHERE u.teacher_id = ? AND u.user_type = 'student'
+'''
+
+
+class InvalidSort(ValueError):
+    pass
+
+
+def _order_by(sort, descending):
+    if sort not in SORTS:
+        raise InvalidSort(sort)
+    # Students with no quiz or no activity yet sort last either way
+    return f'ORDER BY {SORTS[sort]} {"DESC" if descending else "ASC"} NULLS LAST, u.id'
+
+
+def students(cursor, teacher_id, sort='name', descending=False, limit=ROSTER_PAGE_SIZE, offset=0):
+    # Returns (students as dicts, next offset or None)
+    limit = max(1, min(int(limit), ROSTER_PAGE_MAX))
+    offset = max(0, int(offset))
+    cursor.execute(f'{ROSTER_SELECT} {_order_by(sort, descending)} LIMIT ? OFFSET ?',
+                   (teacher_id, limit + 1, offset))
+    rows = cursor.fetchall()
+    next_offset = offset + limit if len(rows) > limit else None
+    return [dict(zip(COLUMNS, row)) for row in rows[:limit]], next_offset
+
+
+def summary(cursor, teacher_id, active_days=7):
+    cursor.execute(f'''
+        SELECT COUNT(*),
+               SUM(lessons_completed),
+               ROUND(AVG(quiz_average), 1),
+               SUM(quran_pages_read),
+               SUM(quran_pages_memorized),
+               SUM(last_active >= date('now', ?))
+        FROM ({ROSTER_SELECT})
+    ''', (f'-{active_days} days', teacher_id))
+    count, lessons, quiz_average, pages_read, pages_memorized, active = cursor.fetchone()
+    return {
+        'students': count,
+        'lessons_completed': lessons or 0,
+        'quiz_average': quiz_average or 0,
+        'quran_pages_read': pages_read or 0,
+        'quran_pages_memorized': pages_memorized or 0,
+        f'active_last_{active_days}_days': active or 0,
+    }
+
+
+def export_csv(connection, teacher_id, sort='name', descending=False, batch_size=EXPORT_BATCH):
+    # Generator of CSV text; connection is a context manager factory (db.connection). The whole
+    # export is one statement read in batches, so it comes from a single read snapshot: stats
+    # updated meanwhile cannot move a student into a batch already sent, or out of the next one.
+    # The connection is held until the last batch is sent, or until a client that goes away
+    # closes the generator, which hands it back to the pool.
+    order_by = _order_by(sort, descending)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'{ROSTER_SELECT} {order_by}', (teacher_id,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            for row in rows:
+                writer.writerow(['' if value is None else value for value in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if len(rows) < batch_size:
+                break
@@ -0,0 +1,393 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, SessionInterface
+from itsdangerous import BadSignature
+
+import db
+
+# Server-side sessions. The cookie carries only a random token; the session itself is a row
+# of user_sessions, keyed by the token's SHA-256 so a copy of the database yields no cookies.
+#   * Each worker keeps the hot sessions in an LRU, so a request normally reads no row. Every
+#     save gives the row a new random tag, which the cookie carries next to the token: a
+#     cached copy whose tag differs from the cookie's was changed by another worker since,
+#     and is read again.
+#   * username and user_type are not trusted from the stored session: they come from a cached
+#     user loader, so a changed role or a deleted user takes effect on the next request.
+#   * Expiry slides: an active session is pushed forward at most once per SESSION_TOUCH_INTERVAL,
+#     and those extensions, like the purge of expired rows, are written by a background thread.
+# Visitors who are not logged in only carry flashes: their session stays in the cookie, signed
+# like Flask's default one and told apart by ANONYMOUS_PREFIX, so they never write a row.
+# Writes that other workers must see (role changes, deleted users, revoked sessions) bump the
+# 'users' and 'sessions' counters in data_versions; every worker compares them at most once
+# per SESSION_VERSION_CHECK_INTERVAL and drops its caches when they moved.
+
+SESSION_IDLE_TIMEOUT = float(os.environ.get('SESSION_IDLE_TIMEOUT', str(7 * 24 * 3600)))
+SESSION_TOUCH_INTERVAL = float(os.environ.get('SESSION_TOUCH_INTERVAL', '300'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+SESSION_VERSION_CHECK_INTERVAL = 1.0
+SESSION_FLUSH_INTERVAL = 5.0
+SESSION_PURGE_INTERVAL = 300.0
+PURGE_BATCH_SIZE = 1000
+
+# Keys filled in from the users table rather than from the stored session
+USER_KEYS = ('username', 'user_type')
+# Never the start of a token (token_urlsafe)
+ANONYMOUS_PREFIX = 'anon:'
+
+SESSION_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_sessions (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER,
+        data TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions (expires_at)',
+    'CREATE INDEX IF NOT EXISTS idx_user_sessions_user ON user_sessions (user_id)',
+    "INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('users', 0)",
+    "INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('sessions', 0)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_users_update_sessions
+    AFTER UPDATE OF username, user_type ON users
+    WHEN NEW.username IS NOT OLD.username OR NEW.user_type IS NOT OLD.user_type
+    BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE scope = 'users';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_users_delete_sessions
+    AFTER DELETE ON users
+    BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE scope IN ('users', 'sessions');
+        DELETE FROM user_sessions WHERE user_id = OLD.id;
+    END
+    ''',
+]
+
+
+def _key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def revoke_user_sessions(cursor, user_id):
+    # Logs the user out everywhere; part of the caller's transaction
+    cursor.execute('DELETE FROM user_sessions WHERE user_id = ?', (user_id,))
+    removed = cursor.rowcount
+    cursor.execute("UPDATE data_versions SET version = version + 1 WHERE scope = 'sessions'")
+    return removed
+
+
+def purge_expired(conn, now=None, batch_size=PURGE_BATCH_SIZE):
+    # Short transactions of batch_size rows so request writers are never held up for long
+    now = now or time.time()
+    removed = 0
+    while True:
+        cursor = conn.execute('''DELETE FROM user_sessions WHERE id IN (
+                                     SELECT id FROM user_sessions WHERE expires_at < ? LIMIT ?)''', (now, batch_size))
+        conn.commit()
+        removed += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return removed
+
+
+class ServerSession(SecureCookieSession):
+
+    def __init__(self, initial=None, token=None, user_id=None, expires_at=None, tag=None):
+        super().__init__(initial)
+        self.token = token
+        self.tag = tag
+        # The user the stored row belongs to; a different one after login means a new token
+        self.stored_user_id = user_id
+        self.expires_at = expires_at
+
+
+class SessionStore:
+
+    def __init__(self):
+        self._sessions = OrderedDict()
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._touches = {}
+        self._versions = None
+        self._last_check = 0.0
+        self._stats = {'session_hits': 0, 'session_misses': 0, 'user_hits': 0, 'user_misses': 0,
+                       'writes': 0, 'touches': 0, 'purged': 0, 'invalidations': 0}
+        self._thread = threading.Thread(target=self._run, name='session-store', daemon=True)
+        self._thread.start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _check_versions(self):
+        now = time.monotonic()
+        if now - self._last_check < SESSION_VERSION_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        with db.get_pool().connection() as conn:
+            versions = dict(conn.execute("SELECT scope, version FROM data_versions WHERE scope IN ('users', 'sessions')")
+                            .fetchall())
+        with self._lock:
+            if self._versions is not None:
+                if versions.get('users') != self._versions.get('users'):
+                    self._users.clear()
+                    self._stats['invalidations'] += 1
+                if versions.get('sessions') != self._versions.get('sessions'):
+                    self._sessions.clear()
+                    self._stats['invalidations'] += 1
+            self._versions = versions
+
+    # Sessions
+
+    def load(self, token, tag):
+        # Returns (data, user_id, expires_at, tag) or None for an unknown or expired token. The
+        # LRU holds the JSON text, so every request gets its own copy of mutable values (flashes)
+        self._check_versions()
+        key = _key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None and entry[3] == tag:
+                self._sessions.move_to_end(key)
+                self._stats['session_hits'] += 1
+            else:
+                entry = None
+        if entry is None:
+            self._count('session_misses')
+            with db.get_pool().connection() as conn:
+                row = conn.execute('SELECT data, user_id, expires_at, tag FROM user_sessions WHERE id = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            entry = tuple(row)
+            self._remember(key, entry)
+        if entry[2] < now:
+            self.forget(token)
+            return None
+        return json.loads(entry[0]), entry[1], entry[2], entry[3]
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._sessions[key] = entry
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > SESSION_CACHE_SIZE:
+                self._sessions.popitem(last=False)
+
+    def forget(self, token):
+        with self._lock:
+            self._sessions.pop(_key(token), None)
+
+    def save(self, token, data, user_id, previous_token=None):
+        # Written right away: a login or a flash must be visible to the next request,
+        # whichever worker serves it
+        # Returns (expires_at, new tag)
+        key = _key(token)
+        now = time.time()
+        expires_at = now + SESSION_IDLE_TIMEOUT
+        text = json.dumps(data, ensure_ascii=False, default=str)
+        tag = secrets.token_hex(4)
+        with db.get_pool().connection() as conn:
+            if previous_token:
+                conn.execute('DELETE FROM user_sessions WHERE id = ?', (_key(previous_token),))
+            conn.execute('''INSERT INTO user_sessions (id, user_id, data, tag, created_at, expires_at)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, data = excluded.data,
+                                                           tag = excluded.tag, expires_at = excluded.expires_at''',
+                         (key, user_id, text, tag, now, expires_at))
+            conn.commit()
+        if previous_token:
+            self.forget(previous_token)
+        self._remember(key, (text, user_id, expires_at, tag))
+        self._count('writes')
+        return expires_at, tag
+
+    def delete(self, token):
+        with db.get_pool().connection() as conn:
+            conn.execute('DELETE FROM user_sessions WHERE id = ?', (_key(token),))
+            conn.commit()
+        self.forget(token)
+
+    def touch(self, token):
+        # Slides the expiry in memory now and in the table on the next flush
+        key = _key(token)
+        expires_at = time.time() + SESSION_IDLE_TIMEOUT
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                self._sessions[key] = entry[:2] + (expires_at,) + entry[3:]
+            self._touches[key] = expires_at
+        return expires_at
+
+    # Users
+
+    def load_user(self, user_id):
+        # (username, user_type), or None once the user is gone
+        self._check_versions()
+        with self._lock:
+            if user_id in self._users:
+                self._users.move_to_end(user_id)
+                self._stats['user_hits'] += 1
+                return self._users[user_id]
+        self._count('user_misses')
+        with db.get_pool().connection() as conn:
+            user = conn.execute('SELECT username, user_type FROM users WHERE id = ?', (user_id,)).fetchone()
+        with self._lock:
+            self._users[user_id] = user
+            while len(self._users) > USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+        return user
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, cached_sessions=len(self._sessions), cached_users=len(self._users),
+                         pending_touches=len(self._touches))
+        return stats
+
+    # Background loop
+
+    def _run(self):
+        last_purge = 0.0
+        while True:
+            time.sleep(SESSION_FLUSH_INTERVAL)
+            try:
+                self._flush_touches()
+                now = time.monotonic()
+                if now - last_purge >= SESSION_PURGE_INTERVAL:
+                    last_purge = now
+                    with db.get_pool().connection() as conn:
+                        self._count('purged', purge_expired(conn))
+            except (sqlite3.Error, db.PoolTimeout):
+                # Touches stay pending and are retried on the next cycle
+                traceback.print_exc()
+
+    def _flush_touches(self):
+        with self._lock:
+            touches, self._touches = self._touches, {}
+        if not touches:
+            return
+        try:
+            with db.get_pool().connection() as conn:
+                conn.executemany('UPDATE user_sessions SET expires_at = MAX(expires_at, ?) WHERE id = ?',
+                                 [(expires_at, key) for key, expires_at in touches.items()])
+                conn.commit()
+        except (sqlite3.Error, db.PoolTimeout):
+            with self._lock:
+                for key, expires_at in touches.items():
+                    self._touches.setdefault(key, expires_at)
+            raise
+        self._count('touches', len(touches))
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # Started lazily so the background thread is created in the worker, not before fork
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        with _store_lock:
+            if _store is None or _store_pid != os.getpid():
+                _store = SessionStore()
+                _store_pid = os.getpid()
+    return _store
+
+
+class ServerSessionInterface(SessionInterface):
+
+    def __init__(self):
+        self._signed = SecureCookieSessionInterface()
+
+    def _open_anonymous(self, app, value):
+        try:
+            data = self._signed.get_signing_serializer(app).loads(
+                value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            data = None
+        return ServerSession(data)
+
+    def open_session(self, app, request):
+        # The cookie is '<token>.<tag>', or ANONYMOUS_PREFIX and the signed session
+        value = request.cookies.get(self.get_cookie_name(app)) or ''
+        if value.startswith(ANONYMOUS_PREFIX):
+            return self._open_anonymous(app, value[len(ANONYMOUS_PREFIX):])
+        token, _, tag = value.partition('.')
+        entry = get_store().load(token, tag) if token else None
+        if entry is None:
+            return ServerSession()
+
+        data, user_id, expires_at, tag = entry
+        session = ServerSession(data, token, user_id, expires_at, tag)
+        if user_id is not None:
+            user = get_store().load_user(user_id)
+            if user is None:
+                # Deleted user: the session is dropped on save
+                session.clear()
+                return session
+            # Roles come from the users table, not from what was stored at login
+            dict.update(session, zip(USER_KEYS, user))
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        store = get_store()
+
+        if not session:
+            if session.token:
+                store.delete(session.token)
+            if session.token or session.modified:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app))
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        user_id = session.get('user_id')
+        if user_id is None:
+            # Logged out or never logged in: a stored session (left by a logout that flashed)
+            # is dropped and what is left goes into the cookie
+            if session.token:
+                store.delete(session.token)
+            if session.modified or session.token:
+                value = self._signed.get_signing_serializer(app).dumps(dict(session))
+                response.set_cookie(name, ANONYMOUS_PREFIX + value, expires=self.get_expiration_time(app, session),
+                                    httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                    secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+            return
+
+        data = {key: value for key, value in session.items() if key not in USER_KEYS}
+        expires_at = None
+        token, tag = session.token, session.tag
+        if session.modified or not token:
+            previous = None
+            if token is None or user_id != session.stored_user_id:
+                # A new token whenever the user changes (login), against session fixation
+                previous, token = token, secrets.token_urlsafe(32)
+            expires_at, tag = store.save(token, data, user_id, previous)
+        elif time.time() + SESSION_IDLE_TIMEOUT - session.expires_at >= SESSION_TOUCH_INTERVAL:
+            expires_at = store.touch(token)
+
+        if expires_at is not None:
+            response.set_cookie(name, f'{token}.{tag}', expires=expires_at, httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+
+def init_app(app):
+    app.session_interface = ServerSessionInterface()
@@ -0,0 +1,70 @@
+import os
+import secrets
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Application config, loaded into app.config by main2.create_app(). Everything can be
+# overridden from the environment; only UPPERCASE names end up in app.config.
+
+# Every worker must sign with the same key (sessions themselves are server-side, see
+# session_store.py). Set SECRET_KEY, or let the first process create SECRET_KEY_FILE and
+# every later one read it.
+SECRET_KEY = os.environ.get('SECRET_KEY')
+SECRET_KEY_FILE = os.environ.get('SECRET_KEY_FILE', os.path.join('instance', 'secret_key'))
+
+SESSION_COOKIE_HTTPONLY = True
+SESSION_COOKIE_SAMESITE = 'Lax'
+SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', '0') == '1'
+
+# Create/migrate the schema and sample data on startup (once, under INIT_LOCK)
+INIT_DB = os.environ.get('INIT_DB', '1') == '1'
+# Compile every template in the preloaded master so forked workers share them
+PRELOAD_TEMPLATES = os.environ.get('PRELOAD_TEMPLATES', '1') == '1'
+# Rebuild the fingerprinted static assets at startup when a source changed (assets.py)
+BUILD_ASSETS = os.environ.get('BUILD_ASSETS', '1') == '1'
+# Behind a proxy that understands X-Sendfile, let it send asset files itself
+USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '0') == '1'
+
+
+def load_secret_key(path=SECRET_KEY_FILE):
+    if SECRET_KEY:
+        return SECRET_KEY
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Written aside and hard-linked into place, so a racing process sees either no file
+    # or the complete key; the loser of the race reads the winner's key
+    tmp = f'{path}.{os.getpid()}.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(secrets.token_hex(32))
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp)
+    with open(path) as f:
+        return f.read().strip()
+
+
+@contextmanager
+def init_lock(database):
+    # Cross-process lock next to the database file, held while the schema is initialized
+    if fcntl is None:
+        yield
+        return
+    with open(database + '.init-lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,963 @@
+
+// Theme management
+function toggleTheme() {
+    const currentTheme = document.documentElement.getAttribute('data-theme');
+    const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
+    
+    document.documentElement.setAttribute('data-theme', newTheme);
+    localStorage.setItem('theme', newTheme);
+    
+    // Update icon
+    const icon = document.querySelector('.fa-moon');
+    if (icon) {
+        icon.className = newTheme === 'dark' ? 'fas fa-sun' : 'fas fa-moon';
+    }
+}
+
+// Load saved theme
+document.addEventListener('DOMContentLoaded', function() {
+    const savedTheme = localStorage.getItem('theme') || 'light';
+    document.documentElement.setAttribute('data-theme', savedTheme);
+    
+    // Update icon
+    const icon = document.querySelector('.fa-moon');
+    if (icon) {
+        icon.className = savedTheme === 'dark' ? 'fas fa-sun' : 'fas fa-moon';
+    }
+});
+
+// Notification system
+function showNotification(message, type = 'info') {
+    const alertDiv = document.createElement('div');
+    alertDiv.className = `alert alert-${type} alert-dismissible fade show position-fixed`;
+    alertDiv.style.cssText = 'top: 20px; right: 20px; z-index: 9999; min-width: 300px;';
+    alertDiv.innerHTML = `
+        ${message}
+        <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+    `;
+    
+    document.body.appendChild(alertDiv);
+    
+    // Auto remove after 5 seconds
+    setTimeout(() => {
+        if (alertDiv.parentNode) {
+            alertDiv.remove();
+        }
+    }, 5000);
+}
+
+// Live session functionality
+// The teacher's pen movement is batched into binary frames (format in live_hub.py) and posted
+// every frameInterval ms; viewers get frames, board snapshots and the participant list over
+// Server-Sent Events, so a late joiner draws one compacted snapshot instead of every stroke
+class LiveSession {
+    constructor() {
+        this.isActive = false;
+        this.sessionId = null;
+        this.canDraw = false;
+        this.drawnLocally = false;
+        this.participants = [];
+        this.whiteboard = null;
+        this.drawing = false;
+        this.source = null;
+        
+        this.palette = ['#000000', '#ff0000', '#0000ff', '#00ff00', '#2563eb'];
+        this.penColor = 4;
+        this.penWidth = 2;
+        this.frameInterval = 40;
+        this.ops = [];
+        this.points = [];
+        this.carried = false;
+        this.frameTimer = null;
+        this.onEnded = null;
+        this.onPresence = null;
+    }
+    
+    startSession(title, description) {
+        return fetch('/api/live/sessions', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ title: title, description: description })
+        })
+        .then(response => response.ok ? response.json() : Promise.reject(response))
+        .then(data => {
+            this.join(data.session.id, true);
+            showNotification('تم بدء الجلسة المباشرة', 'success');
+            return data.session;
+        })
+        .catch(() => {
+            showNotification('تعذر بدء الجلسة المباشرة', 'danger');
+            return null;
+        });
+    }
+    
+    endSession() {
+        if (!this.sessionId) return Promise.resolve();
+        this.flushFrame();
+        const sessionId = this.sessionId;
+        this.leave();
+        return fetch(`/api/live/sessions/${sessionId}/end`, { method: 'POST' })
+        .then(() => showNotification('تم إنهاء الجلسة المباشرة', 'info'));
+    }
+    
+    updateSession(title, description) {
+        if (!this.sessionId) return Promise.resolve(false);
+        return fetch(`/api/live/sessions/${this.sessionId}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ title: title, description: description })
+        })
+        .then(response => response.ok);
+    }
+    
+    // Open the session stream; the first events are the board snapshot, the frames
+    // after it and the participant list. EventSource resumes with Last-Event-ID.
+    join(sessionId, canDraw = false) {
+        this.leave();
+        this.sessionId = sessionId;
+        this.canDraw = canDraw;
+        this.drawnLocally = false;
+        this.isActive = true;
+        this.initializeWhiteboard();
+        
+        this.source = new EventSource(`/api/live/sessions/${sessionId}/stream`);
+        this.source.addEventListener('snapshot', (e) => {
+            this.clearCanvas();
+            this.applyFrame(this.fromBase64(e.data));
+        });
+        this.source.addEventListener('frame', (e) => {
+            // The teacher's own strokes are already on the board
+            if (this.canDraw && this.drawnLocally) return;
+            this.applyFrame(this.fromBase64(e.data));
+        });
+        this.source.addEventListener('presence', (e) => {
+            this.renderParticipants(JSON.parse(e.data));
+        });
+        this.source.addEventListener('ended', () => this.handleEnded());
+    }
+    
+    leave() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+        clearTimeout(this.frameTimer);
+        this.frameTimer = null;
+        this.ops = [];
+        this.points = [];
+        this.drawing = false;
+        this.isActive = false;
+        this.sessionId = null;
+    }
+    
+    handleEnded() {
+        const wasDrawing = this.canDraw;
+        this.leave();
+        if (!wasDrawing) {
+            showNotification('انتهت الجلسة المباشرة', 'info');
+        }
+        if (this.onEnded) this.onEnded();
+    }
+    
+    initializeWhiteboard() {
+        const canvas = document.getElementById('whiteboard');
+        if (!canvas || this.whiteboard) return;
+        
+        const ctx = canvas.getContext('2d');
+        ctx.lineCap = 'round';
+        ctx.lineJoin = 'round';
+        this.whiteboard = { canvas, ctx };
+        
+        // The canvas is scaled by CSS; strokes are sent in canvas coordinates
+        const position = (e) => [
+            Math.max(0, Math.min(canvas.width, Math.round(e.offsetX * canvas.width / canvas.clientWidth))),
+            Math.max(0, Math.min(canvas.height, Math.round(e.offsetY * canvas.height / canvas.clientHeight)))
+        ];
+        
+        canvas.addEventListener('mousedown', (e) => {
+            if (!this.isActive || !this.canDraw) return;
+            this.drawing = true;
+            this.drawnLocally = true;
+            this.points = [position(e)];
+            this.carried = false;
+            this.drawStroke(this.penColor, this.penWidth, this.points);
+        });
+        
+        canvas.addEventListener('mousemove', (e) => {
+            if (!this.drawing) return;
+            
+            const last = this.points[this.points.length - 1];
+            const point = position(e);
+            if (point[0] === last[0] && point[1] === last[1]) return;
+            this.drawStroke(this.penColor, this.penWidth, [last, point]);
+            this.points.push(point);
+            this.scheduleFrame();
+        });
+        
+        const stop = () => {
+            if (!this.drawing) return;
+            this.drawing = false;
+            if (this.points.length > 1 || !this.carried) {
+                this.ops.push(this.encodeStroke(this.penColor, this.penWidth, this.points));
+            }
+            this.points = [];
+            this.scheduleFrame();
+        };
+        canvas.addEventListener('mouseup', stop);
+        canvas.addEventListener('mouseout', stop);
+    }
+    
+    setPenColor(color) {
+        const index = this.palette.indexOf(color);
+        if (index >= 0) this.penColor = index;
+    }
+    
+    clearWhiteboard() {
+        this.clearCanvas();
+        if (this.isActive && this.canDraw) {
+            this.drawnLocally = true;
+            this.ops.push([2]);
+            this.scheduleFrame();
+        }
+    }
+    
+    clearCanvas() {
+        if (this.whiteboard) {
+            this.whiteboard.ctx.clearRect(0, 0, this.whiteboard.canvas.width, this.whiteboard.canvas.height);
+        }
+    }
+    
+    scheduleFrame() {
+        if (this.frameTimer) return;
+        this.frameTimer = setTimeout(() => {
+            this.frameTimer = null;
+            this.flushFrame();
+        }, this.frameInterval);
+    }
+    
+    // Everything drawn since the last frame goes out as one POST; a stroke still being
+    // drawn is cut into a segment that the next frame continues from its last point
+    flushFrame() {
+        if (this.drawing && this.points.length > 1) {
+            this.ops.push(this.encodeStroke(this.penColor, this.penWidth, this.points));
+            this.points = [this.points[this.points.length - 1]];
+            this.carried = true;
+        }
+        if (this.ops.length === 0 || !this.sessionId) return;
+        
+        const frame = new Uint8Array(this.ops.reduce((size, op) => size + op.length, 0));
+        let offset = 0;
+        this.ops.forEach(op => {
+            frame.set(op, offset);
+            offset += op.length;
+        });
+        this.ops = [];
+        
+        fetch(`/api/live/sessions/${this.sessionId}/frames`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/octet-stream',
+            },
+            body: frame
+        })
+        .then(response => {
+            if (response.status === 404) this.handleEnded();
+        });
+    }
+    
+    // Frame codec, mirrors live_hub.py
+    pushVarint(out, value) {
+        while (value >= 0x80) {
+            out.push((value & 0x7f) | 0x80);
+            value = Math.floor(value / 128);
+        }
+        out.push(value);
+    }
+    
+    encodeStroke(color, width, points) {
+        const out = [1, color, width];
+        this.pushVarint(out, points.length);
+        points.forEach(([x, y], i) => {
+            if (i === 0) {
+                this.pushVarint(out, x);
+                this.pushVarint(out, y);
+            } else {
+                const dx = x - points[i - 1][0];
+                const dy = y - points[i - 1][1];
+                this.pushVarint(out, dx >= 0 ? dx * 2 : -dx * 2 - 1);
+                this.pushVarint(out, dy >= 0 ? dy * 2 : -dy * 2 - 1);
+            }
+        });
+        return out;
+    }
+    
+    fromBase64(text) {
+        const binary = atob(text);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return bytes;
+    }
+    
+    applyFrame(bytes) {
+        let pos = 0;
+        const varint = () => {
+            let value = 0;
+            let scale = 1;
+            while (pos < bytes.length) {
+                const byte = bytes[pos++];
+                value += (byte & 0x7f) * scale;
+                if (byte < 0x80) break;
+                scale *= 128;
+            }
+            return value;
+        };
+        const signed = () => {
+            const value = varint();
+            return value % 2 ? -(value + 1) / 2 : value / 2;
+        };
+        
+        while (pos < bytes.length) {
+            const op = bytes[pos++];
+            if (op === 2) {
+                this.clearCanvas();
+            } else if (op === 3) {
+                this.handleEnded();
+                return;
+            } else if (op === 1) {
+                const color = bytes[pos++];
+                const width = bytes[pos++];
+                const count = varint();
+                let x = varint();
+                let y = varint();
+                const points = [[x, y]];
+                for (let i = 1; i < count; i++) {
+                    x += signed();
+                    y += signed();
+                    points.push([x, y]);
+                }
+                this.drawStroke(color, width, points);
+            } else {
+                return;
+            }
+        }
+    }
+    
+    drawStroke(color, width, points) {
+        if (!this.whiteboard) return;
+        const ctx = this.whiteboard.ctx;
+        ctx.strokeStyle = this.palette[color] || this.palette[0];
+        ctx.fillStyle = ctx.strokeStyle;
+        ctx.lineWidth = width;
+        
+        if (points.length === 1) {
+            ctx.beginPath();
+            ctx.arc(points[0][0], points[0][1], width / 2, 0, 2 * Math.PI);
+            ctx.fill();
+            return;
+        }
+        ctx.beginPath();
+        ctx.moveTo(points[0][0], points[0][1]);
+        for (let i = 1; i < points.length; i++) {
+            ctx.lineTo(points[i][0], points[i][1]);
+        }
+        ctx.stroke();
+    }
+    
+    renderParticipants(presence) {
+        this.participants = presence.participants || [];
+        if (this.onPresence) this.onPresence(presence);
+    }
+}
+
+// Chat functionality
+class ChatSystem {
+    constructor() {
+        this.messages = [];
+        this.currentRoom = 'general';
+        this.currentUserId = null;
+        this.source = null;
+        this.oldestId = null;
+        this.hasMoreHistory = false;
+        this.loadingHistory = false;
+    }
+    
+    // Live messages and presence arrive over Server-Sent Events; EventSource
+    // reconnects by itself and resumes from the last message id it saw
+    connect(room, userId) {
+        this.currentRoom = room || this.currentRoom;
+        this.currentUserId = userId;
+        
+        this.loadHistory().then(() => {
+            // Start the stream right after the newest message we already have
+            const newest = this.messages.length > 0 ? this.messages[this.messages.length - 1].id : 0;
+            this.source = new EventSource(`/api/chat/${this.currentRoom}/stream?after=${newest}`);
+            
+            this.source.addEventListener('message', (e) => {
+                const message = JSON.parse(e.data);
+                if (this.messages.some(m => m.id === message.id)) return;
+                this.messages.push(message);
+                this.displayMessage(message);
+            });
+            
+            this.source.addEventListener('presence', (e) => {
+                const presence = JSON.parse(e.data);
+                const element = document.getElementById('onlineCount');
+                if (element) {
+                    element.textContent = presence.online;
+                }
+            });
+        });
+    }
+    
+    loadHistory() {
+        if (this.loadingHistory) return Promise.resolve();
+        this.loadingHistory = true;
+        
+        const params = this.oldestId ? `?before=${this.oldestId}` : '';
+        return fetch(`/api/chat/${this.currentRoom}/messages${params}`)
+        .then(response => response.json())
+        .then(data => {
+            const messages = data.messages || [];
+            const chatContainer = document.getElementById('chatMessages');
+            const previousHeight = chatContainer ? chatContainer.scrollHeight : 0;
+            const prepend = this.oldestId !== null;
+            
+            if (messages.length > 0) {
+                this.oldestId = messages[0].id;
+            }
+            this.hasMoreHistory = data.next_before !== null;
+            
+            messages.slice().reverse().forEach(message => {
+                this.messages.unshift(message);
+                this.displayMessage(message, true);
+            });
+            
+            if (chatContainer) {
+                chatContainer.scrollTop = prepend ? chatContainer.scrollHeight - previousHeight : chatContainer.scrollHeight;
+            }
+        })
+        .finally(() => {
+            this.loadingHistory = false;
+        });
+    }
+    
+    sendMessage(message) {
+        return fetch(`/api/chat/${this.currentRoom}/messages`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                message: message
+            })
+        })
+        .then(response => {
+            if (!response.ok) {
+                showNotification('تعذر إرسال الرسالة', 'danger');
+            }
+        });
+    }
+    
+    displayMessage(message, prepend = false) {
+        const chatContainer = document.getElementById('chatMessages');
+        if (!chatContainer) return;
+        
+        const isOwn = message.sender_id === this.currentUserId;
+        const isTeacher = ['developer', 'main_teacher', 'teacher'].includes(message.sender_type);
+        const sentAt = new Date(String(message.sent_at).replace(' ', 'T'));
+        
+        const messageDiv = document.createElement('div');
+        messageDiv.className = `message ${isOwn ? 'sent' : (isTeacher ? 'teacher' : 'received')}`;
+        messageDiv.innerHTML = `
+            <div class="message-header">
+                <strong></strong>
+                <small class="text-muted">${isNaN(sentAt) ? '' : sentAt.toLocaleTimeString('ar-SA')}</small>
+            </div>
+            <div class="message-text"></div>
+        `;
+        messageDiv.querySelector('strong').textContent = isOwn ? 'أنت' : (message.sender || '');
+        messageDiv.querySelector('.message-text').textContent = message.message;
+        
+        if (prepend) {
+            chatContainer.insertBefore(messageDiv, chatContainer.firstChild);
+        } else {
+            chatContainer.appendChild(messageDiv);
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+        }
+    }
+}
+
+// Quran functionality
+class QuranReader {
+    constructor() {
+        this.currentPage = 1;
+        this.totalPages = 604;
+        this.audio = null;
+        this.isPlaying = false;
+        
+        // Set by quran.html from the mushaf store; versioned URLs are cached for good
+        this.version = null;
+        this.blockSize = 4;
+        this.prefetchPages = 2;
+        this.pageBlocks = new Map();
+        
+        // Progress events are buffered and sent in one batch per reading session
+        this.progressBuffer = [];
+        this.flushTimer = null;
+        this.flushInterval = 60000;
+        this.flushThreshold = 50;
+        
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                this.flushProgress(true);
+            }
+        });
+        window.addEventListener('pagehide', () => this.flushProgress(true));
+    }
+    
+    loadPage(pageNumber) {
+        this.currentPage = pageNumber;
+        this.trackPageRead(pageNumber);
+        
+        this.fetchPage(pageNumber)
+            .then(page => {
+                if (this.currentPage === pageNumber) {
+                    this.renderPage(page);
+                }
+            })
+            .catch(() => this.renderPlaceholder(pageNumber));
+        
+        // Readers mostly turn forward: have the next block in hand before it is needed
+        const ahead = pageNumber + this.prefetchPages;
+        if (ahead <= this.totalPages) {
+            this.fetchPage(ahead).catch(() => {});
+        }
+    }
+    
+    fetchPage(pageNumber) {
+        // Pages are fetched in fixed blocks, so the URLs repeat and the browser cache serves them
+        const first = Math.floor((pageNumber - 1) / this.blockSize) * this.blockSize + 1;
+        const last = Math.min(first + this.blockSize - 1, this.totalPages);
+        
+        if (!this.pageBlocks.has(first)) {
+            const query = this.version ? `?v=${this.version}` : '';
+            const block = fetch(`/api/quran/pages/${first}-${last}${query}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(response.status);
+                    }
+                    return response.json();
+                })
+                .then(data => new Map(data.pages.map(page => [page.page, page])))
+                .catch(error => {
+                    this.pageBlocks.delete(first);
+                    throw error;
+                });
+            this.pageBlocks.set(first, block);
+        }
+        return this.pageBlocks.get(first).then(pages => pages.get(pageNumber));
+    }
+    
+    renderPage(page) {
+        const escape = text => String(text).replace(/[&<>"']/g, c => `&#${c.charCodeAt(0)};`);
+        let html = '';
+        page.verses.forEach(([sura, aya, text]) => {
+            if (aya === 1) {
+                html += `<h5 class="text-center my-3">سورة ${escape(page.suras[sura])}</h5>`;
+            }
+            html += `${escape(text)} <span class="text-success">﴿${aya.toLocaleString('ar-EG')}﴾</span> `;
+        });
+        
+        document.getElementById('quranText').innerHTML = `
+            <div class="quran-page">
+                <div class="arabic-text" style="font-size: 20px; line-height: 2.5;">${html}</div>
+            </div>
+        `;
+        
+        const firstSura = page.verses.length ? page.verses[0][0] : null;
+        const surahTitle = document.getElementById('currentSurah');
+        if (surahTitle && firstSura) {
+            surahTitle.textContent = page.suras[firstSura];
+        }
+    }
+    
+    renderPlaceholder(pageNumber) {
+        // The mushaf has not been built on this server
+        document.getElementById('quranText').innerHTML = `
+            <div class="quran-page">
+                <h4 class="text-center mb-4">صفحة ${pageNumber}</h4>
+                <p>بِسْمِ اللَّهِ الرَّحْمَٰنِ الرَّحِيمِ</p>
+                <p>هذه صفحة تجريبية من القرآن الكريم. في التطبيق الحقيقي، سيتم تحميل النص الفعلي للقرآن.</p>
+            </div>
+        `;
+    }
+    
+    trackPageRead(pageNumber) {
+        this.queueProgress(pageNumber, 'read');
+    }
+    
+    markAsMemorized(pageNumber) {
+        this.queueProgress(pageNumber, 'memorized');
+        // An explicit action is worth sending right away
+        this.flushProgress();
+        
+        showNotification(`تم تحديد صفحة ${pageNumber} كمحفوظة`, 'success');
+    }
+    
+    queueProgress(pageNumber, action) {
+        this.progressBuffer.push({
+            page_number: pageNumber,
+            action: action,
+            ts: Date.now()
+        });
+        
+        if (this.progressBuffer.length >= this.flushThreshold) {
+            this.flushProgress();
+        } else if (!this.flushTimer) {
+            this.flushTimer = setTimeout(() => this.flushProgress(), this.flushInterval);
+        }
+    }
+    
+    flushProgress(useBeacon = false) {
+        clearTimeout(this.flushTimer);
+        this.flushTimer = null;
+        
+        if (this.progressBuffer.length === 0) return;
+        
+        const events = this.progressBuffer.splice(0);
+        const body = JSON.stringify({ events: events });
+        
+        // The page may be unloading: sendBeacon survives it, fetch may not
+        if (useBeacon && navigator.sendBeacon &&
+            navigator.sendBeacon('/api/track_quran_progress/batch', new Blob([body], { type: 'application/json' }))) {
+            return;
+        }
+        
+        fetch('/api/track_quran_progress/batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: body,
+            keepalive: true
+        })
+        .then(response => {
+            if (!response.ok && response.status !== 400 && response.status !== 401) {
+                throw new Error(response.status);
+            }
+        })
+        .catch(() => {
+            // Keep the events for the next flush
+            this.progressBuffer = events.concat(this.progressBuffer);
+        });
+    }
+    
+    playAudio(surahNumber) {
+        if (this.audio) {
+            this.audio.pause();
+        }
+        
+        // In real implementation, use actual audio URLs
+        this.audio = new Audio(`/static/audio/mishary_${surahNumber}.mp3`);
+        this.audio.play().catch(() => {
+            showNotification('عذراً، لا يمكن تشغيل الصوت حالياً', 'warning');
+        });
+        
+        this.isPlaying = true;
+        this.updateAudioControls();
+    }
+    
+    pauseAudio() {
+        if (this.audio) {
+            this.audio.pause();
+            this.isPlaying = false;
+            this.updateAudioControls();
+        }
+    }
+    
+    updateAudioControls() {
+        const playBtn = document.getElementById('playBtn');
+        const pauseBtn = document.getElementById('pauseBtn');
+        
+        if (playBtn && pauseBtn) {
+            playBtn.style.display = this.isPlaying ? 'none' : 'inline-block';
+            pauseBtn.style.display = this.isPlaying ? 'inline-block' : 'none';
+        }
+    }
+}
+
+// Quiz functionality
+class QuizSystem {
+    constructor() {
+        this.attemptId = null;
+        this.currentQuestion = 0;
+        this.answers = [];
+        this.timeRemaining = 0;
+        this.timer = null;
+        this.finished = false;
+    }
+    
+    startQuiz(lessonId) {
+        return fetch('/api/quiz/start', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                lesson_id: lessonId
+            })
+        })
+        .then(response => response.ok ? response.json() : null)
+        .then(data => {
+            if (!data || !data.questions || data.questions.length === 0) {
+                return false;
+            }
+            
+            this.attemptId = data.attempt_id;
+            this.questions = data.questions;
+            this.currentQuestion = 0;
+            this.answers = [];
+            this.finished = false;
+            this.timeRemaining = this.questions.length * 120; // 2 minutes per question
+            
+            this.displayQuestion();
+            this.startTimer();
+            return true;
+        });
+    }
+    
+    displayQuestion() {
+        const question = this.questions[this.currentQuestion];
+        const quizContainer = document.getElementById('quizContainer');
+        
+        if (!quizContainer || !question) return;
+        
+        quizContainer.innerHTML = `
+            <div class="card">
+                <div class="card-header">
+                    <h5>السؤال ${this.currentQuestion + 1} من ${this.questions.length}</h5>
+                    <div class="progress">
+                        <div class="progress-bar" style="width: ${((this.currentQuestion + 1) / this.questions.length) * 100}%"></div>
+                    </div>
+                </div>
+                <div class="card-body">
+                    <h6>${question.question}</h6>
+                    <div class="mt-3">
+                        <div class="form-check mb-2">
+                            <input class="form-check-input" type="radio" name="answer" value="a" id="option_a">
+                            <label class="form-check-label" for="option_a">${question.option_a}</label>
+                        </div>
+                        <div class="form-check mb-2">
+                            <input class="form-check-input" type="radio" name="answer" value="b" id="option_b">
+                            <label class="form-check-label" for="option_b">${question.option_b}</label>
+                        </div>
+                        <div class="form-check mb-2">
+                            <input class="form-check-input" type="radio" name="answer" value="c" id="option_c">
+                            <label class="form-check-label" for="option_c">${question.option_c}</label>
+                        </div>
+                        <div class="form-check mb-2">
+                            <input class="form-check-input" type="radio" name="answer" value="d" id="option_d">
+                            <label class="form-check-label" for="option_d">${question.option_d}</label>
+                        </div>
+                    </div>
+                    <div class="mt-3">
+                        <button class="btn btn-primary" onclick="quiz.nextQuestion()">
+                            ${this.currentQuestion === this.questions.length - 1 ? 'إنهاء الاختبار' : 'السؤال التالي'}
+                        </button>
+                    </div>
+                    <div class="mt-2">
+                        <small class="text-muted">الوقت المتبقي: <span id="timeRemaining">${this.formatTime(this.timeRemaining)}</span></small>
+                    </div>
+                </div>
+            </div>
+        `;
+    }
+    
+    nextQuestion() {
+        const selectedAnswer = document.querySelector('input[name="answer"]:checked');
+        
+        if (!selectedAnswer) {
+            showNotification('يرجى اختيار إجابة', 'warning');
+            return;
+        }
+        
+        // Grading happens on the server when the quiz is submitted
+        this.answers.push({
+            question_id: this.questions[this.currentQuestion].id,
+            answer: selectedAnswer.value
+        });
+        
+        this.currentQuestion++;
+        
+        if (this.currentQuestion >= this.questions.length) {
+            this.finishQuiz();
+        } else {
+            this.displayQuestion();
+        }
+    }
+    
+    finishQuiz() {
+        if (this.finished) return;
+        this.finished = true;
+        clearInterval(this.timer);
+        
+        this.submitAnswers().then(result => this.displayResult(result));
+    }
+    
+    submitAnswers() {
+        return fetch(`/api/quiz/${this.attemptId}/submit`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                answers: this.answers
+            })
+        })
+        .then(response => response.json());
+    }
+    
+    displayResult(result) {
+        const quizContainer = document.getElementById('quizContainer');
+        
+        if (!result || !result.success) {
+            quizContainer.innerHTML = '<div class="alert alert-danger text-center">تعذر حفظ نتيجة الاختبار</div>';
+            return;
+        }
+        
+        const percentage = result.score;
+        
+        quizContainer.innerHTML = `
+            <div class="card text-center">
+                <div class="card-body">
+                    <h3 class="text-success">انتهى الاختبار!</h3>
+                    <h4>نتيجتك: ${result.correct} من ${result.total}</h4>
+                    <h5 class="text-primary">${percentage}%</h5>
+                    <div class="mt-3">
+                        ${percentage >= 80 ? 
+                            '<div class="alert alert-success">ممتاز! لقد نجحت بامتياز</div>' :
+                            percentage >= 60 ?
+                            '<div class="alert alert-warning">جيد! يمكنك تحسين نتيجتك</div>' :
+                            '<div class="alert alert-danger">يرجى مراجعة الدرس والمحاولة مرة أخرى</div>'
+                        }
+                    </div>
+                    <button class="btn btn-primary" onclick="window.location.reload()">
+                        إعادة الاختبار
+                    </button>
+                </div>
+            </div>
+        `;
+    }
+    
+    startTimer() {
+        clearInterval(this.timer);
+        this.timer = setInterval(() => {
+            this.timeRemaining--;
+            const timeElement = document.getElementById('timeRemaining');
+            
+            if (timeElement) {
+                timeElement.textContent = this.formatTime(this.timeRemaining);
+            }
+            
+            if (this.timeRemaining <= 0) {
+                this.finishQuiz();
+            }
+        }, 1000);
+    }
+    
+    formatTime(seconds) {
+        const minutes = Math.floor(seconds / 60);
+        const remainingSeconds = seconds % 60;
+        return `${minutes}:${remainingSeconds.toString().padStart(2, '0')}`;
+    }
+}
+
+// Initialize global objects
+let liveSession = new LiveSession();
+let chatSystem = new ChatSystem();
+let quranReader = new QuranReader();
+let quiz = new QuizSystem();
+
+// Utility functions
+function connectToTeacher(studentCode) {
+    fetch('/api/connect_to_teacher', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            student_code: studentCode
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showNotification('تم ربطك بالأستاذ بنجاح', 'success');
+        } else {
+            showNotification('خطأ في الربط: ' + data.message, 'danger');
+        }
+    });
+}
+
+function loadDashboardStats() {
+    fetch('/api/dashboard_stats')
+    .then(response => response.json())
+    .then(data => {
+        // Update dashboard with real data
+        updateDashboardCards(data);
+    });
+}
+
+function updateDashboardCards(stats) {
+    // Update various dashboard elements with real statistics
+    const elements = {
+        'lessons-completed': stats.lessons_completed || 0,
+        'quran-pages-read': stats.quran_pages_read || 0,
+        'quiz-average': stats.quiz_average || 0,
+        'attendance-days': stats.attendance_days || 0
+    };
+    
+    Object.entries(elements).forEach(([id, value]) => {
+        const element = document.getElementById(id);
+        if (element) {
+            element.textContent = value;
+        }
+    });
+}
+
+// Initialize app when DOM is loaded
+document.addEventListener('DOMContentLoaded', function() {
+    // Initialize any page-specific functionality
+    const currentPage = window.location.pathname;
+    
+    if (currentPage.includes('/dashboard')) {
+        loadDashboardStats();
+    }
+    
+    // Add smooth scrolling to all anchor links
+    document.querySelectorAll('a[href^="#"]').forEach(anchor => {
+        anchor.addEventListener('click', function (e) {
+            e.preventDefault();
+            const target = document.querySelector(this.getAttribute('href'));
+            if (target) {
+                target.scrollIntoView({
+                    behavior: 'smooth'
+                });
+            }
+        });
+    });
+    
+    // Add fade-in animation to cards
+    const cards = document.querySelectorAll('.card');
+    cards.forEach((card, index) => {
+        setTimeout(() => {
+            card.classList.add('fade-in-up');
+        }, index * 100);
+    });
+});
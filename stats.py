@@ -0,0 +1,195 @@
+import sys
+from datetime import datetime
+
+# Per-student counters behind /api/dashboard_stats. They are kept current by the
+# triggers in STUDENT_STATS_SCHEMA_V1 below (applied by migration 7), so every write path
+# (single upserts, batches, dedup merges) updates them in the same transaction as the raw row.
+# Trigger bodies guard inserts with NOT EXISTS rather than OR IGNORE because the
+# conflict clause of an outer statement (e.g. the progress upsert) overrides it.
+
+STUDENT_STATS_SCHEMA_V1 = [
+    '''
+    CREATE TABLE IF NOT EXISTS student_stats (
+        student_id INTEGER PRIMARY KEY,
+        lessons_completed INTEGER NOT NULL DEFAULT 0,
+        quiz_score_sum INTEGER NOT NULL DEFAULT 0,
+        quiz_score_count INTEGER NOT NULL DEFAULT 0,
+        quran_pages_read INTEGER NOT NULL DEFAULT 0,
+        quran_pages_memorized INTEGER NOT NULL DEFAULT 0,
+        attendance_days INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (student_id) REFERENCES users (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS student_activity_days (
+        student_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        PRIMARY KEY (student_id, day)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_student_progress_insert_stats
+    AFTER INSERT ON student_progress WHEN NEW.student_id IS NOT NULL
+    BEGIN
+        INSERT INTO student_stats (student_id) SELECT NEW.student_id
+        WHERE NOT EXISTS (SELECT 1 FROM student_stats WHERE student_id = NEW.student_id);
+        UPDATE student_stats SET
+            lessons_completed = lessons_completed + 1,
+            quiz_score_sum = quiz_score_sum + COALESCE(NEW.quiz_score, 0),
+            quiz_score_count = quiz_score_count + (NEW.quiz_score IS NOT NULL)
+        WHERE student_id = NEW.student_id;
+        INSERT INTO student_activity_days (student_id, day)
+        SELECT NEW.student_id, date(COALESCE(NEW.completed_at, 'now'))
+        WHERE NOT EXISTS (SELECT 1 FROM student_activity_days
+                          WHERE student_id = NEW.student_id AND day = date(COALESCE(NEW.completed_at, 'now')));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_student_progress_delete_stats
+    AFTER DELETE ON student_progress WHEN OLD.student_id IS NOT NULL
+    BEGIN
+        UPDATE student_stats SET
+            lessons_completed = lessons_completed - 1,
+            quiz_score_sum = quiz_score_sum - COALESCE(OLD.quiz_score, 0),
+            quiz_score_count = quiz_score_count - (OLD.quiz_score IS NOT NULL)
+        WHERE student_id = OLD.student_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_student_progress_score_stats
+    AFTER UPDATE OF quiz_score ON student_progress
+    WHEN NEW.student_id IS NOT NULL AND NEW.quiz_score IS NOT OLD.quiz_score
+    BEGIN
+        UPDATE student_stats SET
+            quiz_score_sum = quiz_score_sum - COALESCE(OLD.quiz_score, 0) + COALESCE(NEW.quiz_score, 0),
+            quiz_score_count = quiz_score_count - (OLD.quiz_score IS NOT NULL) + (NEW.quiz_score IS NOT NULL)
+        WHERE student_id = NEW.student_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_quran_progress_insert_stats
+    AFTER INSERT ON quran_progress WHEN NEW.student_id IS NOT NULL
+    BEGIN
+        INSERT INTO student_stats (student_id) SELECT NEW.student_id
+        WHERE NOT EXISTS (SELECT 1 FROM student_stats WHERE student_id = NEW.student_id);
+        UPDATE student_stats SET
+            quran_pages_read = quran_pages_read + (NEW.read_count > 0),
+            quran_pages_memorized = quran_pages_memorized + (NEW.memorized = 'true')
+        WHERE student_id = NEW.student_id;
+        INSERT INTO student_activity_days (student_id, day)
+        SELECT NEW.student_id, date(COALESCE(NEW.last_read, 'now'))
+        WHERE NOT EXISTS (SELECT 1 FROM student_activity_days
+                          WHERE student_id = NEW.student_id AND day = date(COALESCE(NEW.last_read, 'now')));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_quran_progress_update_stats
+    AFTER UPDATE OF read_count, memorized, last_read ON quran_progress WHEN NEW.student_id IS NOT NULL
+    BEGIN
+        UPDATE student_stats SET
+            quran_pages_read = quran_pages_read - (OLD.read_count > 0) + (NEW.read_count > 0),
+            quran_pages_memorized = quran_pages_memorized - (OLD.memorized = 'true') + (NEW.memorized = 'true')
+        WHERE student_id = NEW.student_id;
+        INSERT INTO student_activity_days (student_id, day)
+        SELECT NEW.student_id, date(NEW.last_read)
+        WHERE NEW.last_read IS NOT OLD.last_read
+          AND NOT EXISTS (SELECT 1 FROM student_activity_days
+                          WHERE student_id = NEW.student_id AND day = date(NEW.last_read));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_quran_progress_delete_stats
+    AFTER DELETE ON quran_progress WHEN OLD.student_id IS NOT NULL
+    BEGIN
+        UPDATE student_stats SET
+            quran_pages_read = quran_pages_read - (OLD.read_count > 0),
+            quran_pages_memorized = quran_pages_memorized - (OLD.memorized = 'true')
+        WHERE student_id = OLD.student_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_activity_days_insert_stats
+    AFTER INSERT ON student_activity_days
+    BEGIN
+        INSERT INTO student_stats (student_id) SELECT NEW.student_id
+        WHERE NOT EXISTS (SELECT 1 FROM student_stats WHERE student_id = NEW.student_id);
+        UPDATE student_stats SET attendance_days = attendance_days + 1
+        WHERE student_id = NEW.student_id;
+    END
+    ''',
+]
+
+
+def record_attendance(cursor, student_id, day=None):
+    # Idempotent per day; the trigger bumps attendance_days only for a new day
+    cursor.execute('INSERT OR IGNORE INTO student_activity_days (student_id, day) VALUES (?, ?)',
+                   (student_id, (day or datetime.now().date()).isoformat()))
+
+
+def get_student_stats(cursor, student_id):
+    cursor.execute('''SELECT lessons_completed, quran_pages_read, quran_pages_memorized,
+                             quiz_score_sum, quiz_score_count, attendance_days
+                      FROM student_stats WHERE student_id = ?''', (student_id,))
+    row = cursor.fetchone() or (0, 0, 0, 0, 0, 0)
+    lessons_completed, pages_read, pages_memorized, score_sum, score_count, attendance_days = row
+
+    return {
+        'lessons_completed': lessons_completed,
+        'quran_pages_read': pages_read,
+        'quran_pages_memorized': pages_memorized,
+        'quiz_average': round(score_sum / score_count, 1) if score_count else 0,
+        'attendance_days': attendance_days,
+    }
+
+
+def rebuild_student_stats(cursor):
+    # Recompute every counter from the raw tables. Activity days are first
+    # backfilled from the raw timestamps so existing history counts as attendance.
+    cursor.execute('''INSERT OR IGNORE INTO student_activity_days (student_id, day)
+                      SELECT student_id, date(completed_at) FROM student_progress
+                      WHERE student_id IS NOT NULL AND completed_at IS NOT NULL''')
+    cursor.execute('''INSERT OR IGNORE INTO student_activity_days (student_id, day)
+                      SELECT student_id, date(last_read) FROM quran_progress
+                      WHERE student_id IS NOT NULL AND last_read IS NOT NULL''')
+
+    cursor.execute('DELETE FROM student_stats')
+    cursor.execute('''
+        INSERT INTO student_stats (student_id, lessons_completed, quiz_score_sum, quiz_score_count,
+                                   quran_pages_read, quran_pages_memorized, attendance_days)
+        SELECT ids.student_id,
+               COALESCE(sp.lessons_completed, 0), COALESCE(sp.quiz_score_sum, 0), COALESCE(sp.quiz_score_count, 0),
+               COALESCE(qp.pages_read, 0), COALESCE(qp.pages_memorized, 0),
+               COALESCE(ad.days, 0)
+        FROM (
+            SELECT student_id FROM student_progress WHERE student_id IS NOT NULL
+            UNION SELECT student_id FROM quran_progress WHERE student_id IS NOT NULL
+            UNION SELECT student_id FROM student_activity_days
+        ) ids
+        LEFT JOIN (
+            SELECT student_id, COUNT(*) AS lessons_completed,
+                   COALESCE(SUM(quiz_score), 0) AS quiz_score_sum, COUNT(quiz_score) AS quiz_score_count
+            FROM student_progress GROUP BY student_id
+        ) sp ON sp.student_id = ids.student_id
+        LEFT JOIN (
+            SELECT student_id, SUM(read_count > 0) AS pages_read, SUM(memorized = 'true') AS pages_memorized
+            FROM quran_progress GROUP BY student_id
+        ) qp ON qp.student_id = ids.student_id
+        LEFT JOIN (
+            SELECT student_id, COUNT(*) AS days FROM student_activity_days GROUP BY student_id
+        ) ad ON ad.student_id = ids.student_id
+    ''')
+    return cursor.rowcount
+
+
+if __name__ == '__main__':
+    import db
+
+    if sys.argv[1:] != ['rebuild']:
+        print('usage: python stats.py rebuild')
+        sys.exit(1)
+
+    with db.get_pool().connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = rebuild_student_stats(conn.cursor())
+        conn.commit()
+        print(f'rebuilt stats for {rows} student(s)')
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Set before any app module is imported: they read their settings at import time
+os.environ.setdefault('ISLAMIC_APP_DB', os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ['JOB_WORKERS'] = '0'
+os.environ['AUTH_WORKERS'] = '0'
+os.environ['AUTH_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.environ['BUILD_ASSETS'] = '0'
+os.environ['PRELOAD_TEMPLATES'] = '0'
+os.environ.setdefault('SECRET_KEY', 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+@pytest.fixture(scope='session')
+def app():
+    import main2
+    return main2.create_app({'TESTING': True})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    # make_user('teacher') -> id; students can be put in a teacher's class
+    def make(user_type='student', teacher_id=None):
+        with db.connection() as conn:
+            cursor = conn.execute('''INSERT INTO users (username, password_hash, user_type, student_code, teacher_id)
+                                     VALUES ('u' || hex(randomblob(6)), 'x', ?, hex(randomblob(4)), ?)''',
+                                  (user_type, teacher_id))
+            conn.commit()
+            return cursor.lastrowid
+    return make
+
+
+@pytest.fixture
+def login(client):
+    # Signs the test client in as user_id; username and role come from the users table
+    def sign_in(user_id):
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        return client
+    return sign_in
@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+import activity
+import db
+
+
+def test_backfill_splits_lessons_from_quizzes_on_local_days(make_user):
+    student = make_user()
+    completed = datetime(2025, 3, 10, 22, 30, tzinfo=timezone.utc)
+    local_day = completed.astimezone().date().isoformat()
+    with db.connection() as conn:
+        # As the app wrote them before the log: completed_at left to the UTC default
+        conn.executemany('INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at) VALUES (?, ?, ?, ?)',
+                         [(student, 1, 100, completed.strftime('%Y-%m-%d %H:%M:%S')),
+                          (student, 1, 70, completed.strftime('%Y-%m-%d %H:%M:%S')),
+                          (student, 2, 90, completed.strftime('%Y-%m-%d %H:%M:%S'))])
+        conn.execute('''INSERT INTO quran_progress (student_id, page_number, memorized, read_count, last_read)
+                        VALUES (?, 5, 'false', 2, '2025-03-09 08:00:00.250000')''', (student,))
+        activity.backfill_rollups(conn.cursor())
+        daily = conn.execute('SELECT day, kind, events, value_sum FROM activity_daily WHERE user_id = ? ORDER BY day, kind',
+                             (student,)).fetchall()
+        weekly = conn.execute('SELECT kind, SUM(events) FROM activity_weekly WHERE user_id = ? GROUP BY kind',
+                              (student,)).fetchall()
+        conn.rollback()
+
+    assert daily == sorted([('2025-03-09', activity.KINDS['page_read'], 1, 0),
+                            (local_day, activity.KINDS['quiz'], 2, 160),
+                            (local_day, activity.KINDS['lesson'], 1, 0)])
+    assert dict(weekly) == {activity.KINDS['page_read']: 1, activity.KINDS['quiz']: 2, activity.KINDS['lesson']: 1}
+
+
+def test_events_roll_up_by_local_day(make_user):
+    student = make_user()
+    ts = datetime(2025, 5, 4, 23, 45)
+    with db.connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        activity.log_events(conn.cursor(), [activity.event(student, 'quiz', 1, 80, ts),
+                                            activity.event(student, 'login', ts=ts)])
+        conn.commit()
+        activity.compact(conn)
+        assert activity.daily_activity(conn.cursor(), student, '2025-01-01') == {
+            '2025-05-04': {'quiz': [1, 80], 'login': [1, 0]}}
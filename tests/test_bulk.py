@@ -0,0 +1,31 @@
+import json
+
+import db
+
+
+def _lessons(count, title):
+    return '\n'.join(json.dumps({'title': f'{title} {n}', 'topic': 'فقه'}, ensure_ascii=False)
+                     for n in range(count)).encode()
+
+
+def test_import_streams_progress_and_a_summary(make_user, login):
+    client = login(make_user('teacher'))
+    response = client.post('/api/admin/import/lessons?format=jsonl', data=_lessons(3, 'استيراد'),
+                           content_type='application/x-ndjson')
+    updates = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert updates[-1]['done'] and updates[-1]['imported'] == 3 and updates[-1]['rejected'] == 0
+
+
+def test_aborted_import_gives_its_connection_back(monkeypatch, make_user, login):
+    client = login(make_user('teacher'))
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(size=1, timeout=0.5))
+
+    response = client.post('/api/admin/import/lessons?format=jsonl', data=_lessons(3, 'مقطوع'),
+                           content_type='application/x-ndjson', buffered=False)
+    assert json.loads(next(response.response))['imported'] == 3
+    response.close()
+
+    assert db.get_pool().stats()['in_use'] == 0
+    with db.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM lessons WHERE title LIKE 'مقطوع %'").fetchone() == (3,)
@@ -0,0 +1,32 @@
+import threading
+
+import chat_hub
+
+
+def test_streams_past_the_budget_are_told_to_come_back(monkeypatch, make_user, login):
+    client = login(make_user())
+    monkeypatch.setattr(chat_hub, '_stream_slots', threading.BoundedSemaphore(1))
+
+    first = client.get('/api/chat/general/stream', buffered=False)
+    assert next(first.response).startswith(b'retry: 3000')
+
+    busy = client.get('/api/chat/general/stream')
+    assert busy.status_code == 200
+    assert busy.get_data() == f'retry: {chat_hub.SSE_RETRY_AFTER * 1000}\n\n'.encode()
+
+    # Closing the open stream gives its slot back
+    first.close()
+    again = client.get('/api/chat/general/stream', buffered=False)
+    assert next(again.response).startswith(b'retry: 3000')
+    again.close()
+
+
+def test_unstarted_stream_gives_its_slot_back(monkeypatch, make_user, login):
+    client = login(make_user())
+    monkeypatch.setattr(chat_hub, '_stream_slots', threading.BoundedSemaphore(1))
+
+    for _ in range(3):
+        response = client.get('/api/chat/general/stream', buffered=False)
+        assert response.status_code == 200
+        response.close()
+    assert chat_hub._stream_slots.acquire(blocking=False)
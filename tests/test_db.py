@@ -0,0 +1,41 @@
+import pytest
+from flask import Response
+
+import db
+
+
+def test_connection_comes_back_when_a_streamed_response_is_closed_early():
+    pool = db.ConnectionPool(size=1, timeout=0.2)
+
+    def rows():
+        with pool.connection() as conn:
+            conn.execute('BEGIN')
+            for n in range(3):
+                yield f'{conn.execute("SELECT ?", (n,)).fetchone()[0]}\n'
+
+    # The client goes away after the first chunk: the server closes the response iterable
+    response = Response(rows())
+    assert next(iter(response.response)) == '0\n'
+    response.close()
+
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    pool.release(conn)
+    assert pool.stats()['in_use'] == 0
+
+
+def test_connection_comes_back_after_an_error():
+    pool = db.ConnectionPool(size=1, timeout=0.2)
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError('boom')
+    with pool.connection() as conn:
+        assert conn.execute('SELECT 1').fetchone() == (1,)
+
+
+def test_exhausted_pool_times_out():
+    pool = db.ConnectionPool(size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(db.PoolTimeout):
+            pool.acquire()
+    assert pool.stats()['timeouts'] == 1
@@ -0,0 +1,43 @@
+import cache
+import db
+import httpcache
+
+
+def test_dashboard_stats_revalidate_until_the_student_writes(make_user, login):
+    student = make_user()
+    client = login(student)
+
+    first = client.get('/api/dashboard_stats')
+    etag = first.headers['ETag']
+    assert first.json['lessons_completed'] == 0
+
+    again = client.get('/api/dashboard_stats', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+    with db.connection() as conn:
+        conn.execute('INSERT INTO student_progress (student_id, lesson_id, quiz_score) VALUES (?, 1, 90)', (student,))
+        conn.commit()
+
+    changed = client.get('/api/dashboard_stats', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.json['lessons_completed'] == 1
+
+
+def test_etag_is_per_student(make_user, login):
+    first = login(make_user()).get('/api/dashboard_stats').headers['ETag']
+    second = login(make_user()).get('/api/dashboard_stats', headers={'If-None-Match': first})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first
+
+
+def test_responses_are_kept_out_of_the_content_cache(make_user, login):
+    login(make_user()).get('/api/lessons')
+    hits = httpcache.get_response_cache().stats()['hits']
+
+    # Shared between users: the second one is served the first one's response
+    response = login(make_user()).get('/api/lessons')
+    assert response.status_code == 200
+    assert httpcache.get_response_cache().stats()['hits'] == hits + 1
+    assert not any(key.startswith('http:') for key in cache.get_cache()._entries)
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+import db
+import jobs
+
+
+def _applied(cursor, payloads):
+    # Test write handler: one row per application, a poisoned payload fails the batch
+    for payload in payloads:
+        if payload.get('poison'):
+            raise ValueError('poisoned job')
+    cursor.executemany('INSERT INTO applied (job) VALUES (:n)', payloads)
+
+
+@pytest.fixture(autouse=True, scope='module')
+def applied_handler(app):
+    with db.get_pool().connection() as conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS applied (job INTEGER)')
+        conn.commit()
+    jobs.WRITE_HANDLERS['test_applied'] = _applied
+    yield
+    jobs.WRITE_HANDLERS.pop('test_applied', None)
+
+
+def test_failed_batch_is_not_applied_twice_when_another_worker_polls():
+    with db.get_pool().connection() as conn:
+        for n in range(20):
+            jobs.enqueue(conn.cursor(), 'test_applied', {'n': n, 'poison': n == 7})
+        conn.commit()
+
+    first, second = jobs.JobWorker(threads=0), jobs.JobWorker(threads=0)
+    second.name = 'other-host:1'
+    run_singly = first._run_writes_singly
+
+    def second_worker_polls_first(conn, handler, job_ids):
+        # The batch has been rolled back and is queued again: the other worker gets there first
+        second.run_once()
+        run_singly(conn, handler, job_ids)
+
+    first._run_writes_singly = second_worker_polls_first
+    assert first.run_once()
+
+    with db.get_pool().connection() as conn:
+        applied = [row[0] for row in conn.execute('SELECT job FROM applied ORDER BY job')]
+        statuses = dict(conn.execute("SELECT status, COUNT(*) FROM jobs WHERE kind = 'test_applied' GROUP BY status"))
+        poisoned = conn.execute('''SELECT status, attempts FROM jobs
+                                   WHERE kind = 'test_applied' AND payload LIKE '%"poison": true%' ''').fetchone()
+
+    assert applied == [n for n in range(20) if n != 7]
+    assert statuses == {'done': 19, 'queued': 1}
+    # Tried once, by the worker that got to it first, and now backing off
+    assert poisoned == ('queued', 1)
+
+
+def test_running_task_keeps_its_lease(monkeypatch):
+    monkeypatch.setattr(jobs, 'LEASE_SECONDS', 0.3)
+    monkeypatch.setattr(jobs, 'LEASE_HEARTBEAT', 0.05)
+    worker, other = jobs.JobWorker(threads=0), jobs.JobWorker(threads=0)
+    requeued = []
+
+    def slow_task(conn, payload):
+        # Outlives the lease several times; the other worker's maintenance runs meanwhile
+        for _ in range(5):
+            time.sleep(0.2)
+            with db.get_pool().connection() as maintenance:
+                other._maintain(maintenance)
+                requeued.append(maintenance.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()[0])
+        return {'ok': True}
+
+    monkeypatch.setitem(jobs.TASK_HANDLERS, 'test_slow', slow_task)
+    with db.get_pool().connection() as conn:
+        job_id = jobs.enqueue(conn.cursor(), 'test_slow', {})
+        conn.commit()
+        assert worker._run_task(conn, 'test_slow')
+        assert requeued == ['running'] * 5
+        assert conn.execute('SELECT status, attempts FROM jobs WHERE id = ?', (job_id,)).fetchone() == ('done', 1)
+
+
+def test_maintenance_keeps_one_nightly_revision_scheduled(monkeypatch):
+    worker, other = jobs.JobWorker(threads=0), jobs.JobWorker(threads=0)
+    with db.get_pool().connection() as conn:
+        conn.execute("DELETE FROM jobs WHERE kind = 'revision_nightly'")
+        conn.commit()
+        worker._maintain(conn)
+        other._maintain(conn)
+        nightly = conn.execute('''SELECT id, run_after FROM jobs
+                                  WHERE kind = 'revision_nightly' AND status = 'queued' ''').fetchall()
+        assert len(nightly) == 1
+        run_after = jobs.datetime.fromtimestamp(nightly[0][1])
+        assert (run_after.hour, run_after.minute) == (jobs.REVISION_NIGHTLY_HOUR, 0)
+        assert 0 < nightly[0][1] - time.time() <= 24 * 3600
+
+        # Once tonight's run is done the next maintenance schedules tomorrow's
+        tonight = nightly[0][1]
+        monkeypatch.setattr(jobs.time, 'time', lambda: tonight + 60)
+        conn.execute("UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?", (tonight + 30, nightly[0][0]))
+        conn.commit()
+        worker._maintain(conn)
+        tomorrow = conn.execute('''SELECT run_after FROM jobs
+                                   WHERE kind = 'revision_nightly' AND status = 'queued' ''').fetchone()[0]
+        assert 23 * 3600 <= tomorrow - tonight <= 25 * 3600
@@ -0,0 +1,35 @@
+import pytest
+
+import live_hub
+
+
+@pytest.fixture
+def live_session(make_user, login):
+    # (teacher id, session id) of a session in progress
+    teacher = make_user('teacher')
+    response = login(teacher).post('/api/live/sessions', json={'title': 'درس مباشر'})
+    return teacher, response.json['session']['id']
+
+
+def test_oversized_frames_are_refused_before_they_are_read(live_session, login):
+    teacher, session_id = live_session
+    client = login(teacher)
+    frame = live_hub.encode_ops([(live_hub.OP_STROKE, 0, 2, [(10, 10), (12, 14)])])
+
+    assert client.post(f'/api/live/sessions/{session_id}/frames', data=frame).status_code == 202
+    oversized = client.post(f'/api/live/sessions/{session_id}/frames', data=b'\x02' * (live_hub.MAX_FRAME_BYTES + 1))
+    assert oversized.status_code == 413
+
+
+def test_only_the_class_can_watch(live_session, make_user, login):
+    teacher, session_id = live_session
+    url = f'/api/live/sessions/{session_id}/stream'
+
+    for outsider in (make_user(teacher_id=make_user('teacher')), make_user('teacher')):
+        assert login(outsider).get(url).status_code == 404
+
+    for viewer in (teacher, make_user(teacher_id=teacher)):
+        response = login(viewer).get(url, buffered=False)
+        assert response.status_code == 200
+        assert next(response.response).startswith(b'retry:')
+        response.close()
@@ -0,0 +1,117 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+import migrations
+
+# sha1 of what each released step adds to (and drops from) sqlite_master. A step that now
+# creates something else was edited after release: put the change in a new step instead.
+RELEASED = {
+    1: 'b67885939ced',
+    2: '2e72e19127a4',
+    3: '5a691cdc0ae7',
+    4: '9b08029b2025',
+    5: '396aa9da1f99',
+    6: '003708cbe14a',
+    7: '8aeaafa8d681',
+    8: '8777155e58ba',
+    9: '92c631e0f475',
+    10: '31f361ebc813',
+    11: 'ff8c811f623b',
+    12: '32ac8384c888',
+    13: '35b99a070511',
+    14: 'a7c74b32df70',
+    15: 'c669919fd0de',
+    16: 'b47942374bd0',
+    17: 'a17f548ac6da',
+    18: 'a5dafc503ef4',
+    19: 'ac17f25747fe',
+}
+
+# Tables the triggers keep current and the backfill of their step computes from the raw rows
+DERIVED = {
+    'student_stats': 'SELECT * FROM student_stats ORDER BY student_id',
+    'student_activity_days': 'SELECT * FROM student_activity_days ORDER BY student_id, day',
+    'leaderboard_scores': 'SELECT board, student_id, teacher_id, score FROM leaderboard_scores ORDER BY board, student_id',
+    'search_index': 'SELECT rowid, kind, lesson_id, title, body FROM search_index ORDER BY rowid',
+}
+
+
+@pytest.fixture
+def database(app, monkeypatch, tmp_path):
+    # database('name') -> pool over a new database holding the tables init_db() creates
+    # before any migration
+    import main2
+    pools = []
+
+    def create(name):
+        pools.append(db.ConnectionPool(database=str(tmp_path / f'{name}.db'), size=1))
+        monkeypatch.setattr(db, '_pool', pools[-1])
+        with monkeypatch.context() as m:
+            m.setattr(migrations, 'MIGRATIONS', [])
+            main2.init_db()
+        return pools[-1]
+    yield create
+    for pool in pools:
+        pool.close_all()
+
+
+def _objects(conn):
+    return set(conn.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite!_%' ESCAPE '!'"))
+
+
+def _seed(conn):
+    # Plain inserts, valid on the schema of every version
+    ts = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany('''INSERT INTO users (id, username, password_hash, user_type, student_code, teacher_id)
+                        VALUES (?, ?, 'x', ?, ?, ?)''',
+                     [(1, 'teacher', 'teacher', None, None), (2, 'a', 'student', 'A', 1), (3, 'b', 'student', 'B', 1)])
+    conn.executemany('INSERT INTO lessons (id, title, description, content, topic) VALUES (?, ?, ?, ?, ?)',
+                     [(1, 'الصَّلاة', 'أركان', 'نص', 'فقه'), (2, 'السيرة', '', 'نص', '')])
+    conn.execute('''INSERT INTO quiz_questions (lesson_id, question, option_a, option_b, option_c, option_d, correct_answer)
+                    VALUES (1, 'كم عدد الصلوات؟', '5', '3', '2', '4', 'a')''')
+    conn.executemany('INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at) VALUES (?, ?, ?, ?)',
+                     [(2, 1, 80, ts), (2, 2, 100, ts), (3, 1, 40, ts)])
+    conn.executemany('''INSERT INTO quran_progress (student_id, page_number, memorized, read_count, last_read)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     [(2, 1, 'true', 2, ts), (3, 5, 'false', 1, ts)])
+    conn.commit()
+
+
+def _snapshot(conn):
+    return _objects(conn), {table: conn.execute(sql).fetchall() for table, sql in DERIVED.items()}
+
+
+def test_released_steps_are_unchanged(database):
+    with database('steps').connection() as conn:
+        created = {}
+        for version, _, _ in migrations.MIGRATIONS:
+            before = _objects(conn)
+            migrations.migrate(conn, target=version)
+            after = _objects(conn)
+            change = repr((sorted(after - before), sorted(before - after)))
+            created[version] = hashlib.sha1(change.encode()).hexdigest()[:12]
+
+    for version, digest in RELEASED.items():
+        assert created[version] == digest, f'migration {version} was edited after release'
+
+
+@pytest.mark.parametrize('upgraded_from', range(migrations.MIGRATIONS[-1][0]))
+def test_upgraded_database_matches_a_fresh_one(database, upgraded_from):
+    with database('fresh').connection() as conn:
+        migrations.migrate(conn)
+        _seed(conn)
+        fresh = _snapshot(conn)
+
+    # The data was written by a release at upgraded_from, the rest of the steps run over it
+    with database('upgraded').connection() as conn:
+        migrations.migrate(conn, target=upgraded_from)
+        _seed(conn)
+        migrations.migrate(conn)
+        upgraded = _snapshot(conn)
+
+    assert upgraded[0] == fresh[0]
+    for table in DERIVED:
+        assert upgraded[1][table] == fresh[1][table], table
@@ -0,0 +1,21 @@
+import sqlite3
+
+import progress
+
+
+def test_duplicate_pages_are_folded_into_the_oldest_row():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''CREATE TABLE quran_progress (id INTEGER PRIMARY KEY, student_id INTEGER, page_number INTEGER,
+                                                 memorized TEXT, read_count INTEGER, last_read TEXT)''')
+    conn.executemany('INSERT INTO quran_progress VALUES (?, ?, ?, ?, ?, ?)', [
+        (1, 7, 3, 'false', 2, '2026-01-01 10:00:00'),
+        (2, 7, 3, 'true', 1, '2026-01-03 10:00:00'),
+        (3, 7, 3, 'false', None, '2026-01-02 10:00:00'),
+        (4, 7, 4, 'false', 1, '2026-01-01 10:00:00'),
+    ])
+
+    assert progress.merge_duplicate_quran_progress(conn.cursor()) == (1, 2)
+    assert conn.execute('SELECT * FROM quran_progress ORDER BY id').fetchall() == [
+        (1, 7, 3, 'true', 3, '2026-01-03 10:00:00'),
+        (4, 7, 4, 'false', 1, '2026-01-01 10:00:00'),
+    ]
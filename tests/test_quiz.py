@@ -0,0 +1,50 @@
+import db
+
+
+def _start(client, count=5):
+    response = client.post('/api/quiz/start', json={'lesson_id': 1, 'count': count})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_questions_are_sent_without_answers_and_graded_on_the_server(make_user, login):
+    student = make_user()
+    client = login(student)
+    attempt = _start(client)
+    assert len(attempt['questions']) == 5
+    assert all('correct_answer' not in question for question in attempt['questions'])
+
+    # The sample questions are all answered 'a'; get three of five right
+    ids = [question['id'] for question in attempt['questions']]
+    answers = {str(question_id): 'a' if n < 3 else 'b' for n, question_id in enumerate(ids)}
+    result = client.post(f'/api/quiz/{attempt["attempt_id"]}/submit', json={'answers': answers}).get_json()
+    assert (result['correct'], result['total'], result['score']) == (3, 5, 60)
+    assert [item['correct'] for item in result['results']] == [True, True, True, False, False]
+
+    with db.connection() as conn:
+        assert conn.execute('SELECT lesson_id, quiz_score FROM student_progress WHERE student_id = ?',
+                            (student,)).fetchall() == [(1, 60)]
+
+
+def test_an_attempt_is_graded_once(make_user, login):
+    client = login(make_user())
+    attempt = _start(client, count=1)
+    url = f'/api/quiz/{attempt["attempt_id"]}/submit'
+    assert client.post(url, json={'answers': {}}).status_code == 200
+    assert client.post(url, json={'answers': {}}).status_code == 400
+
+
+def test_another_students_attempt_cannot_be_submitted(make_user, login, app):
+    attempt = _start(login(make_user()), count=1)
+    other = app.test_client()
+    with other.session_transaction() as session:
+        session['user_id'] = make_user()
+    assert other.post(f'/api/quiz/{attempt["attempt_id"]}/submit', json={'answers': {}}).status_code == 400
+
+
+def test_client_supplied_scores_are_not_accepted(make_user, login):
+    student = make_user()
+    client = login(student)
+    assert client.post('/api/save_quiz_results', json={'lesson_id': 1, 'score': 100000}).status_code == 404
+    with db.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM student_progress WHERE student_id = ?', (student,)).fetchone() == (0,)
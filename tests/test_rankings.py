@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import db
+import jobs
+import progress
+import rankings
+
+
+def _ago(days):
+    return datetime.now() - timedelta(days=days)
+
+
+def _boards(conn, student):
+    return dict(conn.execute('SELECT board, score FROM leaderboard_scores WHERE student_id = ? AND score != 0',
+                             (student,)).fetchall())
+
+
+def test_quiz_points_are_clamped(make_user, login):
+    student = make_user()
+    with db.connection() as conn:
+        conn.execute('INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at) VALUES (?, 1, ?, ?)',
+                     (student, 100000, datetime.now()))
+        conn.execute('INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at) VALUES (?, 2, ?, ?)',
+                     (student, -50, datetime.now()))
+        conn.commit()
+        assert _boards(conn, student)['all'] == 100
+
+    board = login(student).get('/api/leaderboard?board=all').get_json()
+    assert board['me']['score'] == 100
+
+
+def test_triggers_keep_the_boards_a_rebuild_would_compute(make_user):
+    student = make_user(teacher_id=make_user('teacher'))
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        for lesson_id, score, days in ((1, 80, 0), (2, 60, 9), (3, 100, 16), (4, 40, 200)):
+            cursor.execute('INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at) VALUES (?, ?, ?, ?)',
+                           (student, lesson_id, score, _ago(days)))
+        cursor.execute('UPDATE student_progress SET quiz_score = 90 WHERE student_id = ? AND lesson_id = 2', (student,))
+        cursor.execute('DELETE FROM student_progress WHERE student_id = ? AND lesson_id = 1', (student,))
+
+        # Memorized three weeks ago, read again this week: its points move to this week
+        progress.track_quran_page(cursor, student, 10, 'memorized', _ago(21))
+        progress.track_quran_page(cursor, student, 10, 'read', _ago(0))
+        progress.track_quran_page(cursor, student, 11, 'read', _ago(10))
+        progress.track_quran_page(cursor, student, 11, 'read', _ago(10))
+        progress.track_quran_page(cursor, student, 12, 'read', _ago(3))
+        cursor.execute('DELETE FROM quran_progress WHERE student_id = ? AND page_number = 12', (student,))
+        rankings.prune_weeks(cursor)
+        conn.commit()
+
+        maintained = _boards(conn, student)
+        assert maintained['all'] == 90 + 100 + 40 + 25 + 5
+        assert maintained[f'week:{rankings.week_key()}'] == 25
+        assert f'week:{rankings.week_key(_ago(200).date())}' not in maintained
+
+        rankings.rebuild_leaderboards(cursor)
+        conn.commit()
+        assert _boards(conn, student) == maintained
+
+
+def test_maintenance_prunes_old_weekly_boards(make_user):
+    student = make_user()
+    old_week = f'week:{rankings.week_key(_ago(7 * (rankings.LEADERBOARD_WEEKS_KEPT + 2)).date())}'
+    with db.connection() as conn:
+        conn.execute('INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at) VALUES (?, 1, 70, ?)',
+                     (student, _ago(7 * (rankings.LEADERBOARD_WEEKS_KEPT + 2))))
+        conn.commit()
+        assert _boards(conn, student)[old_week] == 70
+
+        jobs.JobWorker(threads=0)._maintain(conn)
+        assert old_week not in _boards(conn, student)
+        assert _boards(conn, student)['all'] == 70
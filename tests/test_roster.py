@@ -0,0 +1,33 @@
+import csv
+import io
+
+import db
+import roster
+
+
+def test_csv_export_lists_the_class(make_user, login):
+    teacher = make_user('teacher')
+    students = sorted(make_user(teacher_id=teacher) for _ in range(3))
+    make_user(teacher_id=make_user('teacher'))
+
+    response = login(teacher).get('/api/teacher/overview?format=csv&sort=name')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == list(roster.COLUMNS)
+    assert sorted(int(row[0]) for row in rows[1:]) == students
+
+
+def test_aborted_csv_export_gives_its_connection_back(monkeypatch, make_user, login):
+    teacher = make_user('teacher')
+    for _ in range(3):
+        make_user(teacher_id=teacher)
+    client = login(teacher)
+    # One connection: a download that kept it would time out every later request
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(size=1, timeout=0.5))
+
+    for _ in range(3):
+        response = client.get('/api/teacher/overview?format=csv', buffered=False)
+        assert next(response.response)
+        response.close()
+
+    assert client.get('/api/teacher/overview').status_code == 200
+    assert db.get_pool().stats()['in_use'] == 0
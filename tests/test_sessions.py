@@ -0,0 +1,45 @@
+import flask
+
+import db
+import session_store
+
+
+def _rows():
+    with db.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM user_sessions').fetchone()[0]
+
+
+def _cookie(response, name):
+    for header in response.headers.getlist('Set-Cookie'):
+        if header.startswith(name + '='):
+            return header.split(';', 1)[0].split('=', 1)[1]
+    return None
+
+
+def test_anonymous_flashes_stay_in_the_cookie(app):
+    name = app.config['SESSION_COOKIE_NAME']
+    rows = _rows()
+    with app.test_request_context('/'):
+        flask.flash('تم')
+        response = app.response_class()
+        app.session_interface.save_session(app, flask.session, response)
+    value = _cookie(response, name)
+    assert value.startswith(session_store.ANONYMOUS_PREFIX)
+
+    with app.test_request_context('/', headers={'Cookie': f'{name}={value}'}):
+        assert flask.get_flashed_messages() == ['تم']
+    with app.test_request_context('/', headers={'Cookie': f'{name}={value[:-2]}xx'}):
+        assert flask.get_flashed_messages() == []
+    assert _rows() == rows
+
+
+def test_logging_out_drops_the_stored_session(app, make_user, login):
+    name = app.config['SESSION_COOKIE_NAME']
+    client = login(make_user())
+    rows = _rows()
+    assert client.get('/api/dashboard_stats').status_code == 200
+
+    response = client.get('/logout')
+    assert _cookie(response, name) == ''
+    assert _rows() == rows - 1
+    assert client.get('/api/dashboard_stats').status_code == 401
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import db
+import progress
+import stats
+
+
+def _counters(cursor, student_id):
+    cursor.execute('SELECT * FROM student_stats WHERE student_id = ?', (student_id,))
+    return cursor.fetchone()
+
+
+def test_triggers_keep_the_counters_current(make_user, login):
+    student = make_user()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''INSERT INTO student_progress (student_id, lesson_id, quiz_score, completed_at)
+                          VALUES (?, 1, 80, '2026-03-01 10:00:00'), (?, 2, NULL, '2026-03-02 10:00:00')''',
+                       (student, student))
+        progress.track_quran_page(cursor, student, 1, 'read', datetime(2026, 3, 2, 9))
+        progress.track_quran_page(cursor, student, 1, 'memorized', datetime(2026, 3, 3, 9))
+        progress.track_quran_page(cursor, student, 2, 'read', datetime(2026, 3, 4, 9))
+        cursor.execute('UPDATE student_progress SET quiz_score = 100 WHERE student_id = ? AND lesson_id = 2', (student,))
+        cursor.execute('DELETE FROM quran_progress WHERE student_id = ? AND page_number = 2', (student,))
+        stats.record_attendance(cursor, student, datetime(2026, 3, 1).date())
+        conn.commit()
+
+        assert stats.get_student_stats(cursor, student) == {
+            'lessons_completed': 2,
+            'quran_pages_read': 1,
+            'quran_pages_memorized': 1,
+            'quiz_average': 90.0,
+            'attendance_days': 3,
+        }
+
+        # Same counters as recomputing them from the raw rows
+        maintained = _counters(cursor, student)
+        conn.execute('BEGIN IMMEDIATE')
+        stats.rebuild_student_stats(cursor)
+        assert _counters(cursor, student) == maintained
+        conn.rollback()
+
+    assert login(student).get('/api/dashboard_stats').json['quiz_average'] == 90.0
+
+
+def test_a_new_attendance_day_counts_once(make_user):
+    student = make_user()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        for _ in range(2):
+            stats.record_attendance(cursor, student, datetime(2026, 3, 5).date())
+        stats.record_attendance(cursor, student, datetime(2026, 3, 6).date())
+        conn.commit()
+        assert stats.get_student_stats(cursor, student)['attendance_days'] == 2
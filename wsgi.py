@@ -0,0 +1,4 @@
+from main2 import create_app
+
+# WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app
+app = create_app()